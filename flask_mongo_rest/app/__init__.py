@@ -1,16 +1,33 @@
 
+import atexit
+import click
+import time
+from datetime import datetime, timedelta, timezone
 from flask import Flask
 from .config import get_config
-from .extensions import get_db, init_indexes, close_db, jwt
+from .extensions import get_db, close_db, close_client, jwt
+from .indexes import ensure_indexes_on_boot, load_declarations, reconcile_with_lock
+from .api.measurements.timeseries import migrate_to_timeseries, DEFAULT_TARGET
+from .api.measurements.rollups import rebuild_rollups
+from .api.meter.state import rebuild_meter_state
+from .api.meter import daily_status
+from .api.predictions.detector import run_detection, window_bounds
+from .api.predictions.repo import sync_meter_scope
+from .api.alerts.worker import run_worker as run_alerts_worker
+from .api.measurements.repo import measurements_collection
 from .api import api_v1
 from .errors import register_error_handlers
+from .instrumentation import init_instrumentation
+from .logging_setup import setup_logging, init_request_logging, stop_logging, get_logger
 from flask_cors import CORS
 
+logger = get_logger(__name__)
+
 def create_app(env: str = "dev") -> Flask:
-    print("Environment:", env)
-    print("Starting app...")
     app = Flask(__name__)
     app.config.from_object(get_config(env))
+    setup_logging(app.config)
+    logger.info("Starting app (env=%s)", env)
 
     CORS(app)
     
@@ -18,22 +35,101 @@ def create_app(env: str = "dev") -> Flask:
     app.register_blueprint(api_v1)
     jwt.init_app(app)
     register_error_handlers(app)
+    init_request_logging(app)
+    init_instrumentation(app)
+    register_cli(app)
 
     with app.app_context():
         list_routes(app)
         db = get_db()
-        init_indexes(db)
+        load_declarations()
+        ensure_indexes_on_boot(app, db)
     
 
     app.teardown_appcontext(close_db)
+    atexit.register(close_client)
+    atexit.register(stop_logging)
     return app
 
+def register_cli(app: Flask):
+    @app.cli.command("reconcile-indexes")
+    @click.option("--force", is_flag=True, help="Bỏ qua marker version, kiểm tra lại toàn bộ index.")
+    def reconcile_indexes_cmd(force):
+        """Tạo/sửa index theo registry rồi ghi marker version."""
+        load_declarations()
+        click.echo(reconcile_with_lock(get_db(), force=force))
+
+    @app.cli.command("migrate-measurements-ts")
+    @click.option("--target", default=DEFAULT_TARGET, show_default=True)
+    @click.option("--batch-size", default=5000, show_default=True)
+    @click.option("--max-batches", default=None, type=int, help="Dừng sau N batch (chạy lại để tiếp tục).")
+    def migrate_measurements_ts_cmd(target, batch_size, max_batches):
+        """Copy meter_measurements sang time-series collection (resume được)."""
+        click.echo(migrate_to_timeseries(
+            get_db(), target=target, batch_size=batch_size,
+            granularity=app.config.get("MEAS_TS_GRANULARITY", "minutes"),
+            max_batches=max_batches,
+        ))
+
+    @app.cli.command("rollup-measurements")
+    @click.option("--days", default=1, show_default=True, help="Tính lại N ngày gần nhất (giờ VN).")
+    def rollup_measurements_cmd(days):
+        """Catch-up: tính lại rollup giờ/ngày từ dữ liệu thô."""
+        end = datetime.now(timezone.utc)
+        click.echo(rebuild_rollups(end - timedelta(days=days), end + timedelta(days=1), get_db()))
+
+    @app.cli.command("rebuild-meter-state")
+    def rebuild_meter_state_cmd():
+        """Backfill / sửa lệch meter_state từ measurements, predictions, repairs, thresholds."""
+        click.echo(rebuild_meter_state(get_db()))
+
+    @app.cli.command("backfill-daily-status")
+    @click.option("--days", default=30, show_default=True, help="Số ngày gần nhất (giờ VN) cần dựng lại.")
+    def backfill_daily_status_cmd(days):
+        """Dựng lại meter_daily_status từ meters + predictions."""
+        click.echo(daily_status.backfill(days, get_db()))
+
+    @app.cli.command("backfill-prediction-scope")
+    @click.option("--batch-size", default=500, show_default=True, help="Số meter mỗi bulk_write.")
+    def backfill_prediction_scope_cmd(batch_size):
+        """Ghi branch_id / company_id của meter lên predictions cũ (chạy lại được)."""
+        click.echo(sync_meter_scope(None, get_db(), batch_size=batch_size))
+
+    @app.cli.command("detect-leaks")
+    @click.option("--end", default=None, help="Cuối cửa sổ (ISO-8601, mặc định bây giờ), làm tròn theo độ dài cửa sổ.")
+    @click.option("--window-minutes", default=None, type=int)
+    @click.option("--workers", default=None, type=int, help="Số process (1 = chạy trong process hiện tại).")
+    @click.option("--chunk-size", default=None, type=int, help="Số meter mỗi chunk.")
+    @click.option("--loop", is_flag=True, help="Chạy mãi, mỗi khi hết 1 cửa sổ (dùng cho systemd/supervisor).")
+    def detect_leaks_cmd(end, window_minutes, workers, chunk_size, loop):
+        """Đánh giá measurements theo cửa sổ và ghi predictions."""
+        cfg = app.config
+        window = timedelta(minutes=window_minutes or int(cfg.get("DETECTION_WINDOW_MINUTES", 60)))
+        end_dt = datetime.fromisoformat(end.replace("Z", "+00:00")) if end else None
+        while True:
+            click.echo(run_detection(get_db(), cfg, measurements_collection(), end=end_dt, window=window,
+                                     workers=workers, chunk_size=chunk_size))
+            if not loop:
+                break
+            _, cur_end = window_bounds(None, window)
+            # ngủ tới cuối cửa sổ kế tiếp (+ vài giây cho dữ liệu ghi trễ)
+            time.sleep(max(1.0, (cur_end + window - datetime.now(timezone.utc)).total_seconds() + 5))
+            end_dt = None
+
+    @app.cli.command("alerts-worker")
+    @click.option("--mode", type=click.Choice(["auto", "stream", "poll"]), default="auto", show_default=True,
+                  help="auto: change stream nếu là replica set, không thì polling.")
+    @click.option("--once", is_flag=True, help="Xử lý phần đang chờ rồi thoát.")
+    def alerts_worker_cmd(mode, once):
+        """Sinh alert từ predictions mới (chạy nền bằng systemd/supervisor)."""
+        r = run_alerts_worker(get_db(), app.config, mode=mode, once=once)
+        if once:
+            click.echo(r)
+
 def list_routes(app: Flask):
-    print("Registered routes:")
     output = []
     for rule in app.url_map.iter_rules():
         methods = ",".join(sorted(m for m in rule.methods if m not in ("HEAD", "OPTIONS")))
         line = f"{rule.endpoint:30s} {methods:15s} -> {rule.rule}"
         output.append(line)
-    for line in sorted(output):
-        print(line)
\ No newline at end of file
+    logger.info("Registered routes:\n%s", "\n".join(sorted(output)))
@@ -0,0 +1,72 @@
+"""Collection alerts: 1 alert / prediction (p_id unique), ghi bởi worker.py."""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, errors
+
+from ...extensions import get_db
+from ...indexes import declare_index
+from ..common.pagination import parse_sort, apply_keyset, encode_cursor
+
+COL = "alerts"
+
+declare_index(COL, [("p_id", ASCENDING)], unique=True, name="uniq_alert_prediction")  # 1-1
+declare_index(COL, [("time", DESCENDING)], name="idx_alert_time")
+# cooldown theo meter + lọc ?meter_id=
+declare_index(COL, [("meter_id", ASCENDING), ("time", DESCENDING), ("_id", DESCENDING)], name="idx_alert_meter_time_id")
+# keyset GET /alerts theo scope
+declare_index(COL, [("time", DESCENDING), ("_id", DESCENDING)], name="idx_alert_time_id")
+declare_index(COL, [("branch_id", ASCENDING), ("time", DESCENDING), ("_id", DESCENDING)],
+              name="idx_alert_branch_time_id")
+declare_index(COL, [("company_id", ASCENDING), ("time", DESCENDING), ("_id", DESCENDING)],
+              name="idx_alert_company_time_id")
+
+SORTABLE = {"_id": True, "time": False}
+
+
+def last_alert_times(meter_ids: List[ObjectId], db=None) -> Dict[ObjectId, datetime]:
+    """Thời điểm alert mới nhất của mỗi meter (idx_alert_meter_time_id)."""
+    if not meter_ids:
+        return {}
+    db = db if db is not None else get_db()
+    pipeline = [
+        {"$match": {"meter_id": {"$in": meter_ids}}},
+        {"$sort": {"meter_id": 1, "time": -1}},
+        {"$group": {"_id": "$meter_id", "time": {"$first": "$time"}}},
+    ]
+    return {d["_id"]: d["time"] for d in db[COL].aggregate(pipeline)}
+
+
+def insert_alerts(docs: List[Dict[str, Any]], db=None) -> Tuple[int, int]:
+    """insert_many unordered; prediction đã có alert (uniq_alert_prediction) thì bỏ qua.
+    Trả (số đã ghi, số bị trùng)."""
+    if not docs:
+        return 0, 0
+    db = db if db is not None else get_db()
+    try:
+        res = db[COL].insert_many(docs, ordered=False)
+        return len(res.inserted_ids), 0
+    except errors.BulkWriteError as e:
+        details = e.details or {}
+        write_errors = details.get("writeErrors", [])
+        if any(we.get("code") != 11000 for we in write_errors):
+            raise
+        return int(details.get("nInserted", 0)), len(write_errors)
+
+
+def list_paginated(flt: Dict[str, Any], page: int, page_size: int, sort: Optional[str],
+                   cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+    """Trả (docs, has_next, next_cursor). Có cursor thì bỏ qua page."""
+    srt = parse_sort(sort, SORTABLE, default="-time")
+    q = apply_keyset(flt, srt, cursor)
+    cur = get_db()[COL].find(q).sort(srt)
+    if not cursor:
+        cur = cur.skip((page - 1) * page_size)
+    docs = list(cur.limit(page_size + 1))
+
+    has_next = len(docs) > page_size
+    if has_next:
+        docs = docs[:page_size]
+    next_cursor = encode_cursor(docs[-1], srt) if has_next else None
+    return docs, has_next, next_cursor
@@ -0,0 +1,28 @@
+from flask import Blueprint, request
+from flask_jwt_extended import jwt_required
+
+from ..authz.require import require_role
+from ..common.response import json_ok
+from ..common.pagination import parse_pagination, build_links
+from .service import list_alerts
+
+bp = Blueprint("alerts", __name__)
+
+@bp.get("/")
+@jwt_required()
+@require_role(["admin", "company_manager", "branch_manager"])
+def list_():
+    """
+    Query: ?meter_id= ?branch_id= ?company_id= ?label= ?from= ?to= (ISO-8601)
+           ?sort=-time (mặc định) | time | _id | -_id, ?cursor= (keyset)
+    """
+    page, page_size = parse_pagination(request.args)
+    a = request.args
+    extra = {k: a.get(k) for k in ("meter_id", "branch_id", "company_id", "label", "from", "to", "sort") if a.get(k)}
+    items, has_next, next_cursor = list_alerts(
+        page, page_size, a.get("sort"), a.get("cursor"), a.get("branch_id"), a.get("company_id"),
+        a.get("meter_id"), a.get("label"), a.get("from"), a.get("to"))
+    body = {"items": items, "page": page, "page_size": page_size, "next_cursor": next_cursor}
+    links = build_links("/api/v1/alerts", page, page_size, has_next, extra,
+                        cursor=a.get("cursor"), next_cursor=next_cursor)
+    return json_ok(body, headers={"Link": links})
@@ -0,0 +1,75 @@
+from datetime import timezone
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from flask_jwt_extended import get_jwt
+from werkzeug.exceptions import Forbidden
+
+from ...errors import BadRequest
+from ..measurements.service import parse_bound
+from . import repo
+
+
+def _oid(v: Optional[str], name: str) -> Optional[ObjectId]:
+    if not v:
+        return None
+    if not ObjectId.is_valid(v):
+        raise BadRequest(f"Invalid {name}")
+    return ObjectId(v)
+
+
+def _iso(t) -> Optional[str]:
+    return (t if t.tzinfo else t.replace(tzinfo=timezone.utc)).isoformat() if t else None
+
+
+def _out(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(d["_id"]),
+        "prediction_id": str(d["p_id"]),
+        "meter_id": str(d["meter_id"]),
+        "branch_id": str(d["branch_id"]) if d.get("branch_id") else None,
+        "company_id": str(d["company_id"]) if d.get("company_id") else None,
+        "label": d.get("label"),
+        "confidence": d.get("confidence"),
+        "status": d.get("status"),
+        "time": _iso(d.get("time")),
+        "created_at": _iso(d.get("created_at")),
+    }
+
+
+def list_alerts(page: int, page_size: int, sort: Optional[str] = None, cursor: Optional[str] = None,
+                branch_id: Optional[str] = None, company_id: Optional[str] = None,
+                meter_id: Optional[str] = None, label: Optional[str] = None,
+                from_str: Optional[str] = None, to_str: Optional[str] = None):
+    """
+    Danh sách alert, luôn giới hạn trong phạm vi JWT (branch > company > toàn hệ thống).
+    Trả (items, has_next, next_cursor).
+    """
+    claims = get_jwt()
+    bid, cid, mid = _oid(branch_id, "branch_id"), _oid(company_id, "company_id"), _oid(meter_id, "meter_id")
+    if claims.get("branch_id"):
+        own = ObjectId(str(claims["branch_id"]))
+        if bid and bid != own:
+            raise Forbidden("Branch outside of your scope")
+        bid, cid = own, None
+    elif claims.get("company_id"):
+        own = ObjectId(str(claims["company_id"]))
+        if cid and cid != own:
+            raise Forbidden("Company outside of your scope")
+        cid = own
+
+    flt: Dict[str, Any] = {}
+    if mid:
+        flt["meter_id"] = mid
+    if bid:
+        flt["branch_id"] = bid
+    if cid:
+        flt["company_id"] = cid
+    if label:
+        flt["label"] = label
+    start, end = parse_bound(from_str, "from"), parse_bound(to_str, "to")
+    if start or end:
+        flt["time"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+
+    docs, has_next, next_cursor = repo.list_paginated(flt, page, page_size, sort, cursor)
+    return [_out(d) for d in docs], has_next, next_cursor
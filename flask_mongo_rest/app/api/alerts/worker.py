@@ -0,0 +1,190 @@
+"""Worker sinh alert từ predictions mới (flask alerts-worker).
+
+- Replica set: change stream trên predictions (chỉ insert có nhãn trong ALERT_LABELS),
+  resume token lưu ở schema_meta {_id: "alerts_worker"} sau mỗi batch.
+- Standalone (không có change stream): poll predictions theo (prediction_time, _id)
+  trên idx_pred_label_time_meter, mỗi lần lùi lại ALERT_POLL_LOOKBACK_SECONDS để bắt
+  prediction ghi trễ; đọc lại không sao vì alert trùng bị uniq_alert_prediction chặn.
+- Cooldown theo meter: trong ALERT_COOLDOWN_MINUTES quanh alert gần nhất của meter
+  thì không tạo alert mới.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo.errors import OperationFailure
+
+from ...logging_setup import get_logger
+from ..predictions.repo import COL as PRED_COL
+from .repo import insert_alerts, last_alert_times
+
+logger = get_logger(__name__)
+
+META_COL = "schema_meta"
+CHECKPOINT_ID = "alerts_worker"
+NOT_REPLICA_SET = 40573
+HISTORY_LOST = 286
+
+
+def _utc(t: datetime) -> datetime:
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+def _labels(cfg) -> List[str]:
+    return [x.strip() for x in str(cfg.get("ALERT_LABELS", "leak")).split(",") if x.strip()]
+
+
+def build_alerts(preds: Iterable[Dict[str, Any]], cooldown: timedelta, db) -> List[Dict[str, Any]]:
+    """Prediction -> alert, bỏ những cái rơi vào cooldown của meter (kể cả trong cùng batch)."""
+    preds = sorted(preds, key=lambda p: (_utc(p["prediction_time"]), p["_id"]))
+    last = {m: _utc(t) for m, t in last_alert_times(list({p["meter_id"] for p in preds}), db).items()}
+    now = datetime.now(timezone.utc)
+    out = []
+    for p in preds:
+        t, mid = _utc(p["prediction_time"]), p["meter_id"]
+        prev = last.get(mid)
+        if prev is not None and abs(t - prev) < cooldown:
+            continue
+        last[mid] = t
+        out.append({
+            "p_id": p["_id"],
+            "meter_id": mid,
+            "branch_id": p.get("branch_id"),
+            "company_id": p.get("company_id"),
+            "label": p.get("predicted_label"),
+            "confidence": p.get("confidence"),
+            "model_id": p.get("model_id"),
+            "time": t,
+            "status": "open",
+            "created_at": now,
+        })
+    return out
+
+
+def process_batch(preds: List[Dict[str, Any]], db, cfg) -> Dict[str, int]:
+    cooldown = timedelta(minutes=float(cfg.get("ALERT_COOLDOWN_MINUTES", 60)))
+    docs = build_alerts(preds, cooldown, db)
+    inserted, dup = insert_alerts(docs, db)
+    return {"predictions": len(preds), "inserted": inserted, "duplicates": dup,
+            "cooldown": len(preds) - len(docs)}
+
+
+# -----------------------
+# Checkpoint
+# -----------------------
+def load_checkpoint(db) -> Dict[str, Any]:
+    return db[META_COL].find_one({"_id": CHECKPOINT_ID}) or {}
+
+
+def save_checkpoint(db, **fields):
+    db[META_COL].update_one({"_id": CHECKPOINT_ID},
+                            {"$set": {**fields, "updated_at": datetime.now(timezone.utc)}}, upsert=True)
+
+
+def _add(totals: Dict[str, int], r: Dict[str, int]):
+    for k, v in r.items():
+        totals[k] = totals.get(k, 0) + v
+
+
+# -----------------------
+# Polling
+# -----------------------
+def poll_once(db, cfg, since: Optional[datetime] = None) -> Dict[str, int]:
+    """Quét predictions từ (checkpoint - lookback) tới hiện tại theo từng trang keyset."""
+    lookback = timedelta(seconds=float(cfg.get("ALERT_POLL_LOOKBACK_SECONDS", 300)))
+    batch_size = int(cfg.get("ALERT_BATCH_SIZE", 500))
+    last_time = since or load_checkpoint(db).get("last_time")
+    start = _utc(last_time) - lookback if last_time else datetime.now(timezone.utc) - lookback
+
+    base = {"predicted_label": {"$in": _labels(cfg)}, "prediction_time": {"$gte": start}}
+    totals: Dict[str, int] = {}
+    after = None
+    newest = _utc(last_time) if last_time else None
+    while True:
+        flt = base if after is None else {"$and": [base, {"$or": [
+            {"prediction_time": {"$gt": after[0]}},
+            {"prediction_time": after[0], "_id": {"$gt": after[1]}},
+        ]}]}
+        docs = list(db[PRED_COL].find(flt).sort([("prediction_time", 1), ("_id", 1)]).limit(batch_size))
+        if not docs:
+            break
+        _add(totals, process_batch(docs, db, cfg))
+        after = (docs[-1]["prediction_time"], docs[-1]["_id"])
+        t = _utc(after[0])
+        newest = t if newest is None or t > newest else newest
+        if len(docs) < batch_size:
+            break
+    if newest is not None:
+        save_checkpoint(db, last_time=newest)
+    return totals
+
+
+def run_polling(db, cfg, once: bool = False):
+    interval = float(cfg.get("ALERT_POLL_SECONDS", 5))
+    while True:
+        r = poll_once(db, cfg)
+        if r.get("predictions"):
+            logger.info("Alerts (poll): %s", r)
+        if once:
+            return r
+        time.sleep(interval)
+
+
+# -----------------------
+# Change stream
+# -----------------------
+def run_change_stream(db, cfg, once: bool = False):
+    """Trả None khi server không hỗ trợ change stream (gọi run_polling thay thế)."""
+    batch_size = int(cfg.get("ALERT_BATCH_SIZE", 500))
+    pipeline = [{"$match": {"operationType": "insert",
+                            "fullDocument.predicted_label": {"$in": _labels(cfg)}}}]
+    totals: Dict[str, int] = {}
+    while True:
+        token = load_checkpoint(db).get("resume_token")
+        if token is None:
+            # chưa có token: bắt kịp phần ghi trước khi mở stream bằng 1 lượt poll
+            _add(totals, poll_once(db, cfg))
+        try:
+            with db[PRED_COL].watch(pipeline, resume_after=token, max_await_time_ms=1000,
+                                    batch_size=batch_size) as stream:
+                batch: List[Dict[str, Any]] = []
+                saved = token
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        batch.append(change["fullDocument"])
+                        if len(batch) < batch_size:
+                            continue
+                    if batch:
+                        r = process_batch(batch, db, cfg)
+                        _add(totals, r)
+                        logger.info("Alerts (stream): %s", r)
+                        newest = max(_utc(p["prediction_time"]) for p in batch)
+                        saved = stream.resume_token
+                        save_checkpoint(db, resume_token=saved, last_time=newest)
+                        batch = []
+                    elif stream.resume_token is not None and stream.resume_token != saved:
+                        saved = stream.resume_token
+                        save_checkpoint(db, resume_token=saved)
+                    if once:
+                        return totals
+        except OperationFailure as e:
+            if e.code == NOT_REPLICA_SET:
+                return None
+            if e.code == HISTORY_LOST:
+                # oplog đã trôi qua token: bỏ token, lần lặp sau poll bù theo last_time
+                logger.warning("Alerts change stream history lost, catching up by polling")
+                save_checkpoint(db, resume_token=None)
+                continue
+            raise
+
+
+def run_worker(db, cfg, mode: str = "auto", once: bool = False):
+    if mode in ("auto", "stream"):
+        r = run_change_stream(db, cfg, once=once)
+        if r is not None:
+            return r
+        if mode == "stream":
+            raise RuntimeError("Change streams require a replica set")
+        logger.info("Change streams unavailable (standalone MongoDB), polling predictions instead")
+    return run_polling(db, cfg, once=once)
@@ -1,16 +1,19 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
 from .schemas import  LoginIn, UserPublic
-from .service import  validate_login
+from .service import  validate_login, load_user_for_refresh, build_claims
 from ...errors import BadRequest
 from ..common.response import json_ok
 from ...extensions import get_db
 from bson import ObjectId
 import bcrypt as bc
 from ...extensions import TOKEN_BLOCKLIST
-import traceback
+from ...logging_setup import get_logger
+from .utils import validate_current_user_password
+from .step_up import mint_step_up_token
 
 bp = Blueprint("auth", __name__, url_prefix="auth")
+logger = get_logger(__name__)
 
 @bp.post("/login")
 def login():
@@ -22,21 +25,14 @@ def login():
     try:
         u = validate_login(data)
 
-        # Thêm scope vào claims
-        claims = {
-            "username": u["username"],
-            "role_id": u["role_id"],
-            "role_name": u.get("role_name"),
-            "company_id": u["company_id"],
-            "branch_id": u["branch_id"],
-            "permissions": list(u.get("permissions", []))
-        }
+        # Thêm scope + phiên bản phân quyền vào claims
+        claims = build_claims(u)
 
         access  = create_access_token(identity=u["id"], additional_claims=claims)
         refresh = create_refresh_token(identity=u["id"], additional_claims=claims)
 
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Login failed for %s", data.username)
         raise e
 
     return json_ok({
@@ -50,7 +46,9 @@ def login():
 @jwt_required()
 def refresh():
     uid = get_jwt_identity()
-    return json_ok({"access_token": create_access_token(identity=uid)})
+    # Nhúng lại claims mới nhất (role/scope/permissions + authz epoch)
+    u = load_user_for_refresh(uid)
+    return json_ok({"access_token": create_access_token(identity=uid, additional_claims=build_claims(u))})
 
 
 @bp.post("/logout")
@@ -61,3 +59,18 @@ def logout():
     return jsonify({"msg": "Successfully logged out"}), 200
 
 
+@bp.post("/confirm")
+@jwt_required()
+def confirm():
+    """Step-up: xác nhận mật khẩu 1 lần, trả token ngắn hạn để gửi qua header
+    X-Confirm-Token cho các thao tác cần xác nhận (meters/users/logs).
+    Body: {"password": "...", "scopes": ["meters", ...]} (scopes bỏ trống = tất cả)."""
+    data = request.get_json(silent=True) or {}
+    ok, resp, _ = validate_current_user_password(data.get("password"))
+    if not ok:
+        return resp, 401
+    scopes = data.get("scopes")
+    if scopes is not None and not isinstance(scopes, list):
+        raise BadRequest("scopes must be a list")
+    token, ttl, scopes = mint_step_up_token(get_jwt_identity(), scopes)
+    return json_ok({"confirm_token": token, "expires_in": ttl, "scopes": scopes})
@@ -1,19 +1,25 @@
-from ..authz.repo import load_permissions_for_user
+from ..authz.repo import load_permissions_for_user, authz_claims
 from .schemas import  LoginIn
 from . import repo
 from ...errors import BadRequest, Conflict
 from ...utils.security import hash_password, verify_password
 from ...utils.bson import oid_str
+from ...logging_setup import get_logger, log_doc
+
+logger = get_logger(__name__)
 
 def validate_login(data: LoginIn):
     user = repo.get_user_by_username(data.username)
-    print("User from DB:", user)
+    log_doc(logger, "User from DB:", user)
     if not user or not verify_password(data.password, user.get("password", "")):
         raise BadRequest("Invalid username or password")
     if not user.get("is_active", True):
         raise BadRequest("User disabled")
     role = repo.get_role(user.get("role_id"))
-    print("User role:", role)
+    log_doc(logger, "User role:", role)
+    return _user_summary(user, role)
+
+def _user_summary(user: dict, role: dict | None) -> dict:
     perms = load_permissions_for_user(user["id"])
     return {
         "id": str(user["id"]),
@@ -23,4 +29,27 @@ def validate_login(data: LoginIn):
         "permissions": list(perms),
         "company_id": str(user["company_id"]) if user.get("company_id") else None,
         "branch_id": str(user["branch_id"]) if user.get("branch_id") else None,
+        "authz_epoch": int(user.get("authz_epoch", 0)),
+    }
+
+def load_user_for_refresh(uid: str) -> dict:
+    """Đọc lại user + role + permission hiện tại để cấp access token mới."""
+    user = repo.get_user_by_id(uid)
+    if not user:
+        raise BadRequest("User not found")
+    if not user.get("is_active", True):
+        raise BadRequest("User disabled")
+    role = repo.get_role(user["role_id"]) if user.get("role_id") else None
+    return _user_summary(user, role)
+
+def build_claims(u: dict) -> dict:
+    """Claims scope + phân quyền nhúng vào JWT (login và refresh dùng chung)."""
+    return {
+        "username": u["username"],
+        "role_id": u["role_id"],
+        "role_name": u.get("role_name"),
+        "company_id": u["company_id"],
+        "branch_id": u["branch_id"],
+        "permissions": list(u.get("permissions", [])),
+        **authz_claims(u["id"], u.get("authz_epoch", 0)),
     }
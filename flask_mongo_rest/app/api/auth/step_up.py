@@ -0,0 +1,42 @@
+"""Step-up token: xác nhận mật khẩu 1 lần qua POST /auth/confirm, nhận token
+ngắn hạn dùng cho các thao tác @require_password_confirmation (gửi qua header
+X-Confirm-Token) thay vì gửi password + bcrypt ở mỗi request.
+
+Token ký bằng JWT_SECRET_KEY nhưng có aud riêng nên không dùng làm access
+token được (flask_jwt_extended từ chối token có aud lạ).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+import jwt as pyjwt
+from flask import current_app
+
+AUDIENCE = "step-up"
+HEADER = "X-Confirm-Token"
+ALL_SCOPES = "*"
+
+def mint_step_up_token(user_id: str, scopes: Optional[Iterable[str]] = None) -> tuple[str, int, list[str]]:
+    ttl = int(current_app.config.get("STEP_UP_TOKEN_TTL_SECONDS", 300))
+    scopes = sorted({str(s) for s in scopes}) if scopes else [ALL_SCOPES]
+    now = datetime.now(timezone.utc)
+    payload = {
+        "sub": str(user_id),
+        "aud": AUDIENCE,
+        "scopes": scopes,
+        "iat": now,
+        "exp": now + timedelta(seconds=ttl),
+    }
+    token = pyjwt.encode(payload, current_app.config["JWT_SECRET_KEY"], algorithm="HS256")
+    return token, ttl, scopes
+
+def verify_step_up_token(token: str, user_id: str, scope: str) -> bool:
+    try:
+        payload = pyjwt.decode(
+            token, current_app.config["JWT_SECRET_KEY"], algorithms=["HS256"], audience=AUDIENCE
+        )
+    except pyjwt.PyJWTError:
+        return False
+    if payload.get("sub") != str(user_id):
+        return False
+    scopes = payload.get("scopes") or []
+    return ALL_SCOPES in scopes or scope in scopes
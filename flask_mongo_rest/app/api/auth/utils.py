@@ -1,8 +1,9 @@
-import bcrypt as bc
 from flask_jwt_extended import get_jwt_identity
 from flask import jsonify
+from werkzeug.exceptions import HTTPException
 from bson import ObjectId
 from ...extensions import get_db
+from ...utils.security import verify_password
 
 def _get_user_by_id(user_id: str):
     db = get_db()
@@ -24,9 +25,11 @@ def validate_current_user_password(plain_password: str):
     if not user:
         return False, jsonify({"success": False, "error": "User not found"}), None
 
-    # user["password"] là chuỗi hash đã lưu (bcrypt)
+    # user["password"] là chuỗi hash đã lưu (bcrypt), check qua pool giới hạn
     try:
-        ok = bc.checkpw(plain_password.encode("utf-8"), user["password"].encode("utf-8"))
+        ok = verify_password(plain_password, user["password"])
+    except HTTPException:
+        raise  # 503 khi pool bcrypt quá tải
     except Exception:
         ok = False
 
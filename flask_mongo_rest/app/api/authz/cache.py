@@ -0,0 +1,111 @@
+"""Cache phân quyền trong process.
+
+- user_id -> (role_id, role_name)
+- role_id -> set permission key
+
+Mỗi entry có TTL. Doc authz_meta {_id: "authz"} giữ 2 bộ đếm, worker khác đọc
+tối đa mỗi AUTHZ_VERSION_CHECK_SECONDS giây nên lúc ổn định không tốn round trip nào:
+- version: roles / permissions / role_permissions đổi -> bump_authz_version(),
+  xoá toàn bộ cache và làm mọi JWT mất claims (authz_v trong token).
+- users_version: 1 user đổi role / bị xoá -> invalidate_user(), worker khác chỉ xoá
+  cache theo user. Token của user đó mất claims nhờ users.authz_epoch (đã tăng
+  khi sửa), token của user khác vẫn dùng claims bình thường.
+"""
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from flask import current_app, has_app_context
+from pymongo import ReturnDocument
+from ...utils.cache import TTLCache
+
+META_COL = "authz_meta"
+VERSION_ID = "authz"
+
+
+user_roles = TTLCache()        # user_id(str) -> {"role_id": ObjectId|None, "role_name": str|None}
+role_permissions = TTLCache()  # role_id(str) -> frozenset[str]
+user_epochs = TTLCache()       # user_id(str) -> int (users.authz_epoch)
+
+_version_lock = threading.Lock()
+_known_version: Optional[int] = None
+_known_users_version: Optional[int] = None
+_checked_at = 0.0
+
+
+def _cfg(key: str, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def cache_ttl() -> float:
+    return float(_cfg("AUTHZ_CACHE_TTL", 300))
+
+
+def clear_local():
+    user_roles.clear()
+    role_permissions.clear()
+    user_epochs.clear()
+
+
+def clear_users_local():
+    user_roles.clear()
+    user_epochs.clear()
+
+
+def _read_version(db) -> Tuple[int, int]:
+    doc = db[META_COL].find_one({"_id": VERSION_ID}, {"version": 1, "users_version": 1}) or {}
+    return int(doc.get("version", 0)), int(doc.get("users_version", 0))
+
+
+def sync_version(db, force: bool = False):
+    """Đọc 2 bộ đếm (có throttle); version đổi thì xoá hết, users_version đổi thì xoá cache theo user."""
+    global _known_version, _known_users_version, _checked_at
+    interval = float(_cfg("AUTHZ_VERSION_CHECK_SECONDS", 5))
+    now = time.monotonic()
+    if not force and _known_version is not None and now - _checked_at < interval:
+        return
+    with _version_lock:
+        if not force and _known_version is not None and time.monotonic() - _checked_at < interval:
+            return
+        version, users_version = _read_version(db)
+        if _known_version is not None and version != _known_version:
+            clear_local()
+        elif _known_users_version is not None and users_version != _known_users_version:
+            clear_users_local()
+        _known_version, _known_users_version = version, users_version
+        _checked_at = time.monotonic()
+
+
+def current_version(db) -> int:
+    sync_version(db)
+    return _known_version or 0
+
+
+def _bump(db, field: str) -> dict:
+    return db[META_COL].find_one_and_update(
+        {"_id": VERSION_ID}, {"$inc": {field: 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    ) or {}
+
+
+def bump_authz_version(db):
+    """Gọi sau khi sửa roles / permissions / role_permissions (mọi token mất claims)."""
+    global _known_version, _known_users_version, _checked_at
+    doc = _bump(db, "version")
+    with _version_lock:
+        clear_local()
+        _known_version = int(doc.get("version", 0))
+        _known_users_version = int(doc.get("users_version", 0))
+        _checked_at = time.monotonic()
+
+
+def invalidate_user(db, user_id: str):
+    """User bị đổi role / xoá (users.authz_epoch đã tăng): xoá local và báo các worker
+    khác xoá cache theo user; không đụng version nên token của user khác vẫn dùng claims.
+    Worker này cũng sẽ thấy users_version đổi ở lần sync sau (xoá thừa 1 lần, vô hại)."""
+    user_roles.pop(str(user_id))
+    user_epochs.pop(str(user_id))
+    _bump(db, "users_version")
+
+
+def cached(cache: TTLCache, key, loader: Callable[[], Any]):
+    return cache.get_or_load(key, cache_ttl(), loader)
@@ -1,19 +1,72 @@
 from ...extensions import get_db
 from ...utils.bson import to_object_id
+from ...indexes import declare_index
+from pymongo import ASCENDING
+from . import cache
 
-def load_permissions_for_user(user_id: str) -> set[str]:
-    db = get_db()
+declare_index("roles", [("role_name", ASCENDING)], unique=True, name="uniq_role_name")
+declare_index("permissions", [("description", ASCENDING)], unique=True, name="uniq_perm_desc")
+declare_index("role_permissions", [("role_id", ASCENDING)], name="idx_rp_role")
+declare_index("role_permissions", [("permission_id", ASCENDING)], name="idx_rp_perm")
+declare_index("role_permissions", [("role_id", ASCENDING), ("permission_id", ASCENDING)],
+              unique=True, name="uniq_rp_role_perm")
+
+def _load_user_role(db, user_id: str) -> dict | None:
     u = db.users.find_one({"_id": to_object_id(user_id)}, {"role_id": 1})
-    if not u or not u.get("role_id"):
-        return set()
-    role_id = u["role_id"]
+    if not u:
+        return None
+    role_id = u.get("role_id")
+    role = db.roles.find_one({"_id": role_id}, {"role_name": 1}) if role_id else None
+    return {"role_id": role_id, "role_name": role["role_name"] if role else None}
+
+def _load_role_permissions(db, role_id) -> frozenset:
     # lấy permission_id từ role_permissions
     rp_cur = db.role_permissions.find({"role_id": role_id}, {"permission_id": 1})
     perm_ids = [doc["permission_id"] for doc in rp_cur]
-    # lấy description các permission
+    # lấy key các permission
     perms = set()
     if perm_ids:
-        for p in db.permissions.find({"_id": {"$in": perm_ids}}, {"description": 1, "key": 1, "role_name" :1 }):
-            print("Found permission:", p)
+        for p in db.permissions.find({"_id": {"$in": perm_ids}}, {"key": 1}):
             perms.add(p["key"])
-    return perms
+    return frozenset(perms)
+
+def get_user_role(user_id: str) -> dict | None:
+    """{role_id, role_name} của user, qua cache (0 query khi cache còn hạn)."""
+    db = get_db()
+    cache.sync_version(db)
+    return cache.cached(cache.user_roles, str(user_id), lambda: _load_user_role(db, user_id))
+
+def load_permissions_for_user(user_id: str) -> set[str]:
+    db = get_db()
+    ur = get_user_role(user_id)
+    if not ur or not ur.get("role_id"):
+        return set()
+    role_id = ur["role_id"]
+    perms = cache.cached(cache.role_permissions, str(role_id), lambda: _load_role_permissions(db, role_id))
+    return set(perms)
+
+def get_user_epoch(user_id: str) -> int | None:
+    """users.authz_epoch (mặc định 0), qua cache. None nếu user không tồn tại."""
+    db = get_db()
+    cache.sync_version(db)
+
+    def _load():
+        u = db.users.find_one({"_id": to_object_id(user_id)}, {"authz_epoch": 1})
+        return int(u.get("authz_epoch", 0)) if u else None
+    return cache.cached(cache.user_epochs, str(user_id), _load)
+
+def authz_claims(user_id: str, authz_epoch: int = 0) -> dict:
+    """Claim phiên bản phân quyền nhúng vào JWT (login/refresh)."""
+    return {"authz_epoch": int(authz_epoch or 0), "authz_v": cache.current_version(get_db())}
+
+def claims_are_fresh(user_id: str, claims: dict) -> bool:
+    """Token còn dùng được claims (role_name/permissions) không cần hỏi DB:
+    - có đủ claim authz_epoch/authz_v (token cũ thì không)
+    - authz_v khớp version phân quyền chung (roles/permissions không đổi)
+    - authz_epoch khớp epoch hiện tại của user (role/scope user không đổi)
+    """
+    if "authz_epoch" not in claims or "authz_v" not in claims:
+        return False
+    if claims.get("authz_v") != cache.current_version(get_db()):
+        return False
+    return claims.get("authz_epoch") == get_user_epoch(user_id)
@@ -1,9 +1,10 @@
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, jwt_required
+from flask import jsonify, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt, jwt_required
 from flask import request
-from .repo import load_permissions_for_user
+from .repo import load_permissions_for_user, get_user_role, claims_are_fresh
 from ..auth.utils import validate_current_user_password
+from ..auth.step_up import HEADER as STEP_UP_HEADER, verify_step_up_token
 
 def _flatten_to_str_set(*items) -> set[str]:
     """Nhận tuple args có thể lẫn list/tuple/set và chuỗi, flatten 1–2 cấp,
@@ -43,6 +44,26 @@ def _normalize_perms(perms) -> set[str]:
     # fallback: 1 giá trị đơn lẻ
     return {str(perms)}
 
+def _trusted_claims(uid) -> dict | None:
+    """Claims của JWT nếu AUTHZ_MODE="claims" và token chưa lỗi thời."""
+    if current_app.config.get("AUTHZ_MODE", "claims") != "claims":
+        return None
+    claims = get_jwt()
+    return claims if claims_are_fresh(uid, claims) else None
+
+def _current_permissions(uid) -> set[str]:
+    claims = _trusted_claims(uid)
+    if claims is not None and "permissions" in claims:
+        return _normalize_perms(claims.get("permissions"))
+    return _normalize_perms(load_permissions_for_user(uid))
+
+def _current_role_name(uid) -> str | None:
+    claims = _trusted_claims(uid)
+    if claims is not None and "role_name" in claims:
+        return claims.get("role_name")
+    user = load_user_for_role_check(uid)
+    return user.get("role_name") if user else None
+
 def require_permissions(*required):
     """AND: yêu cầu đủ tất cả quyền. 
     Dùng được các kiểu:
@@ -57,8 +78,7 @@ def require_permissions(*required):
         def wrapper(*args, **kwargs):
             verify_jwt_in_request()
             uid = get_jwt_identity()
-            perms_raw = load_permissions_for_user(uid)
-            perms = _normalize_perms(perms_raw)
+            perms = _current_permissions(uid)
 
             missing = sorted(p for p in required_set if p not in perms)
             if missing:
@@ -71,22 +91,23 @@ def require_permissions(*required):
         return wrapper
     return deco
 
-def require_role(*required_roles):
+def require_role(*required_roles, locations=None):
     """Yêu cầu user phải có một trong các role được chỉ định.
     Dùng được các kiểu:
       @require_role("admin")
       @require_role("admin", "company_manager")
       @require_role(["admin", "company_manager"])
+    locations: nơi đọc JWT (mặc định JWT_TOKEN_LOCATION), vd ["headers", "query_string"]
+    cho route SSE — phải khớp với @jwt_required(locations=...) đi kèm.
     """
     required_set = _flatten_to_str_set(*required_roles)
 
     def deco(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            verify_jwt_in_request()
+            verify_jwt_in_request(locations=locations)
             uid = get_jwt_identity()
-            user = load_user_for_role_check(uid)
-            user_role = user.get("role_name") if user else None
+            user_role = _current_role_name(uid)
 
             if user_role not in required_set:
                 return jsonify({"error": {
@@ -102,16 +123,8 @@ def require_role(*required_roles):
     return deco
 
 def load_user_for_role_check(user_id: str):
-    from ...extensions import get_db
-    from ...utils.bson import to_object_id
-
-    db = get_db()
-    user = db.users.find_one({"_id": to_object_id(user_id)})
-    if user:
-        role = db.roles.find_one({"_id": user["role_id"]})
-        if role:
-            user["role_name"] = role["role_name"]
-    return user
+    """Trả về {role_id, role_name} của user (đã cache, xem authz/cache.py)."""
+    return get_user_role(user_id)
 
 def require_any(*options):
     """OR: cần tối thiểu 1 quyền trong danh sách."""
@@ -122,8 +135,7 @@ def require_any(*options):
         def wrapper(*args, **kwargs):
             verify_jwt_in_request()
             uid = get_jwt_identity()
-            perms_raw = load_permissions_for_user(uid)
-            perms = _normalize_perms(perms_raw)
+            perms = _current_permissions(uid)
 
             if not (options_set & perms):  # giao hai tập rỗng -> thiếu quyền
                 return jsonify({"error": {
@@ -135,15 +147,23 @@ def require_any(*options):
         return wrapper
     return deco
 
-def require_password_confirmation(json_key: str = "password"):
+def require_password_confirmation(json_key: str = "password", scope: str | None = None):
     """
     Dùng: @jwt_required() + @require_password_confirmation()
-    Expect JSON body có {"password": "..."} (hoặc key tuỳ đổi)
+    Chấp nhận 1 trong 2:
+      - header X-Confirm-Token lấy từ POST /auth/confirm (không query DB, không bcrypt)
+      - JSON body có {"password": "..."} (hoặc key tuỳ đổi)
+    scope mặc định là tên blueprint (meters/users/logs).
     """
     def deco(fn):
         @wraps(fn)
         @jwt_required()
         def wrapper(*args, **kwargs):
+            token = request.headers.get(STEP_UP_HEADER)
+            if token:
+                need = scope or (request.blueprint or "").rsplit(".", 1)[-1]
+                if verify_step_up_token(token, get_jwt_identity(), need):
+                    return fn(*args, **kwargs)
             data = request.get_json(silent=True) or {}
             plain = data.get(json_key)
             ok, resp, _ = validate_current_user_password(plain)
@@ -1,9 +1,21 @@
 from typing import Optional, Dict, Any, List, Tuple
 from ...extensions import get_db
 from ...utils.bson import to_object_id, oid_str
+from ...indexes import declare_index
+from ..common.pagination import parse_sort, apply_keyset, encode_cursor
+from pymongo import ASCENDING
 
 COL = "branches"
 
+declare_index(COL, [("company_id", ASCENDING)], name="idx_branch_company")
+declare_index(COL, [("name", ASCENDING)], name="idx_branch_name")
+# keyset pagination: lọc company_id + sort (name, _id)
+declare_index(COL, [("company_id", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)], name="idx_branch_company_name_id")
+declare_index(COL, [("name", ASCENDING), ("_id", ASCENDING)], name="idx_branch_name_id")
+
+# field sort được phép (có index) -> unique?
+SORTABLE = {"_id": True, "name": False}
+
 def insert(doc: Dict[str, Any]) -> str:
     res = get_db()[COL].insert_one(doc)
     return oid_str(res.inserted_id)
@@ -13,7 +25,9 @@ def get(bid: str) -> Optional[Dict[str, Any]]:
     if not d: return None
     return d
 
-def list_paginated(page:int, page_size:int, company_id: Optional[str], q: Optional[str]) -> Tuple[List[Dict[str,Any]], bool]:
+def list_paginated(page:int, page_size:int, company_id: Optional[str], q: Optional[str],
+                   sort: Optional[str] = None, cursor: Optional[str] = None) -> Tuple[List[Dict[str,Any]], bool, Optional[str]]:
+    """Trả về (items, has_next, next_cursor). Có cursor thì bỏ qua page (keyset)."""
     db = get_db()
     flt: Dict[str, Any] = {}
     if company_id:
@@ -21,16 +35,22 @@ def list_paginated(page:int, page_size:int, company_id: Optional[str], q: Option
     if q:
         flt["name"] = {"$regex": q, "$options": "i"}
 
-    skip = (page-1) * page_size
-    cur = db[COL].find(flt).sort([("_id",1)]).skip(skip).limit(page_size+1)
+    srt = parse_sort(sort, SORTABLE)
+    flt = apply_keyset(flt, srt, cursor)
+    cur = db[COL].find(flt).sort(srt)
+    if not cursor:
+        cur = cur.skip((page-1) * page_size)
+    docs = list(cur.limit(page_size+1))
+    has_next = len(docs) > page_size
+    if has_next: docs = docs[:page_size]
+    next_cursor = encode_cursor(docs[-1], srt) if has_next else None
+
     out = []
-    for d in cur:
+    for d in docs:
         d["id"] = oid_str(d.pop("_id"))
         d["company_id"] = oid_str(d["company_id"])
         out.append(d)
-    has_next = len(out) > page_size
-    if has_next: out = out[:page_size]
-    return out, has_next
+    return out, has_next, next_cursor
 
 def update(bid: str, patch: Dict[str, Any]) -> bool:
     res = get_db()[COL].update_one({"_id": to_object_id(bid)}, {"$set": patch})
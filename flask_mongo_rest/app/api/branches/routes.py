@@ -8,8 +8,11 @@ from .service import create_branch, get_branch, list_branches, update_branch, re
 from ...errors import BadRequest
 from ..common.response import json_ok, created, no_content
 from ..common.pagination import parse_pagination, build_links
+from ...logging_setup import get_logger, log_doc
+from ..measurements.export import export_branch
 
 bp = Blueprint("branches", __name__)
+logger = get_logger(__name__)
 
 @bp.post("/")
 @jwt_required()
@@ -20,7 +23,7 @@ def create():
     except Exception as e:
         raise BadRequest(str(e))
     b = create_branch(data)
-    print("Created branch:", b)
+    log_doc(logger, "Created branch:", b)
     return created(f"/api/v1/branches/{b['_id']}", BranchOut(**_db_to_api(b)).model_dump())
 
 @bp.get("/")
@@ -29,9 +32,13 @@ def create():
 def list_():
     page, page_size = parse_pagination(request.args)
     q = request.args.get("q")
-    items, has_next = list_branches(page, page_size, q)
-    body = {"items": [BranchOut(**x).model_dump() for x in items], "page": page, "page_size": page_size}
-    links = build_links("/api/v1/branches", page, page_size, has_next, {"q": q or ""})
+    sort = request.args.get("sort")
+    cursor = request.args.get("cursor")
+    items, has_next, next_cursor = list_branches(page, page_size, q, sort, cursor)
+    body = {"items": [BranchOut(**x).model_dump() for x in items], "page": page, "page_size": page_size,
+            "next_cursor": next_cursor}
+    links = build_links("/api/v1/branches", page, page_size, has_next, {"q": q or "", "sort": sort or ""},
+                        cursor=cursor, next_cursor=next_cursor)
     return json_ok(body, headers={"Link": links})
 
 @bp.get("/<string:bid>")
@@ -58,3 +65,10 @@ def update(bid):
 def remove(bid):
     ok = remove_branch(bid)
     return json_ok() if ok else json_ok({"error":{"code":"NOT_FOUND","message":"Not found"}}, 404)
+
+@bp.get("/<string:bid>/measurements/export")
+@jwt_required()
+@require_permissions("meter:read")
+def export_measurements(bid):
+    """Stream dữ liệu đo của mọi meter trong chi nhánh. Query giống /meters/<mid>/measurements/export."""
+    return export_branch(bid, request.args.get("from"), request.args.get("to"), request.args.get("format"))
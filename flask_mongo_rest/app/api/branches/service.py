@@ -37,16 +37,16 @@ def get_branch(bid: str):
         return None
     return b
 
-def list_branches(page:int, page_size:int, q: Optional[str]):
+def list_branches(page:int, page_size:int, q: Optional[str], sort: Optional[str] = None, cursor: Optional[str] = None):
     company_id, branch_id = _get_user_scope()
     # branch scope: chỉ trả về đúng chi nhánh của user
     if branch_id:
         one = repo.get(oid_str(branch_id))
         items = [one] if one else []
-        return items, False
+        return items, False, None
     # company scope: lọc theo company_id
     cid_str = oid_str(company_id) if company_id else None
-    return repo.list_paginated(page, page_size, cid_str, q)
+    return repo.list_paginated(page, page_size, cid_str, q, sort, cursor)
 
 def update_branch(bid: str, data: BranchUpdate):
     company_id, branch_id = _get_user_scope()
@@ -0,0 +1,62 @@
+"""Response dạng cột cho series dài (thay cho JSON list các dict).
+
+Chọn theo header Accept:
+- application/vnd.apache.arrow.stream: Arrow IPC stream (cần pyarrow; time là
+  timestamp[ms, UTC], meta nằm trong schema metadata)
+- application/x-npz: file .npz của NumPy, không phụ thuộc gì thêm
+  (np.load(io.BytesIO(resp.content)); meta là mảng chuỗi JSON "meta")
+- còn lại: JSON như cũ
+"""
+import io
+import json
+from typing import Any, Dict
+
+import numpy as np
+from flask import Response, request
+from werkzeug.exceptions import NotAcceptable
+
+try:  # tuỳ chọn: chỉ cần khi client xin Arrow
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+NPZ = "application/x-npz"
+
+
+def negotiate() -> str:
+    """Định dạng response theo Accept; mặc định JSON (kể cả */*)."""
+    best = request.accept_mimetypes.best_match([JSON, ARROW, NPZ], default=JSON)
+    if best == ARROW and pa is None:
+        raise NotAcceptable(f"{ARROW} requires pyarrow on the server; use {NPZ} or {JSON}")
+    return best
+
+
+def _arrow_bytes(columns: Dict[str, np.ndarray], meta: Dict[str, Any]) -> bytes:
+    arrays, names = [], []
+    for name, col in columns.items():
+        if np.issubdtype(col.dtype, np.datetime64):
+            arrays.append(pa.array(col.astype("datetime64[ms]"), type=pa.timestamp("ms", tz="UTC")))
+        else:
+            arrays.append(pa.array(col))
+        names.append(name)
+    table = pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(
+        {"meta": json.dumps(meta, default=str)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _npz_bytes(columns: Dict[str, np.ndarray], meta: Dict[str, Any]) -> bytes:
+    buf = io.BytesIO()
+    np.savez(buf, meta=np.array(json.dumps(meta, default=str)), **columns)
+    return buf.getvalue()
+
+
+def columnar_response(columns: Dict[str, np.ndarray], meta: Dict[str, Any], fmt: str) -> Response:
+    body = _arrow_bytes(columns, meta) if fmt == ARROW else _npz_bytes(columns, meta)
+    resp = Response(body, mimetype=fmt)
+    resp.headers["Vary"] = "Accept"
+    return resp
@@ -1,5 +1,9 @@
-
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlencode
+from bson import json_util
+from ...errors import BadRequest
 
 DEFAULT_PAGE = 1
 DEFAULT_PAGE_SIZE = 20
@@ -20,15 +24,75 @@ def parse_pagination(args):
 
     return page, page_size
 
-def build_links(base_path: str, page: int, page_size: int, has_next: bool, extra_params: dict | None = None):
+def build_links(base_path: str, page: int, page_size: int, has_next: bool, extra_params: dict | None = None,
+                cursor: str | None = None, next_cursor: str | None = None):
+    """Link header. Có next_cursor thì link next dùng cursor (keyset) thay vì page+1."""
     extra_params = extra_params or {}
     links = []
-    q_self = urlencode({**extra_params, "page": page, "page_size": page_size})
+    if cursor:
+        q_self = urlencode({**extra_params, "cursor": cursor, "page_size": page_size})
+    else:
+        q_self = urlencode({**extra_params, "page": page, "page_size": page_size})
     links.append(f'<{base_path}?{q_self}>; rel="self"')
-    if page > 1:
+    if page > 1 and not cursor:
         q_prev = urlencode({**extra_params, "page": page-1, "page_size": page_size})
         links.append(f'<{base_path}?{q_prev}>; rel="prev"')
     if has_next:
-        q_next = urlencode({**extra_params, "page": page+1, "page_size": page_size})
+        if next_cursor:
+            q_next = urlencode({**extra_params, "cursor": next_cursor, "page_size": page_size})
+        else:
+            q_next = urlencode({**extra_params, "page": page+1, "page_size": page_size})
         links.append(f'<{base_path}?{q_next}>; rel="next"')
     return ", ".join(links)
+
+# -----------------------
+# Keyset (cursor) pagination
+# -----------------------
+# Sort spec: [(field, direction)], luôn kết thúc bằng _id để thứ tự duy nhất
+# (trừ khi field unique). Cursor = base64url(JSON{sort key của doc cuối}).
+
+SortSpec = List[Tuple[str, int]]
+
+def parse_sort(sort: Optional[str], allowed: Dict[str, bool], default: str = "_id") -> SortSpec:
+    """allowed: {field: unique} — chỉ các field có index phù hợp.
+    "-field" là giảm dần. Field không unique được thêm _id làm tie-breaker."""
+    raw = sort or default
+    field = raw.lstrip("-")
+    direction = -1 if raw.startswith("-") else 1
+    if field not in allowed:
+        raise BadRequest(f"Unsupported sort field '{field}'. Allowed: {', '.join(sorted(allowed))}")
+    spec = [(field, direction)]
+    if field != "_id" and not allowed[field]:
+        spec.append(("_id", direction))
+    return spec
+
+def encode_cursor(doc: Dict[str, Any], sort: SortSpec) -> str:
+    values = {f: doc.get(f) for f, _ in sort}
+    raw = json_util.dumps(values, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str, sort: SortSpec) -> Dict[str, Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise BadRequest("Invalid cursor")
+    if not isinstance(values, dict) or set(values) != {f for f, _ in sort}:
+        raise BadRequest("Cursor does not match sort")
+    return values
+
+def keyset_filter(sort: SortSpec, values: Dict[str, Any]) -> Dict[str, Any]:
+    """Điều kiện "đứng sau doc cuối" theo sort, để Mongo quét range trên index."""
+    ors = []
+    for i, (field, direction) in enumerate(sort):
+        op = "$gt" if direction == 1 else "$lt"
+        cond = {f: values[f] for f, _ in sort[:i]}
+        cond[field] = {op: values[field]}
+        ors.append(cond)
+    return ors[0] if len(ors) == 1 else {"$or": ors}
+
+def apply_keyset(flt: Dict[str, Any], sort: SortSpec, cursor: Optional[str]) -> Dict[str, Any]:
+    if not cursor:
+        return flt
+    after = keyset_filter(sort, decode_cursor(cursor, sort))
+    return {"$and": [flt, after]} if flt else after
@@ -1,7 +1,8 @@
 from datetime import datetime, timezone
-from typing import Dict, Optional, Set
+from typing import Any, Dict, List, Optional, Set
 from bson import ObjectId
 from ...extensions import get_db
+from ..predictions.repo import COL as PRED_COL
 
 def _pick_log_collection() -> str:
     db = get_db()
@@ -67,3 +68,40 @@ def overview_counts(company_id: Optional[str] = None) -> Dict[str, int]:
         "total_users":  count_users(company_id),
         "updated_at":   datetime.now(timezone.utc).isoformat()
     }
+
+def leak_breakdown_rows(start_utc: datetime, end_utc: datetime,
+                        branch_ids: Optional[List[ObjectId]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    1 aggregation trên predictions (+ $unionWith meters), $facet ra:
+      - meters: [{_id: branch_id, total}]
+      - labels: [{_id: {branch_id, label}, meters}]  (distinct meter theo nhãn)
+    branch_ids = None -> toàn hệ thống.
+    """
+    db = get_db()
+    pred_match: Dict[str, Any] = {"prediction_time": {"$gte": start_utc, "$lt": end_utc}}
+    meter_match: Dict[str, Any] = {}
+    if branch_ids is not None:
+        pred_match["branch_id"] = {"$in": branch_ids}
+        meter_match["branch_id"] = {"$in": branch_ids}
+
+    pipeline = [
+        {"$match": pred_match},
+        {"$group": {"_id": {"branch_id": "$branch_id", "meter_id": "$meter_id", "label": "$predicted_label"}}},
+        {"$project": {"_id": 0, "kind": "pred", "branch_id": "$_id.branch_id", "label": "$_id.label"}},
+        {"$unionWith": {"coll": "meters", "pipeline": [
+            {"$match": meter_match},
+            {"$project": {"_id": 0, "kind": "meter", "branch_id": 1}},
+        ]}},
+        {"$facet": {
+            "meters": [
+                {"$match": {"kind": "meter"}},
+                {"$group": {"_id": "$branch_id", "total": {"$sum": 1}}},
+            ],
+            "labels": [
+                {"$match": {"kind": "pred"}},
+                {"$group": {"_id": {"branch_id": "$branch_id", "label": "$label"}, "meters": {"$sum": 1}}},
+            ],
+        }},
+    ]
+    docs = list(db[PRED_COL].aggregate(pipeline, allowDiskUse=True))
+    return docs[0] if docs else {"meters": [], "labels": []}
@@ -1,8 +1,10 @@
 # app/api/common/routes.py
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
-from .service import get_overview_scoped as get_overview
+from .service import get_overview_scoped as get_overview, get_leak_breakdown
 from ..authz.require import require_role
+from ...extensions import get_pool_stats
+from ...instrumentation import endpoint_stats
 
 bp = Blueprint("stats", __name__, url_prefix="/stats")
 
@@ -12,3 +14,34 @@ bp = Blueprint("stats", __name__, url_prefix="/stats")
 def overview():
     data = get_overview()
     return jsonify(data), 200
+
+@bp.get("/leaks/breakdown")
+@jwt_required()
+@require_role(["admin", "company_manager", "branch_manager"])
+def leaks_breakdown():
+    """
+    Công ty -> chi nhánh -> số meter (tổng, leak, normal, theo nhãn) trong 1 request.
+    Query: ?date=YYYY-MM-DD hoặc ?from=&to= (giờ VN, tối đa BREAKDOWN_MAX_DAYS ngày),
+           ?company_id= (chỉ admin / công ty của mình)
+    """
+    a = request.args
+    data = get_leak_breakdown(a.get("date"), a.get("from"), a.get("to"), a.get("company_id"))
+    return jsonify(data), 200
+
+@bp.get("/db-pool")
+@jwt_required()
+@require_role("admin")
+def db_pool():
+    """Thống kê connection pool MongoDB của worker đang xử lý request."""
+    return jsonify(get_pool_stats()), 200
+
+@bp.get("/mongo")
+@jwt_required()
+@require_role("admin")
+def mongo_stats():
+    """Số command/round trip MongoDB theo endpoint (của worker hiện tại).
+    ?reset=1 để xoá số liệu sau khi đọc."""
+    data = endpoint_stats.snapshot()
+    if request.args.get("reset") == "1":
+        endpoint_stats.reset()
+    return jsonify({"endpoints": data}), 200
@@ -1,6 +1,12 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+from bson import ObjectId
+from flask import current_app
 from flask_jwt_extended import get_jwt
 from werkzeug.exceptions import Forbidden, BadRequest
-from .repo import overview_counts
+from .repo import overview_counts, leak_breakdown_rows, _branch_ids_in_company
+from ...extensions import get_db
+from ...utils.time_utils import day_bounds_utc
 
 def _claims():
     c = get_jwt()
@@ -21,3 +27,91 @@ def get_overview_scoped() -> dict:
 
     # các role khác (nếu có) không được xem
     raise Forbidden("You are not allowed to view overview")
+
+
+def _day_range(date: Optional[str], from_date: Optional[str], to_date: Optional[str]):
+    """?date= (1 ngày) hoặc ?from=&to= (ngày giờ VN, gồm cả 2 đầu). Trả (from, to, start_utc, end_utc)."""
+    first_q = from_date or date
+    try:
+        first, start_utc, _ = day_bounds_utc(first_q)
+        last, _, end_utc = day_bounds_utc(to_date or first_q)
+    except ValueError:
+        raise BadRequest("Invalid date format. Use YYYY-MM-DD")
+    if last < first:
+        raise BadRequest("'from' must not be after 'to'")
+    days = (datetime.strptime(last, "%Y-%m-%d") - datetime.strptime(first, "%Y-%m-%d")).days + 1
+    max_days = int(current_app.config.get("BREAKDOWN_MAX_DAYS", 31))
+    if days > max_days:
+        raise BadRequest(f"Range too long (max {max_days} days)")
+    return first, last, start_utc, end_utc
+
+
+def _scope_branches(company_q: Optional[str]):
+    """Danh sách branch_id theo JWT (None = toàn hệ thống). Admin có thể lọc ?company_id=."""
+    role, company_id, branch_id = _claims()
+    if company_q and not ObjectId.is_valid(company_q):
+        raise BadRequest("Invalid company_id")
+    if role == "admin":
+        return list(_branch_ids_in_company(ObjectId(company_q))) if company_q else None
+    if role == "company_manager":
+        if not company_id:
+            raise BadRequest("Your token has no company_id")
+        if company_q and company_q != str(company_id):
+            raise Forbidden("Company outside of your scope")
+        return list(_branch_ids_in_company(ObjectId(str(company_id))))
+    if role == "branch_manager":
+        if not branch_id:
+            raise BadRequest("Your token has no branch_id")
+        return [ObjectId(str(branch_id))]
+    raise Forbidden("You are not allowed to view leak breakdown")
+
+
+def _counts(total: int, labels: Dict[str, int]) -> Dict[str, Any]:
+    leak = labels.get("leak", 0)
+    return {"total_meters": total, "leak_meters": leak, "normal_meters": max(0, total - leak), "labels": labels}
+
+
+def get_leak_breakdown(date: Optional[str], from_date: Optional[str], to_date: Optional[str],
+                       company_q: Optional[str] = None) -> Dict[str, Any]:
+    """
+    company -> branch -> {total_meters, leak_meters, normal_meters, labels{nhãn: số meter}}.
+    Số meter theo nhãn là distinct meter có ít nhất 1 prediction nhãn đó trong khoảng.
+    """
+    first, last, start_utc, end_utc = _day_range(date, from_date, to_date)
+    rows = leak_breakdown_rows(start_utc, end_utc, _scope_branches(company_q))
+
+    totals = {r["_id"]: r["total"] for r in rows["meters"]}
+    labels: Dict[Any, Dict[str, int]] = {}
+    for r in rows["labels"]:
+        labels.setdefault(r["_id"].get("branch_id"), {})[r["_id"].get("label") or "unknown"] = r["meters"]
+
+    db = get_db()
+    branch_ids = [b for b in set(totals) | set(labels) if b is not None]
+    branches = {b["_id"]: b for b in db.branches.find({"_id": {"$in": branch_ids}}, {"name": 1, "company_id": 1})}
+    companies = {c["_id"]: c for c in db.companies.find(
+        {"_id": {"$in": list({b.get("company_id") for b in branches.values()})}}, {"name": 1})}
+
+    by_company: Dict[Any, Dict[str, Any]] = {}
+    for bid in sorted(branches, key=lambda x: branches[x].get("name") or ""):
+        b = branches[bid]
+        cid = b.get("company_id")
+        comp = by_company.setdefault(cid, {
+            "company_id": str(cid) if cid else None,
+            "name": companies.get(cid, {}).get("name"),
+            "total": 0, "labels": {}, "branches": [],
+        })
+        blabels = labels.get(bid, {})
+        comp["branches"].append({"branch_id": str(bid), "name": b.get("name"),
+                                 **_counts(totals.get(bid, 0), blabels)})
+        comp["total"] += totals.get(bid, 0)
+        for k, v in blabels.items():
+            comp["labels"][k] = comp["labels"].get(k, 0) + v
+
+    out, grand_total, grand_labels = [], 0, {}
+    for comp in sorted(by_company.values(), key=lambda c: c["name"] or ""):
+        total, clabels = comp.pop("total"), comp.pop("labels")
+        out.append({**comp, **_counts(total, clabels)})
+        grand_total += total
+        for k, v in clabels.items():
+            grand_labels[k] = grand_labels.get(k, 0) + v
+    return {"from": first, "to": last, **_counts(grand_total, grand_labels), "companies": out}
@@ -1,8 +1,12 @@
 from ...extensions import get_db
 from ...utils.bson import to_object_id, oid_str
+from ...indexes import declare_index
+from pymongo import ASCENDING
 
 COL = "companies"
 
+declare_index(COL, [("name", ASCENDING)], unique=True, name="uniq_company_name")
+
 def insert(doc): 
     res = get_db()[COL].insert_one(doc)
     return oid_str(res.inserted_id)
@@ -1,11 +1,29 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from bson import ObjectId
 from pymongo import ASCENDING, DESCENDING
 from ...extensions import get_db
+from ...indexes import declare_index
+from ..common.pagination import parse_sort, apply_keyset, encode_cursor
+from ...utils.cache import TTLCache
+from flask import current_app
 
 COL = "log"  # đổi nếu bạn đặt tên khác
 
+# keyset pagination: (created_time, _id), có/không lọc theo user_id
+declare_index(COL, [("created_time", DESCENDING), ("_id", DESCENDING)], name="idx_log_created_id")
+declare_index(COL, [("user_id", ASCENDING), ("created_time", DESCENDING), ("_id", DESCENDING)], name="idx_log_user_created_id")
+
+# field sort được phép (có index) -> unique?
+SORTABLE = {"_id": True, "created_time": False}
+
+# Cache tổng số log theo scope và tập user_id theo công ty (TTL ngắn, trong process)
+_totals = TTLCache()
+_company_users = TTLCache()
+
+def _total_ttl() -> float:
+    return float(current_app.config.get("LOG_TOTAL_CACHE_TTL", 30))
+
 def _to_oid(v): return v if isinstance(v, ObjectId) else ObjectId(v)
 
 def _sid(v): return str(v) if v is not None else None
@@ -38,8 +56,11 @@ def _user_ids_in_company(company_id: ObjectId) -> List[ObjectId]:
     return [u["_id"] for u in db.users.find(q, {"_id": 1})]
 
 def build_company_scope_query(company_id: str) -> Dict[str, Any]:
-    """Vì log không có company_id/branch_id, lọc theo user_id ∈ users của công ty."""
-    uids = _user_ids_in_company(_to_oid(company_id))
+    """Vì log không có company_id/branch_id, lọc theo user_id ∈ users của công ty.
+    Tập user_id được cache theo LOG_TOTAL_CACHE_TTL để mỗi trang không tốn 2 query."""
+    uids = _company_users.get_or_load(
+        str(company_id), _total_ttl(), lambda: _user_ids_in_company(_to_oid(company_id))
+    )
     if not uids:
         return {"user_id": {"$in": []}}  # rỗng
     return {"user_id": {"$in": uids}}
@@ -63,23 +84,54 @@ def user_ids_in_company(company_id: str) -> List[ObjectId]:
         q["$or"].append({"branch_id": {"$in": bids}})
     return [u["_id"] for u in db.users.find(q, {"_id": 1})]
 
-def list_logs(query: Dict[str, Any], page=1, limit=20, sort="created_time", order="desc") -> Dict[str, Any]:
+def count_logs(query: Dict[str, Any], scope_key: str) -> Tuple[int, str]:
+    """Tổng số log cho query, trả (total, total_mode):
+    - "estimated": không lọc (admin) -> estimated_document_count (metadata, không quét)
+    - "exact": đếm đủ, cache theo scope_key trong LOG_TOTAL_CACHE_TTL
+    - "at_least": chạm LOG_COUNT_CAP -> chỉ biết total >= cap
+    """
+    col = get_db()[COL]
+    if not query:
+        return col.estimated_document_count(), "estimated"
+
+    cap = int(current_app.config.get("LOG_COUNT_CAP", 10000))
+
+    def _count():
+        n = col.count_documents(query, limit=cap) if cap > 0 else col.count_documents(query)
+        return (n, "at_least" if cap > 0 and n >= cap else "exact")
+    return _totals.get_or_load(scope_key, _total_ttl(), _count)
+
+def list_logs(query: Dict[str, Any], page=1, limit=20, sort="created_time", order="desc",
+              cursor: Optional[str] = None, with_total: bool = True, scope_key: str = "all") -> Dict[str, Any]:
+    """Có cursor (lấy từ next_cursor trang trước) thì đọc theo keyset, bỏ qua page.
+    with_total=False: không đếm (total/pages = None)."""
     db = get_db()
     col = db[COL]
     page  = max(1, int(page or 1))
     limit = min(200, max(1, int(limit or 20)))
-    direction = DESCENDING if (order or "").lower() == "desc" else ASCENDING
+    desc = (order or "").lower() == "desc"
+    srt = parse_sort(("-" if desc else "") + (sort or "created_time"), SORTABLE)
 
-    cursor = col.find(query).sort([(sort, direction)]).skip((page-1)*limit).limit(limit)
-    items = [_doc_to_api(d) for d in cursor]
-    total = col.count_documents(query)
+    cur = col.find(apply_keyset(query, srt, cursor)).sort(srt)
+    if not cursor:
+        cur = cur.skip((page-1)*limit)
+    docs = list(cur.limit(limit + 1))
+    has_next = len(docs) > limit
+    if has_next:
+        docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1], srt) if has_next else None
+    items = [_doc_to_api(d) for d in docs]
+    total, total_mode = count_logs(query, scope_key) if with_total else (None, None)
 
     return {
         "items": items,
         "page": page,
         "limit": limit,
         "total": total,
-        "pages": (total + limit - 1) // limit
+        "total_mode": total_mode,
+        "pages": (total + limit - 1) // limit if total is not None else None,
+        "has_next": has_next,
+        "next_cursor": next_cursor
     }
 
 def insert_log(doc: Dict[str, Any]) -> Dict[str, Any]:
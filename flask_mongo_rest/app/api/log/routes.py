@@ -12,13 +12,14 @@ bp = Blueprint("logs", __name__, url_prefix="/logs")
 @jwt_required()
 @require_role(["admin", "company_manager", "branch_manager"])
 def list_logs_api():
-    print("Listing logs...")
     page  = request.args.get("page", 1, type=int)
     limit = request.args.get("limit", 20, type=int)
     sort  = request.args.get("sort", "created_time", type=str)  
     order = request.args.get("order", "desc", type=str)
+    cursor = request.args.get("cursor")
+    with_total = request.args.get("with_total", "true").lower() not in ("0", "false", "no")
 
-    data = get_logs_scoped(page=page, limit=limit, sort=sort, order=order)
+    data = get_logs_scoped(page=page, limit=limit, sort=sort, order=order, cursor=cursor, with_total=with_total)
     return jsonify(data), 200
 
 @bp.delete("/<log_id>")
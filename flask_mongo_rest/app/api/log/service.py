@@ -10,17 +10,18 @@ def _claims():
     c = get_jwt()
     return c.get("role_name") or c.get("role"), c.get("company_id")
 
-def get_logs_scoped(page=1, limit=20, sort="created_time", order="desc"):
+def get_logs_scoped(page=1, limit=20, sort="created_time", order="desc", cursor=None, with_total=True):
     role, company_id = _claims()
     if role == "admin":
-        base = {}
+        base, scope_key = {}, "all"
     elif role in ("company_manager", "branch_manager"):
         if not company_id:
             raise Forbidden("Missing company scope")
-        base = build_company_scope_query(company_id)
+        base, scope_key = build_company_scope_query(company_id), f"company:{company_id}"
     else:
         raise Forbidden("Not allowed to view logs")
-    return list_logs(base, page=page, limit=limit, sort=sort, order=order)
+    return list_logs(base, page=page, limit=limit, sort=sort, order=order, cursor=cursor,
+                     with_total=with_total, scope_key=scope_key)
 
 def delete_log_scoped(log_id: str) -> None:
     role, company_id = _claims()
@@ -0,0 +1,132 @@
+"""Export dữ liệu đo dạng stream (CSV / NDJSON), bộ nhớ không phụ thuộc độ dài khoảng.
+
+Cursor đọc theo batch (EXPORT_BATCH_SIZE), mỗi lần gom khoảng EXPORT_CHUNK_BYTES
+rồi yield; gzip (nếu client nhận) nén dần từng chunk bằng zlib. Export chi nhánh
+đi qua mọi meter theo từng nhóm EXPORT_METER_CHUNK (keyset _id), không bị cắt.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+from flask import Response, current_app, request, stream_with_context
+from werkzeug.exceptions import BadRequest, Forbidden, NotFound
+
+from ..meter.repo import get as get_meter, iter_meter_ref_chunks
+from .repo import iter_measurements
+from .service import parse_bound, scope_branch_ids
+from ...logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+COLUMNS = ["measurement_time", "meter_id", "meter_name", "instant_flow", "instant_pressure"]
+
+
+def _range(from_str: Optional[str], to_str: Optional[str]):
+    end = parse_bound(to_str, "to") or datetime.now(timezone.utc)
+    start = parse_bound(from_str, "from") or end - timedelta(days=1)
+    if start >= end:
+        raise BadRequest("'from' must be before 'to'")
+    return start, end
+
+
+def _rows(docs: Iterable[Dict[str, Any]], names: Dict[ObjectId, str]) -> Iterator[List[Any]]:
+    for d in docs:
+        t = d["measurement_time"]
+        yield [
+            (t if t.tzinfo else t.replace(tzinfo=timezone.utc)).isoformat(),
+            str(d["meter_id"]),
+            names.get(d["meter_id"], ""),
+            d.get("instant_flow"),
+            d.get("instant_pressure"),
+        ]
+
+
+def _chunk_rows(chunks: Iterable[List[Dict[str, Any]]], start: datetime, end: datetime,
+                batch_size: int) -> Iterator[List[Any]]:
+    """Đọc measurements theo từng nhóm meter (thứ tự _id) -> toàn bộ vẫn theo (meter_id, time)."""
+    for refs in chunks:
+        names = {m["_id"]: m.get("meter_name") or "" for m in refs}
+        yield from _rows(iter_measurements(list(names), start, end, batch_size=batch_size), names)
+
+
+def _encode(rows: Iterator[List[Any]], fmt: str, chunk_bytes: int) -> Iterator[bytes]:
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(COLUMNS)
+        write = writer.writerow
+    else:
+        write = lambda r: buf.write(json.dumps(dict(zip(COLUMNS, r)), ensure_ascii=False) + "\n")
+    for r in rows:
+        write(r)
+        if buf.tell() >= chunk_bytes:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for c in chunks:
+        out = z.compress(c)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def _wants_gzip() -> bool:
+    if request.args.get("gzip") == "0":
+        return False
+    return request.args.get("gzip") == "1" or "gzip" in request.accept_encodings
+
+
+def _stream(chunks: Iterable[List[Dict[str, Any]]], start: datetime, end: datetime, fmt: Optional[str],
+            filename: str) -> Response:
+    """chunks: các nhóm meter {_id, meter_name}, đọc lười trong lúc stream."""
+    fmt = (fmt or "csv").lower()
+    if fmt not in FORMATS:
+        raise BadRequest("format must be csv or ndjson")
+    cfg = current_app.config
+    rows = _chunk_rows(chunks, start, end, int(cfg.get("EXPORT_BATCH_SIZE", 2000)))
+    body = _encode(rows, fmt, int(cfg.get("EXPORT_CHUNK_BYTES", 64 * 1024)))
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"', "Vary": "Accept-Encoding"}
+    if _wants_gzip():
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+    logger.info("Export %s: %s, %s -> %s", fmt, filename, start.isoformat(), end.isoformat())
+    return Response(stream_with_context(body), mimetype=FORMATS[fmt], headers=headers)
+
+
+def export_meter(mid: str, from_str: Optional[str], to_str: Optional[str], fmt: Optional[str]) -> Response:
+    if not ObjectId.is_valid(mid):
+        raise BadRequest("Invalid meter id")
+    m = get_meter(mid)
+    if not m:
+        raise NotFound("Meter not found")
+    allowed = scope_branch_ids()
+    if allowed is not None and ObjectId(m["branch_id"]) not in allowed:
+        raise Forbidden("Meter outside of your company/branch")
+    start, end = _range(from_str, to_str)
+    refs = [{"_id": ObjectId(mid), "meter_name": m.get("meter_name")}]
+    return _stream([refs], start, end, fmt, f"meter_{mid}_{start:%Y%m%d}_{end:%Y%m%d}")
+
+
+def export_branch(bid: str, from_str: Optional[str], to_str: Optional[str], fmt: Optional[str]) -> Response:
+    if not ObjectId.is_valid(bid):
+        raise BadRequest("Invalid branch id")
+    branch_id = ObjectId(bid)
+    allowed = scope_branch_ids()
+    if allowed is not None and branch_id not in allowed:
+        raise Forbidden("Branch outside of your company/branch")
+    start, end = _range(from_str, to_str)
+    # mọi meter của chi nhánh, từng nhóm EXPORT_METER_CHUNK (không cắt ở LATEST_MAX_METERS)
+    chunks = iter_meter_ref_chunks([branch_id], int(current_app.config.get("EXPORT_METER_CHUNK", 500)))
+    return _stream(chunks, start, end, fmt, f"branch_{bid}_{start:%Y%m%d}_{end:%Y%m%d}")
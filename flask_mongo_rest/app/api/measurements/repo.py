@@ -1,18 +1,31 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, errors
+from flask import current_app, has_app_context
 from ...extensions import get_db
+from ...indexes import declare_index
 
 COL = "meter_measurements"  # đổi nếu bạn đặt tên khác
 
+declare_index(COL, [("meter_id", ASCENDING), ("measurement_time", DESCENDING)], name="idx_meas_meter_time")
+
 def _oid(v): return v if isinstance(v, ObjectId) else ObjectId(v)
 
+def measurements_collection() -> str:
+    """Collection đang dùng cho dữ liệu đo: COL (thường) hoặc collection
+    time-series sau khi migrate (MEASUREMENTS_COLLECTION, xem timeseries.py).
+    Các query bên dưới giống nhau cho cả 2 layout."""
+    if has_app_context():
+        return current_app.config.get("MEASUREMENTS_COLLECTION") or COL
+    return COL
+
 def find_latest_instant_flow(meter_id: str) -> Optional[Dict[str, Any]]:
     """
     Lấy bản ghi đo mới nhất cho 1 meter: {instant_flow, instant_pressure, measurement_time}
     """
     db = get_db()
-    doc = db[COL].find_one(
+    doc = db[measurements_collection()].find_one(
         {"meter_id": _oid(meter_id)},
         sort=[("measurement_time", -1)]
     )
@@ -24,6 +37,31 @@ def find_latest_instant_flow(meter_id: str) -> Optional[Dict[str, Any]]:
         "measurement_time": doc["measurement_time"].isoformat()
     }
 
+def find_latest_for_meters(meter_ids: List[ObjectId]) -> Dict[ObjectId, Dict[str, Any]]:
+    """Bản ghi mới nhất của nhiều meter trong 1 aggregation. $sort khớp
+    idx_meas_meter_time nên $group/$first chỉ đọc 1 bản ghi đầu mỗi meter."""
+    if not meter_ids:
+        return {}
+    db = get_db()
+    pipeline = [
+        {"$match": {"meter_id": {"$in": meter_ids}}},
+        {"$sort": {"meter_id": 1, "measurement_time": -1}},
+        {"$group": {
+            "_id": "$meter_id",
+            "measurement_time": {"$first": "$measurement_time"},
+            "instant_flow": {"$first": "$instant_flow"},
+            "instant_pressure": {"$first": "$instant_pressure"},
+        }},
+    ]
+    out = {}
+    for d in db[measurements_collection()].aggregate(pipeline):
+        out[d["_id"]] = {
+            "instant_flow": float(d.get("instant_flow") or 0),
+            "instant_pressure": float(d.get("instant_pressure") or 0),
+            "measurement_time": d["measurement_time"].isoformat(),
+        }
+    return out
+
 def list_instant_flow_daily(meter_id: str, day_utc: datetime) -> List[Dict[str, Any]]:
     """
     Tất cả bản ghi trong 1 ngày (UTC) cho meter: [{time, instant_flow, instant_pressure}]
@@ -32,7 +70,7 @@ def list_instant_flow_daily(meter_id: str, day_utc: datetime) -> List[Dict[str,
     start = day_utc.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
     end   = start + timedelta(days=1)
 
-    cur = db[COL].find(
+    cur = db[measurements_collection()].find(
         {"meter_id": _oid(meter_id), "measurement_time": {"$gte": start, "$lt": end}},
         sort=[("measurement_time", 1)]
     )
@@ -44,3 +82,72 @@ def list_instant_flow_daily(meter_id: str, day_utc: datetime) -> List[Dict[str,
             "instant_pressure": float(d.get("instant_pressure", 0)),
         })
     return out
+
+def list_series_raw(meter_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Bản ghi thô trong [start, end): [{time, instant_flow, instant_pressure}]"""
+    db = get_db()
+    cur = db[measurements_collection()].find(
+        {"meter_id": _oid(meter_id), "measurement_time": {"$gte": start, "$lt": end}},
+        {"_id": 0, "measurement_time": 1, "instant_flow": 1, "instant_pressure": 1},
+        sort=[("measurement_time", 1)]
+    )
+    return [{
+        "time": d["measurement_time"].isoformat(),
+        "instant_flow": float(d.get("instant_flow", 0)),
+        "instant_pressure": float(d.get("instant_pressure", 0)),
+    } for d in cur]
+
+def list_series_columns(meter_id: str, start: datetime, end: datetime) -> Dict[str, List[Any]]:
+    """Như list_series_raw nhưng trả theo cột, không dựng dict/isoformat từng
+    điểm (dùng cho downsample): {time: [datetime], instant_flow: [...], instant_pressure: [...]}"""
+    db = get_db()
+    cur = db[measurements_collection()].find(
+        {"meter_id": _oid(meter_id), "measurement_time": {"$gte": start, "$lt": end}},
+        {"_id": 0, "measurement_time": 1, "instant_flow": 1, "instant_pressure": 1},
+        sort=[("measurement_time", 1)]
+    )
+    times: List[datetime] = []
+    flow: List[float] = []
+    pressure: List[float] = []
+    for d in cur:
+        times.append(d["measurement_time"])
+        flow.append(d.get("instant_flow", 0) or 0)
+        pressure.append(d.get("instant_pressure", 0) or 0)
+    return {"time": times, "instant_flow": flow, "instant_pressure": pressure}
+
+def iter_measurements(meter_ids: List[ObjectId], start: datetime, end: datetime, batch_size: int = 2000):
+    """Cursor (lazy) cho export: sort (meter_id, measurement_time) theo idx_meas_meter_time,
+    driver lấy từng batch nên không giữ cả khoảng trong bộ nhớ."""
+    db = get_db()
+    return db[measurements_collection()].find(
+        {"meter_id": {"$in": meter_ids}, "measurement_time": {"$gte": start, "$lt": end}},
+        {"_id": 0, "meter_id": 1, "measurement_time": 1, "instant_flow": 1, "instant_pressure": 1},
+        sort=[("meter_id", 1), ("measurement_time", 1)],
+        batch_size=batch_size,
+    )
+
+def existing_meter_ids(meter_ids: List[ObjectId]) -> set:
+    """Lọc các meter _id có tồn tại (1 query cho cả batch)."""
+    if not meter_ids:
+        return set()
+    db = get_db()
+    return {d["_id"] for d in db.meters.find({"_id": {"$in": meter_ids}}, {"_id": 1})}
+
+def insert_measurements(docs: List[Dict[str, Any]], chunk_size: int = 5000) -> Tuple[int, List[Tuple[int, str]]]:
+    """insert_many unordered theo từng chunk.
+    Trả (số bản ghi đã ghi, [(vị trí trong docs, lỗi)])."""
+    db = get_db()
+    col = db[measurements_collection()]
+    inserted = 0
+    failed: List[Tuple[int, str]] = []
+    for start in range(0, len(docs), chunk_size):
+        chunk = docs[start:start + chunk_size]
+        try:
+            res = col.insert_many(chunk, ordered=False)
+            inserted += len(res.inserted_ids)
+        except errors.BulkWriteError as e:
+            details = e.details or {}
+            inserted += int(details.get("nInserted", 0))
+            for we in details.get("writeErrors", []):
+                failed.append((start + int(we.get("index", 0)), we.get("errmsg", "write error")))
+    return inserted, failed
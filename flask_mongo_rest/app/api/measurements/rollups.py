@@ -0,0 +1,194 @@
+"""Rollup theo giờ / ngày (giờ VN) cho instant_flow, instant_pressure.
+
+Mỗi doc: {meter_id, bucket (UTC đầu giờ/ngày), count, first_time, last_time,
+          flow_sum/min/max/first/last, pressure_sum/min/max/first/last}
+avg = sum / count khi đọc.
+
+- Ghi tăng dần khi ingest (apply_rollups): gom theo bucket trong Python rồi
+  bulk_write upsert bằng update pipeline (1 round trip / chunk).
+- Job catch-up (rebuild_rollups): tính lại từ dữ liệu thô cho khoảng ngày,
+  $merge replace nên chạy lại bao nhiêu lần cũng được.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from ...extensions import get_db
+from ...indexes import declare_index
+from ...utils.time_utils import ASIA_HCM_OFFSET
+from .repo import measurements_collection
+
+HOURLY = "meter_measurements_1h"
+DAILY = "meter_measurements_1d"
+TIMEZONE = "Asia/Ho_Chi_Minh"
+RESOLUTIONS = {"1h": HOURLY, "1d": DAILY}
+
+for _col in (HOURLY, DAILY):
+    declare_index(_col, [("meter_id", ASCENDING), ("bucket", ASCENDING)], unique=True, name="uniq_rollup_meter_bucket")
+
+FIELDS = (("instant_flow", "flow"), ("instant_pressure", "pressure"))
+_OFFSET = timedelta(hours=ASIA_HCM_OFFSET)
+
+
+def hour_bucket(t: datetime) -> datetime:
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(t: datetime) -> datetime:
+    """Đầu ngày theo giờ VN, biểu diễn bằng UTC."""
+    local = (t + _OFFSET).replace(hour=0, minute=0, second=0, microsecond=0)
+    return local - _OFFSET
+
+
+def _as_utc(t: datetime) -> datetime:
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+def _summarize(docs: Iterable[Dict[str, Any]], bucket_fn) -> Dict[Tuple[ObjectId, datetime], Dict[str, Any]]:
+    out: Dict[Tuple[ObjectId, datetime], Dict[str, Any]] = {}
+    for d in docs:
+        t = _as_utc(d["measurement_time"])
+        key = (d["meter_id"], bucket_fn(t))
+        s = out.get(key)
+        if s is None:
+            s = out[key] = {"count": 0, "first_time": t, "last_time": t}
+            for src, short in FIELDS:
+                v = float(d.get(src, 0))
+                s.update({f"{short}_sum": 0.0, f"{short}_min": v, f"{short}_max": v,
+                          f"{short}_first": v, f"{short}_last": v})
+        s["count"] += 1
+        for src, short in FIELDS:
+            v = float(d.get(src, 0))
+            s[f"{short}_sum"] += v
+            if v < s[f"{short}_min"]: s[f"{short}_min"] = v
+            if v > s[f"{short}_max"]: s[f"{short}_max"] = v
+        if t < s["first_time"]:
+            s["first_time"] = t
+            for src, short in FIELDS:
+                s[f"{short}_first"] = float(d.get(src, 0))
+        if t >= s["last_time"]:
+            s["last_time"] = t
+            for src, short in FIELDS:
+                s[f"{short}_last"] = float(d.get(src, 0))
+    return out
+
+
+def _merge_pipeline(s: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Update pipeline gộp 1 summary vào doc rollup (có thể chưa tồn tại)."""
+    is_first = {"$or": [{"$eq": [{"$type": "$first_time"}, "missing"]}, {"$lt": [s["first_time"], "$first_time"]}]}
+    is_last = {"$or": [{"$eq": [{"$type": "$last_time"}, "missing"]}, {"$gte": [s["last_time"], "$last_time"]}]}
+    fields: Dict[str, Any] = {
+        "count": {"$add": [{"$ifNull": ["$count", 0]}, s["count"]]},
+        "first_time": {"$cond": [is_first, s["first_time"], "$first_time"]},
+        "last_time": {"$cond": [is_last, s["last_time"], "$last_time"]},
+    }
+    for _, short in FIELDS:
+        fields[f"{short}_sum"] = {"$add": [{"$ifNull": [f"${short}_sum", 0]}, s[f"{short}_sum"]]}
+        fields[f"{short}_min"] = {"$min": [f"${short}_min", s[f"{short}_min"]]}
+        fields[f"{short}_max"] = {"$max": [f"${short}_max", s[f"{short}_max"]]}
+        fields[f"{short}_first"] = {"$cond": [is_first, s[f"{short}_first"], f"${short}_first"]}
+        fields[f"{short}_last"] = {"$cond": [is_last, s[f"{short}_last"], f"${short}_last"]}
+    return [{"$set": fields}]
+
+
+def apply_rollups(docs: List[Dict[str, Any]], db=None) -> Dict[str, int]:
+    """Cộng dồn các bản ghi vừa ghi vào rollup giờ + ngày."""
+    if not docs:
+        return {HOURLY: 0, DAILY: 0}
+    db = db if db is not None else get_db()
+    result = {}
+    for col, bucket_fn in ((HOURLY, hour_bucket), (DAILY, day_bucket)):
+        summaries = _summarize(docs, bucket_fn)
+        ops = [
+            UpdateOne({"meter_id": mid, "bucket": bucket}, _merge_pipeline(s), upsert=True)
+            for (mid, bucket), s in summaries.items()
+        ]
+        if ops:
+            db[col].bulk_write(ops, ordered=False)
+        result[col] = len(ops)
+    return result
+
+
+def _rebuild_pipeline(start: datetime, end: datetime, unit: str, into: str,
+                      meter_ids: Optional[List[ObjectId]] = None) -> List[Dict[str, Any]]:
+    match: Dict[str, Any] = {"measurement_time": {"$gte": start, "$lt": end}}
+    if meter_ids:
+        match["meter_id"] = {"$in": meter_ids}
+    group: Dict[str, Any] = {
+        "_id": {"meter_id": "$meter_id",
+                "bucket": {"$dateTrunc": {"date": "$measurement_time", "unit": unit, "timezone": TIMEZONE}}},
+        "count": {"$sum": 1},
+        "first_time": {"$first": "$measurement_time"},
+        "last_time": {"$last": "$measurement_time"},
+    }
+    for src, short in FIELDS:
+        group[f"{short}_sum"] = {"$sum": f"${src}"}
+        group[f"{short}_min"] = {"$min": f"${src}"}
+        group[f"{short}_max"] = {"$max": f"${src}"}
+        group[f"{short}_first"] = {"$first": f"${src}"}
+        group[f"{short}_last"] = {"$last": f"${src}"}
+    project = {"_id": 0, "meter_id": "$_id.meter_id", "bucket": "$_id.bucket",
+               **{k: 1 for k in group if k != "_id"}}
+    return [
+        {"$match": match},
+        {"$sort": {"meter_id": 1, "measurement_time": 1}},
+        {"$group": group},
+        {"$project": project},
+        {"$merge": {"into": into, "on": ["meter_id", "bucket"], "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def rebuild_rollups(start: datetime, end: datetime, db=None,
+                    meter_ids: Optional[List[ObjectId]] = None) -> Dict[str, Any]:
+    """Tính lại rollup từ dữ liệu thô cho [start, end), làm tròn ra biên ngày VN
+    để không ghi đè bucket bằng dữ liệu thiếu. Chạy từng ngày cho nhẹ."""
+    db = db if db is not None else get_db()
+    raw = db[measurements_collection()]
+    day = day_bucket(_as_utc(start))
+    end = _as_utc(end)
+    days = 0
+    while day < end:
+        nxt = day + timedelta(days=1)
+        raw.aggregate(_rebuild_pipeline(day, nxt, "hour", HOURLY, meter_ids))
+        raw.aggregate(_rebuild_pipeline(day, nxt, "day", DAILY, meter_ids))
+        day = nxt
+        days += 1
+    return {"days": days}
+
+
+def _rollup_cursor(meter_id: ObjectId, start: datetime, end: datetime, resolution: str, projection: Dict[str, Any]):
+    floor = hour_bucket(start) if resolution == "1h" else day_bucket(start)
+    return get_db()[RESOLUTIONS[resolution]].find(
+        {"meter_id": meter_id, "bucket": {"$gte": floor, "$lt": end}},
+        projection,
+        sort=[("bucket", 1)],
+    )
+
+
+def rollup_columns(meter_id: ObjectId, start: datetime, end: datetime, resolution: str) -> Dict[str, List[Any]]:
+    """Rollup theo cột (không dựng dict từng bucket): {time, count, flow_sum, flow_min, ...}"""
+    keys = ["count"] + [f"{short}_{part}" for _, short in FIELDS for part in ("sum", "min", "max", "first", "last")]
+    cols: Dict[str, List[Any]] = {"time": [], **{k: [] for k in keys}}
+    for d in _rollup_cursor(meter_id, start, end, resolution, {"_id": 0, "bucket": 1, **{k: 1 for k in keys}}):
+        cols["time"].append(d["bucket"])
+        for k in keys:
+            cols[k].append(d.get(k))
+    return cols
+
+
+def list_rollup_series(meter_id: ObjectId, start: datetime, end: datetime, resolution: str) -> List[Dict[str, Any]]:
+    cur = _rollup_cursor(meter_id, start, end, resolution, {"_id": 0, "meter_id": 0})
+    out = []
+    for d in cur:
+        n = d.get("count") or 1
+        row: Dict[str, Any] = {"time": _as_utc(d["bucket"]).isoformat(), "count": d.get("count", 0)}
+        for src, short in FIELDS:
+            row[src] = d.get(f"{short}_sum", 0.0) / n
+            row[f"{src}_min"] = d.get(f"{short}_min")
+            row[f"{src}_max"] = d.get(f"{short}_max")
+            row[f"{src}_first"] = d.get(f"{short}_first")
+            row[f"{src}_last"] = d.get(f"{short}_last")
+        out.append(row)
+    return out
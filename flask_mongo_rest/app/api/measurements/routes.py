@@ -1,22 +1,89 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from .service import get_latest_flow, get_daily_flow
+from .service import (get_latest_flow, get_daily_flow, ingest_measurements, get_flow_series, get_latest_flows,
+                      get_daily_flow_arrays, get_flow_series_arrays)
+from ..common.columnar import negotiate, columnar_response, JSON
+from .export import export_meter
 from ..authz.require import require_permissions
 bp = Blueprint("measurements", __name__, url_prefix="/meters")
 
+@bp.post("/instant-flow:latest")
+@jwt_required()
+@require_permissions("meter:read")
+def latest_instant_flow_many():
+    """
+    Bản ghi mới nhất cho nhiều meter (bản đồ toàn hệ thống).
+    Body: {"meter_ids": [...]} hoặc {"branch_id": ...} / {"company_id": ...}
+    Meter không có dữ liệu đo trả về giá trị null; id không thấy / ngoài phạm vi nằm trong "missing".
+    Scope quá LATEST_MAX_METERS meter: "truncated": true, gửi lại body kèm "cursor": next_cursor.
+    """
+    data = get_latest_flows(request.get_json(silent=True) or {})
+    return jsonify(data), 200
+
 @bp.get("/<mid>/instant-flow")
 @jwt_required()
 @require_permissions("meter:read")
 def latest_instant_flow(mid):
-    print(f"Fetching latest instant flow for meter {mid}...")
     data = get_latest_flow(mid)
     return jsonify(data), 200
 
 @bp.get("/<mid>/instant-flow/daily")
 @jwt_required()
 def daily_instant_flow(mid):
+    """Query: date (YYYY-MM-DD), max_points (tuỳ chọn, giảm điểm bằng LTTB + min/max theo bucket)
+    Accept: application/vnd.apache.arrow.stream | application/x-npz để nhận dạng cột."""
     date_str = request.args.get("date")
     if not date_str:
         return jsonify({"error": "Missing query param 'date' (YYYY-MM-DD)"}), 400
-    data = get_daily_flow(mid, date_str)
+    fmt = negotiate()
+    if fmt != JSON:
+        meta, arrays = get_daily_flow_arrays(mid, date_str, request.args.get("max_points"))
+        return columnar_response(arrays, meta, fmt)
+    data = get_daily_flow(mid, date_str, request.args.get("max_points"))
     return jsonify(data), 200
+
+@bp.get("/<mid>/instant-flow/series")
+@jwt_required()
+@require_permissions("meter:read")
+def instant_flow_series(mid):
+    """
+    Chuỗi flow/pressure trong khoảng thời gian.
+    Query: from, to (ISO-8601 hoặc YYYY-MM-DD; mặc định 24h gần nhất),
+           resolution=raw|1h|1d|auto (auto: chọn tier rẻ nhất theo độ dài khoảng),
+           max_points (tuỳ chọn, giảm điểm bằng LTTB + min/max theo bucket)
+    Accept: application/vnd.apache.arrow.stream | application/x-npz để nhận dạng cột
+            (không dựng dict từng điểm, hợp cho khoảng thời gian dài).
+    """
+    args = (mid, request.args.get("from"), request.args.get("to"), request.args.get("resolution"),
+            request.args.get("max_points"))
+    fmt = negotiate()
+    if fmt != JSON:
+        meta, arrays = get_flow_series_arrays(*args)
+        return columnar_response(arrays, meta, fmt)
+    data = get_flow_series(*args)
+    return jsonify(data), 200
+
+@bp.get("/<mid>/measurements/export")
+@jwt_required()
+@require_permissions("meter:read")
+def export_measurements(mid):
+    """
+    Stream dữ liệu đo của 1 meter.
+    Query: from, to (mặc định 24h gần nhất), format=csv|ndjson (mặc định csv),
+           gzip=1|0 (mặc định theo Accept-Encoding)
+    """
+    return export_meter(mid, request.args.get("from"), request.args.get("to"), request.args.get("format"))
+
+@bp.post("/measurements:batch")
+@jwt_required()
+@require_permissions("measurement:create")
+def ingest_batch():
+    """
+    Ghi nhiều bản ghi đo cho nhiều meter trong 1 request.
+    Body: JSON array hoặc NDJSON (Content-Type: application/x-ndjson), mỗi dòng
+      {meter_id, measurement_time, instant_flow, instant_pressure}
+    Trả về số bản ghi đã ghi và lỗi theo index dòng.
+    """
+    data = ingest_measurements(request.get_data(cache=False), request.content_type or "")
+    status = 200 if data["inserted"] or not data["failed"] else 400
+    return jsonify(data), status
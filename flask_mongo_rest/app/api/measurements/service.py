@@ -1,22 +1,396 @@
-from datetime import datetime, timezone
-from werkzeug.exceptions import NotFound, BadRequest
+import json
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from bson import ObjectId
+from flask import current_app
+from flask_jwt_extended import get_jwt
+from werkzeug.exceptions import NotFound, BadRequest, Forbidden
 from ..meter.repo import get as get_meter  # 
-from .repo import find_latest_instant_flow, list_instant_flow_daily
+from ..meter.repo import branch_ids_in_company, list_meter_refs
+from ..meter.state import record_readings, get_state, get_states
+from ..common.pagination import encode_cursor, decode_cursor
+from ..predictions.online import scorer as online_scorer
+from .repo import (find_latest_instant_flow, find_latest_for_meters, list_instant_flow_daily, existing_meter_ids, insert_measurements,
+                   list_series_raw, list_series_columns)
+from .rollups import apply_rollups, list_rollup_series, rollup_columns, RESOLUTIONS, FIELDS as ROLLUP_FIELDS
+from ...logging_setup import get_logger
+from ...utils.downsample import MIN_POINTS, lttb_indices, envelope
+
+logger = get_logger(__name__)
+
+def _reading_out(r: Dict[str, Any]) -> Dict[str, Any]:
+    t = r["time"]
+    return {
+        "instant_flow": float(r.get("instant_flow") or 0),
+        "instant_pressure": float(r.get("instant_pressure") or 0),
+        "measurement_time": (t if t.tzinfo else t.replace(tzinfo=timezone.utc)).isoformat(),
+    }
 
 def get_latest_flow(mid: str) -> dict:
     if not get_meter(mid):
         raise NotFound("Meter not found")
+    state = get_state(ObjectId(mid), ["last_reading"])
+    if state and state.get("last_reading"):
+        return _reading_out(state["last_reading"])
+    # Chưa có meter_state (chưa backfill): sort trên measurements
     doc = find_latest_instant_flow(mid)
     if not doc:
         raise NotFound("No measurements for this meter")
     return doc
 
-def get_daily_flow(mid: str, date_str: str) -> dict:
+def scope_branch_ids() -> List[ObjectId] | None:
+    """Chi nhánh caller được xem theo JWT; None = admin (không giới hạn)."""
+    claims = get_jwt()
+    if claims.get("branch_id"):
+        return [ObjectId(str(claims["branch_id"]))]
+    if claims.get("company_id"):
+        return branch_ids_in_company(claims["company_id"])
+    return None
+
+def _oid_list(values, field: str) -> List[ObjectId]:
+    if not isinstance(values, list) or not all(isinstance(v, str) and ObjectId.is_valid(v) for v in values):
+        raise BadRequest(f"'{field}' must be a list of ObjectId strings")
+    return [ObjectId(v) for v in dict.fromkeys(values)]
+
+ID_SORT = [("_id", 1)]
+
+def get_latest_flows(body: Dict[str, Any]) -> dict:
+    """Bản ghi mới nhất cho nhiều meter: body {meter_ids: [...]} và/hoặc
+    {branch_id} / {company_id}. Luôn giao với phạm vi của caller.
+    Scope lớn hơn LATEST_MAX_METERS: trả theo trang (_id tăng dần), "truncated": true
+    và "next_cursor" để gửi lại trong body {"cursor": ...}.
+    2 round trip cố định (meters + 1 aggregation) thay vì 2 x N."""
+    if not isinstance(body, dict):
+        raise BadRequest("Body must be a JSON object")
+    limit = int(current_app.config.get("LATEST_MAX_METERS", 2000))
+    meter_ids = None
+    if "meter_ids" in body:
+        meter_ids = _oid_list(body["meter_ids"], "meter_ids")
+        if len(meter_ids) > limit:
+            raise BadRequest(f"Too many meter_ids (max {limit})")
+
+    branch_ids = None
+    if body.get("branch_id"):
+        branch_ids = _oid_list([body["branch_id"]], "branch_id")
+    elif body.get("company_id"):
+        branch_ids = branch_ids_in_company(_oid_list([body["company_id"]], "company_id")[0])
+    if meter_ids is None and branch_ids is None:
+        raise BadRequest("Provide 'meter_ids', 'branch_id' or 'company_id'")
+
+    allowed = scope_branch_ids()
+    if allowed is not None:
+        if branch_ids is not None and not set(branch_ids) <= set(allowed):
+            raise Forbidden("Scope outside of your company/branch")
+        branch_ids = branch_ids if branch_ids is not None else allowed
+
+    after = decode_cursor(body["cursor"], ID_SORT)["_id"] if body.get("cursor") else None
+    refs = list_meter_refs(meter_ids, branch_ids, limit + 1, after)
+    truncated = len(refs) > limit
+    refs = refs[:limit]
+    ids = [m["_id"] for m in refs]
+    latest = {mid: _reading_out(s["last_reading"])
+              for mid, s in get_states(ids, ["last_reading"]).items() if s.get("last_reading")}
+    # meter chưa có meter_state: 1 aggregation cho phần còn thiếu
+    missing_state = [i for i in ids if i not in latest]
+    if missing_state:
+        latest.update(find_latest_for_meters(missing_state))
+    items = []
+    for m in refs:
+        reading = latest.get(m["_id"])
+        items.append({
+            "meter_id": str(m["_id"]),
+            "meter_name": m.get("meter_name"),
+            "branch_id": str(m["branch_id"]) if m.get("branch_id") else None,
+            **(reading or {"instant_flow": None, "instant_pressure": None, "measurement_time": None}),
+        })
+    data: Dict[str, Any] = {"items": items, "truncated": truncated,
+                            "next_cursor": encode_cursor(refs[-1], ID_SORT) if truncated else None}
+    if meter_ids is not None and after is None:
+        # id không tồn tại hoặc ngoài phạm vi
+        found = {m["_id"] for m in refs}
+        data["missing"] = [str(i) for i in meter_ids if i not in found]
+    return data
+
+def _day_start(date_str: str) -> datetime:
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise BadRequest("Invalid date format, expected YYYY-MM-DD")
+
+def get_daily_flow(mid: str, date_str: str, max_points: str | None = None) -> dict:
+    if not get_meter(mid):
+        raise NotFound("Meter not found")
+    day = _day_start(date_str)
+    n_out = parse_max_points(max_points)
+    if n_out is None:
+        items = list_instant_flow_daily(mid, day)
+        return {"items": items}
+    meta, arrays = get_daily_flow_arrays(mid, date_str, max_points)
+    return {"items": arrays_to_rows(arrays), "total_points": meta["total_points"]}
+
+def get_daily_flow_arrays(mid: str, date_str: str, max_points: str | None = None) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Như get_daily_flow nhưng trả cột NumPy (cho response Arrow / npz)."""
     if not get_meter(mid):
         raise NotFound("Meter not found")
+    day = _day_start(date_str)
+    n_out = parse_max_points(max_points)
+    arrays = raw_arrays(list_series_columns(mid, day, day + timedelta(days=1)))
+    meta = {"meter_id": mid, "date": date_str, "resolution": "raw", "total_points": len(arrays["time"])}
+    if n_out is not None:
+        arrays = downsample_arrays(arrays, n_out)
+    return meta, arrays
+
+# -----------------------
+# Cột NumPy + downsample (LTTB) cho chart
+# -----------------------
+SERIES_FIELDS = ("instant_flow", "instant_pressure")
+
+def parse_max_points(v: str | None) -> int | None:
+    """max_points trống = trả đủ điểm; bị chặn trên bởi SERIES_MAX_POINTS."""
+    if v in (None, ""):
+        return None
+    try:
+        n = int(v)
+    except (TypeError, ValueError):
+        raise BadRequest("max_points must be an integer")
+    if n < MIN_POINTS:
+        raise BadRequest(f"max_points must be >= {MIN_POINTS}")
+    return min(n, int(current_app.config.get("SERIES_MAX_POINTS", 5000)))
+
+def raw_arrays(cols: Dict[str, List[Any]]) -> Dict[str, np.ndarray]:
+    """Cột từ list_series_columns -> mảng NumPy (time: datetime64[ms] UTC)."""
+    times = [t if t.tzinfo is None else t.astimezone(timezone.utc).replace(tzinfo=None) for t in cols["time"]]
+    return {
+        "time": np.array(times, dtype="datetime64[ms]"),
+        **{f: np.asarray(cols[f], dtype=np.float64) for f in SERIES_FIELDS},
+    }
+
+def rollup_arrays(cols: Dict[str, List[Any]]) -> Dict[str, np.ndarray]:
+    """Cột từ rollup_columns -> avg/min/max/first/last theo field gốc."""
+    count = np.asarray(cols["count"], dtype=np.int64)
+    out: Dict[str, np.ndarray] = {"time": np.array(cols["time"], dtype="datetime64[ms]"), "count": count}
+    safe = np.maximum(count, 1)
+    for src, short in ROLLUP_FIELDS:
+        out[src] = np.asarray(cols[f"{short}_sum"], dtype=np.float64) / safe
+        for part in ("min", "max", "first", "last"):
+            out[f"{src}_{part}"] = np.asarray(cols[f"{short}_{part}"], dtype=np.float64)
+    return out
+
+def downsample_arrays(arrays: Dict[str, np.ndarray], n_out: int) -> Dict[str, np.ndarray]:
+    """Giữ tối đa n_out điểm, chọn theo instant_flow; <field>_min/_max là envelope
+    của bucket mỗi điểm đại diện (dùng cột min/max sẵn có nếu là rollup), count cộng dồn."""
+    n = len(arrays["time"])
+    if n == 0:
+        return arrays
+    x = arrays["time"].astype(np.int64).astype(np.float64)
+    idx, edges = lttb_indices(x, arrays["instant_flow"], n_out)
+    out = {k: v[idx] for k, v in arrays.items()}
+    for f in SERIES_FIELDS:
+        out[f"{f}_min"], out[f"{f}_max"] = envelope(arrays[f], edges,
+                                                    lows=arrays.get(f"{f}_min"), highs=arrays.get(f"{f}_max"))
+    if "count" in arrays:
+        out["count"] = np.add.reduceat(arrays["count"], edges[:-1])
+    return out
+
+def arrays_to_rows(arrays: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Cột -> list dict cho JSON (time ISO-8601 UTC như các endpoint khác)."""
+    times = [t.replace(tzinfo=timezone.utc).isoformat() for t in arrays["time"].astype("datetime64[ms]").tolist()]
+    cols = {k: v.tolist() for k, v in arrays.items() if k != "time"}
+    return [{"time": t, **{k: v[i] for k, v in cols.items()}} for i, t in enumerate(times)]
+
+# -----------------------
+# Series nhiều độ phân giải
+# -----------------------
+RAW_MAX_SPAN = timedelta(days=2)
+HOURLY_MAX_SPAN = timedelta(days=62)
+
+def parse_bound(v: str | None, name: str) -> datetime | None:
+    if not v:
+        return None
     try:
-        day = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        dt = datetime.fromisoformat(v.replace("Z", "+00:00"))
     except ValueError:
-        raise BadRequest("Invalid date format, expected YYYY-MM-DD")
-    items = list_instant_flow_daily(mid, day)
-    return {"items": items}
+        raise BadRequest(f"Invalid '{name}', expected ISO-8601 datetime or YYYY-MM-DD")
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def pick_resolution(start: datetime, end: datetime) -> str:
+    """Tier rẻ nhất vẫn đủ chi tiết: <=2 ngày thô, <=62 ngày theo giờ, còn lại theo ngày."""
+    span = end - start
+    if span <= RAW_MAX_SPAN:
+        return "raw"
+    if span <= HOURLY_MAX_SPAN:
+        return "1h"
+    return "1d"
+
+def _series_range(mid: str, from_str: str | None, to_str: str | None, resolution: str | None):
+    if not get_meter(mid):
+        raise NotFound("Meter not found")
+    end = parse_bound(to_str, "to") or datetime.now(timezone.utc)
+    start = parse_bound(from_str, "from") or end - timedelta(days=1)
+    if start >= end:
+        raise BadRequest("'from' must be before 'to'")
+    resolution = (resolution or "auto").lower()
+    if resolution == "auto":
+        resolution = pick_resolution(start, end)
+    if resolution != "raw" and resolution not in RESOLUTIONS:
+        raise BadRequest("resolution must be one of raw, 1h, 1d, auto")
+    return start, end, resolution
+
+def get_flow_series(mid: str, from_str: str | None, to_str: str | None, resolution: str | None,
+                    max_points: str | None = None) -> dict:
+    n_out = parse_max_points(max_points)
+    if n_out is not None:
+        meta, arrays = get_flow_series_arrays(mid, from_str, to_str, resolution, max_points)
+        return {**meta, "items": arrays_to_rows(arrays)}
+
+    start, end, resolution = _series_range(mid, from_str, to_str, resolution)
+    if resolution == "raw":
+        items = list_series_raw(mid, start, end)
+    else:
+        items = list_rollup_series(ObjectId(mid), start, end, resolution)
+    return {"meter_id": mid, "from": start.isoformat(), "to": end.isoformat(),
+            "resolution": resolution, "items": items}
+
+def get_flow_series_arrays(mid: str, from_str: str | None, to_str: str | None, resolution: str | None,
+                           max_points: str | None = None) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Như get_flow_series nhưng trả (meta, cột NumPy), không dựng dict từng điểm."""
+    n_out = parse_max_points(max_points)
+    start, end, resolution = _series_range(mid, from_str, to_str, resolution)
+    if resolution == "raw":
+        arrays = raw_arrays(list_series_columns(mid, start, end))
+    else:
+        arrays = rollup_arrays(rollup_columns(ObjectId(mid), start, end, resolution))
+    meta = {"meter_id": mid, "from": start.isoformat(), "to": end.isoformat(),
+            "resolution": resolution, "total_points": len(arrays["time"])}
+    if n_out is not None:
+        arrays = downsample_arrays(arrays, n_out)
+    return meta, arrays
+
+# -----------------------
+# Bulk ingestion
+# -----------------------
+def parse_batch_body(raw: bytes, content_type: str) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """JSON array hoặc NDJSON (1 object / dòng). Dòng NDJSON hỏng -> lỗi theo index."""
+    errors: List[Dict[str, Any]] = []
+    text = raw.decode("utf-8", errors="replace")
+    if "ndjson" in (content_type or "") or "jsonlines" in (content_type or ""):
+        rows: List[Any] = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                errors.append({"index": len(rows), "error": f"invalid JSON: {e}"})
+                rows.append(None)
+        return rows, errors
+    try:
+        data = json.loads(text or "null")
+    except ValueError as e:
+        raise BadRequest(f"Invalid JSON body: {e}")
+    if isinstance(data, dict) and isinstance(data.get("items"), list):
+        data = data["items"]
+    if not isinstance(data, list):
+        raise BadRequest("Body must be a JSON array or NDJSON")
+    return data, errors
+
+# measurement_time hợp lệ: [1970-01-01, 2100-01-01) UTC; chặn trước khi đổi để số epoch
+# quá lớn thành lỗi của dòng thay vì OSError / OverflowError làm hỏng cả batch
+MIN_EPOCH, MAX_EPOCH = 0.0, 4102444800.0
+
+def _parse_time(v) -> datetime:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        # epoch giây (hoặc ms nếu quá lớn)
+        ts = v / 1000.0 if v > 1e11 else float(v)
+        if not (MIN_EPOCH <= ts < MAX_EPOCH):
+            raise ValueError("measurement_time is out of range (1970-01-01 .. 2100-01-01)")
+        return datetime.fromtimestamp(ts, tz=timezone.utc)
+    if isinstance(v, str):
+        dt = datetime.fromisoformat(v.replace("Z", "+00:00"))
+        dt = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+        if not (MIN_EPOCH <= dt.timestamp() < MAX_EPOCH):
+            raise ValueError("measurement_time is out of range (1970-01-01 .. 2100-01-01)")
+        return dt
+    raise ValueError("measurement_time must be ISO-8601 string or epoch number")
+
+def _parse_float(v, field: str) -> float:
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError(f"{field} must be a number")
+    f = float(v)
+    if not math.isfinite(f):
+        raise ValueError(f"{field} must be finite")
+    return f
+
+def validate_rows(rows: List[Any], errors: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Validate cả batch trong 1 vòng lặp (không tạo model pydantic mỗi dòng).
+    Trả (docs hợp lệ, index gốc tương ứng); lỗi được thêm vào errors."""
+    bad = {e["index"] for e in errors}
+    docs: List[Dict[str, Any]] = []
+    positions: List[int] = []
+    for i, row in enumerate(rows):
+        if i in bad:
+            continue
+        if not isinstance(row, dict):
+            errors.append({"index": i, "error": "row must be an object"})
+            continue
+        try:
+            mid = row.get("meter_id")
+            if not isinstance(mid, str) or not ObjectId.is_valid(mid):
+                raise ValueError("meter_id must be a 24-hex ObjectId")
+            doc = {
+                "meter_id": ObjectId(mid),
+                "measurement_time": _parse_time(row.get("measurement_time")),
+                "instant_flow": _parse_float(row.get("instant_flow"), "instant_flow"),
+                "instant_pressure": _parse_float(row.get("instant_pressure"), "instant_pressure"),
+            }
+        except (ValueError, TypeError, OverflowError, OSError) as e:
+            errors.append({"index": i, "error": str(e)})
+            continue
+        docs.append(doc)
+        positions.append(i)
+
+    # meter_id phải tồn tại: 1 query $in cho toàn batch
+    known = existing_meter_ids(list({d["meter_id"] for d in docs}))
+    kept_docs, kept_pos = [], []
+    for d, i in zip(docs, positions):
+        if d["meter_id"] in known:
+            kept_docs.append(d)
+            kept_pos.append(i)
+        else:
+            errors.append({"index": i, "error": "meter not found"})
+    return kept_docs, kept_pos
+
+def ingest_measurements(raw: bytes, content_type: str) -> Dict[str, Any]:
+    cfg = current_app.config
+    rows, errors = parse_batch_body(raw, content_type)
+    max_rows = int(cfg.get("MEAS_BATCH_MAX_ROWS", 100000))
+    if not rows:
+        raise BadRequest("Empty batch")
+    if len(rows) > max_rows:
+        raise BadRequest(f"Too many rows ({len(rows)} > {max_rows})")
+
+    docs, positions = validate_rows(rows, errors)
+    inserted, failed = insert_measurements(docs, chunk_size=int(cfg.get("MEAS_BATCH_CHUNK_SIZE", 5000)))
+    for pos, msg in failed:
+        errors.append({"index": positions[pos], "error": msg})
+    errors.sort(key=lambda e: e["index"])
+
+    written = docs
+    if failed:
+        failed_pos = {pos for pos, _ in failed}
+        written = [d for i, d in enumerate(docs) if i not in failed_pos]
+    if cfg.get("ROLLUP_ON_INGEST", True):
+        apply_rollups(written)
+    record_readings(written)
+    if cfg.get("ONLINE_SCORING", True):
+        online_scorer.observe_many(written)
+
+    logger.info("Ingested %d/%d measurements (%d errors)", inserted, len(rows), len(errors))
+    return {
+        "received": len(rows),
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": errors,
+    }
@@ -0,0 +1,106 @@
+"""Lưu meter_measurements dạng time-series collection (MongoDB >= 5.0).
+
+Quy trình migrate online (app vẫn chạy, ghi vào collection cũ):
+  1) flask migrate-measurements-ts          # tạo collection TS + copy theo batch,
+                                            # chạy lại bao nhiêu lần cũng được (resume)
+  2) đặt MEASUREMENTS_COLLECTION=<ts> rồi restart worker
+  3) flask migrate-measurements-ts          # copy nốt phần đuôi ghi vào collection
+                                            # cũ trước lúc restart
+Tiến độ lưu ở schema_meta {_id: "meas_ts_migration:<target>"} theo _id cuối đã copy.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import ASCENDING, DESCENDING, errors
+
+from .repo import COL
+from ...logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+META_COL = "schema_meta"
+TIME_FIELD = "measurement_time"
+META_FIELD = "meter_id"
+DEFAULT_TARGET = "meter_measurements_ts"
+
+
+def _state_id(target: str) -> str:
+    return f"meas_ts_migration:{target}"
+
+
+def is_timeseries(db, name: str) -> bool:
+    for info in db.list_collections(filter={"name": name}):
+        return info.get("type") == "timeseries"
+    return False
+
+
+def ensure_timeseries_collection(db, name: str = DEFAULT_TARGET, granularity: str = "minutes"):
+    """Tạo collection TS (timeField=measurement_time, metaField=meter_id) + index
+    (meter_id, measurement_time) giống idx_meas_meter_time. Không dùng registry
+    declare_index vì create_index trước sẽ tạo nhầm collection thường."""
+    existing = list(db.list_collections(filter={"name": name}))
+    if existing:
+        if existing[0].get("type") != "timeseries":
+            raise RuntimeError(f"Collection '{name}' exists but is not a time-series collection")
+    else:
+        db.create_collection(name, timeseries={
+            "timeField": TIME_FIELD,
+            "metaField": META_FIELD,
+            "granularity": granularity,
+        })
+        logger.info("Created time-series collection %s (granularity=%s)", name, granularity)
+    db[name].create_index([(META_FIELD, ASCENDING), (TIME_FIELD, DESCENDING)], name="idx_meas_meter_time")
+
+
+def migrate_to_timeseries(db, target: str = DEFAULT_TARGET, source: str = COL,
+                          batch_size: int = 5000, granularity: str = "minutes",
+                          max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Copy source -> target theo thứ tự _id, lưu checkpoint sau mỗi batch."""
+    if source == target:
+        raise ValueError("source and target must differ")
+    ensure_timeseries_collection(db, target, granularity)
+
+    state_id = _state_id(target)
+    state = db[META_COL].find_one({"_id": state_id}) or {}
+    last_id = state.get("last_id")
+    pending = state.get("pending_until")
+    copied = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        flt = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = list(db[source].find(flt).sort("_id", ASCENDING).limit(batch_size))
+        if not docs:
+            break
+        batch_last = docs[-1]["_id"]
+
+        if pending is not None:
+            # Lần trước dừng giữa chừng batch này: bỏ các doc đã vào target
+            ids = [d["_id"] for d in docs if d["_id"] <= pending]
+            done = {d["_id"] for d in db[target].find({"_id": {"$in": ids}}, {"_id": 1})}
+            docs = [d for d in docs if d["_id"] not in done]
+            pending = None
+
+        db[META_COL].update_one({"_id": state_id}, {"$set": {"pending_until": batch_last}}, upsert=True)
+        if docs:
+            try:
+                db[target].insert_many(docs, ordered=False)
+            except errors.BulkWriteError as e:
+                logger.error("Batch ending at %s had write errors: %s", batch_last,
+                             (e.details or {}).get("writeErrors", [])[:3])
+                raise
+        last_id = batch_last
+        copied += len(docs)
+        batches += 1
+        db[META_COL].update_one(
+            {"_id": state_id},
+            {"$set": {"last_id": last_id, "source": source, "updated_at": datetime.now(timezone.utc)},
+             "$unset": {"pending_until": ""},
+             "$inc": {"copied": len(docs)}},
+            upsert=True,
+        )
+        logger.info("Copied %d docs to %s (last _id %s)", len(docs), target, last_id)
+
+    remaining = db[source].count_documents({"_id": {"$gt": last_id}} if last_id is not None else {})
+    return {"target": target, "copied": copied, "batches": batches,
+            "last_id": str(last_id) if last_id is not None else None, "remaining": remaining}
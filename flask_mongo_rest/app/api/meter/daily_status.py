@@ -0,0 +1,219 @@
+"""Trạng thái theo ngày (giờ VN) của từng meter cho /meters/with_status/.
+
+meter_daily_status: 1 doc / (meter_id, date)
+  {meter_id, date "YYYY-MM-DD", status, prediction_time, prediction_id,
+   meter_name, branch_id, company_id}
+
+- Ghi khi có prediction (record_daily_status), chỉ thay nếu prediction mới hơn.
+- Ngày được "mở" (ensure_day) lần đầu khi có người xem hoặc khi backfill: thêm
+  dòng no_prediction cho mọi meter rồi áp prediction mới nhất của ngày đó.
+  Đánh dấu trong schema_meta {_id: "daily_status:<date>"}. Khi xem chỉ tự mở các
+  ngày trong DAILY_STATUS_WINDOW_DAYS gần nhất; ngày cũ hơn phải backfill trước.
+- Danh sách đọc thẳng collection này theo index (date, branch/company, meter_name, _id);
+  address lấy từ branches cho các chi nhánh trong trang (sửa chi nhánh thấy ngay, kể cả ngày cũ).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from ...extensions import get_db
+from ...indexes import declare_index
+from ...logging_setup import get_logger
+from ...utils.time_utils import ASIA_HCM_OFFSET, day_bounds_utc
+from ..common.pagination import parse_sort, apply_keyset, encode_cursor
+from ..predictions.repo import COL as PRED_COL
+
+COL = "meter_daily_status"
+META_COL = "schema_meta"
+NO_PREDICTION = "no_prediction"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+declare_index(COL, [("meter_id", ASCENDING), ("date", ASCENDING)], unique=True, name="uniq_mds_meter_date")
+declare_index(COL, [("date", ASCENDING), ("meter_name", ASCENDING), ("_id", ASCENDING)], name="idx_mds_date_name_id")
+declare_index(COL, [("date", ASCENDING), ("branch_id", ASCENDING), ("meter_name", ASCENDING), ("_id", ASCENDING)],
+              name="idx_mds_date_branch_name_id")
+declare_index(COL, [("date", ASCENDING), ("company_id", ASCENDING), ("meter_name", ASCENDING), ("_id", ASCENDING)],
+              name="idx_mds_date_company_name_id")
+
+SORTABLE = {"_id": True, "meter_name": False}
+
+logger = get_logger(__name__)
+
+_ensured_days: set = set()
+
+
+def local_date(t: datetime) -> str:
+    t = t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+    return (t.astimezone(timezone.utc) + timedelta(hours=ASIA_HCM_OFFSET)).strftime("%Y-%m-%d")
+
+
+def meter_refs(meter_ids: Iterable[ObjectId], db=None) -> Dict[ObjectId, Dict[str, Any]]:
+    """{meter_id: {meter_name, branch_id, company_id}} bằng 2 query (meters, branches)."""
+    db = db if db is not None else get_db()
+    ids = list(meter_ids)
+    flt = {"_id": {"$in": ids}} if ids else {}
+    meters = list(db.meters.find(flt, {"meter_name": 1, "branch_id": 1}))
+    branches = {b["_id"]: b for b in db.branches.find(
+        {"_id": {"$in": list({m.get("branch_id") for m in meters})}}, {"company_id": 1})}
+    out = {}
+    for m in meters:
+        b = branches.get(m.get("branch_id"), {})
+        out[m["_id"]] = {"meter_name": m.get("meter_name"), "branch_id": m.get("branch_id"),
+                         "company_id": b.get("company_id")}
+    return out
+
+
+def _status_op(meter_id: ObjectId, date: str, refs: Dict[str, Any], pred: Optional[Dict[str, Any]]) -> UpdateOne:
+    """Upsert (meter, date); thông tin meter chỉ điền khi thiếu, prediction chỉ thay khi mới hơn."""
+    fields: Dict[str, Any] = {k: {"$ifNull": [f"${k}", {"$literal": v}]} for k, v in refs.items()}
+    fields["status"] = {"$ifNull": ["$status", NO_PREDICTION]}
+    if pred is not None:
+        newer = {"$gt": [pred["prediction_time"], {"$ifNull": ["$prediction_time", EPOCH]}]}
+        fields["status"] = {"$cond": [newer, {"$literal": pred.get("predicted_label") or NO_PREDICTION}, "$status"]}
+        fields["prediction_time"] = {"$cond": [newer, pred["prediction_time"], "$prediction_time"]}
+        fields["prediction_id"] = {"$cond": [newer, pred.get("_id"), "$prediction_id"]}
+    return UpdateOne({"meter_id": meter_id, "date": date}, [{"$set": fields}], upsert=True)
+
+
+def record_daily_status(preds: Iterable[Dict[str, Any]], db=None) -> int:
+    """Gọi sau khi ghi predictions (docs có _id, meter_id, prediction_time, predicted_label)."""
+    db = db if db is not None else get_db()
+    latest: Dict[Tuple[ObjectId, str], Dict[str, Any]] = {}
+    for p in preds:
+        key = (p["meter_id"], local_date(p["prediction_time"]))
+        cur = latest.get(key)
+        if cur is None or p["prediction_time"] > cur["prediction_time"]:
+            latest[key] = p
+    if not latest:
+        return 0
+    refs = meter_refs({mid for mid, _ in latest}, db)
+    ops = [_status_op(mid, date, refs.get(mid, {}), p) for (mid, date), p in latest.items() if mid in refs]
+    if ops:
+        db[COL].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def _latest_predictions_of_day(db, date: str) -> List[Dict[str, Any]]:
+    _, start_utc, end_utc = day_bounds_utc(date)
+    pipeline = [
+        {"$match": {"prediction_time": {"$gte": start_utc, "$lt": end_utc}}},
+        {"$sort": {"meter_id": 1, "prediction_time": -1}},
+        {"$group": {"_id": "$meter_id", "doc": {"$first": {
+            "_id": "$_id", "meter_id": "$meter_id",
+            "prediction_time": "$prediction_time", "predicted_label": "$predicted_label"}}}},
+        {"$replaceRoot": {"newRoot": "$doc"}},
+    ]
+    return list(db[PRED_COL].aggregate(pipeline, allowDiskUse=True))
+
+
+def window_start(days: int) -> str:
+    """Ngày cũ nhất (giờ VN) còn được tự mở khi xem: hôm nay và days - 1 ngày trước."""
+    today, _, _ = day_bounds_utc(None)
+    return (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=max(days, 1) - 1)).strftime("%Y-%m-%d")
+
+
+def is_materialized(date: str, db=None) -> bool:
+    if date in _ensured_days:
+        return True
+    db = db if db is not None else get_db()
+    if db[META_COL].find_one({"_id": f"daily_status:{date}"}, {"_id": 1}):
+        _ensured_days.add(date)
+        return True
+    return False
+
+
+def ensure_day(date: str, db=None, force: bool = False) -> Optional[Dict[str, int]]:
+    """Mở ngày: dòng cho mọi meter + prediction mới nhất trong ngày. Đã mở rồi thì bỏ qua."""
+    db = db if db is not None else get_db()
+    if not force and is_materialized(date, db):
+        return None
+    marker = f"daily_status:{date}"
+
+    refs = meter_refs([], db)
+    ops = [_status_op(mid, date, r, None) for mid, r in refs.items()]
+    if ops:
+        db[COL].bulk_write(ops, ordered=False)
+    applied = record_daily_status(_latest_predictions_of_day(db, date), db)
+    db[META_COL].update_one({"_id": marker}, {"$set": {"updated_at": datetime.now(timezone.utc)}}, upsert=True)
+    _ensured_days.add(date)
+    result = {"meters": len(ops), "predictions": applied}
+    logger.info("meter_daily_status %s: %s", date, result)
+    return result
+
+
+def backfill(days: int, db=None) -> Dict[str, Any]:
+    today, _, _ = day_bounds_utc(None)
+    d0 = datetime.strptime(today, "%Y-%m-%d")
+    out = {}
+    for i in range(days):
+        date = (d0 - timedelta(days=i)).strftime("%Y-%m-%d")
+        out[date] = ensure_day(date, db, force=True)
+    return out
+
+
+def add_meter(meter_id: ObjectId, db=None):
+    """Meter mới: thêm dòng no_prediction cho hôm nay."""
+    db = db if db is not None else get_db()
+    today, _, _ = day_bounds_utc(None)
+    refs = meter_refs([meter_id], db)
+    if meter_id in refs:
+        db[COL].bulk_write([_status_op(meter_id, today, refs[meter_id], None)])
+
+
+def sync_meter(meter_id: ObjectId, db=None):
+    """Meter đổi tên / chi nhánh: cập nhật thông tin denormalize trên mọi dòng của meter."""
+    db = db if db is not None else get_db()
+    refs = meter_refs([meter_id], db).get(meter_id)
+    if refs:
+        db[COL].update_many({"meter_id": meter_id}, {"$set": refs})
+
+
+def delete_meter(meter_id: ObjectId, db=None):
+    db = db if db is not None else get_db()
+    db[COL].delete_many({"meter_id": meter_id})
+
+
+def list_paginated(date: str, page: int, page_size: int, branch_ids: Optional[List[ObjectId]],
+                   company_id: Optional[ObjectId], q: Optional[str], sort: Optional[str],
+                   cursor: Optional[str] = None, materialize: bool = True,
+                   ) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+    """Trả (items, has_next, next_cursor) giống các list khác. Có cursor thì bỏ qua page.
+    materialize=False: chỉ đọc, không mở ngày (ngày ngoài cửa sổ)."""
+    if materialize:
+        ensure_day(date)
+    flt: Dict[str, Any] = {"date": date}
+    if branch_ids is not None:
+        flt["branch_id"] = {"$in": branch_ids}
+    if company_id is not None:
+        flt["company_id"] = company_id
+    if q:
+        flt["meter_name"] = {"$regex": q, "$options": "i"}
+
+    srt = parse_sort(sort, SORTABLE, default="meter_name")
+    flt = apply_keyset(flt, srt, cursor)
+    cur = get_db()[COL].find(flt).sort(srt)
+    if not cursor:
+        cur = cur.skip((page - 1) * page_size)
+    docs = list(cur.limit(page_size + 1))
+
+    has_next = len(docs) > page_size
+    if has_next:
+        docs = docs[:page_size]
+    next_cursor = encode_cursor(docs[-1], srt) if has_next else None
+    addresses = {b["_id"]: b.get("address") for b in get_db().branches.find(
+        {"_id": {"$in": list({d.get("branch_id") for d in docs})}}, {"address": 1})} if docs else {}
+
+    items = []
+    for d in docs:
+        t = d.get("prediction_time")
+        items.append({
+            "id": str(d["meter_id"]),
+            "meter_name": d.get("meter_name"),
+            "address": addresses.get(d.get("branch_id")),
+            "branch_id": str(d["branch_id"]) if d.get("branch_id") else None,
+            "status": d.get("status", NO_PREDICTION),
+            "prediction_time": t.replace(tzinfo=timezone.utc).isoformat() if t else None,
+        })
+    return items, has_next, next_cursor
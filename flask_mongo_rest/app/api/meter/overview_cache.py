@@ -0,0 +1,85 @@
+"""Cache kết quả leak-overview dùng chung cho mọi worker (collection leak_overview_cache).
+
+_id = "<date>|<scope>", {date, scope, value, computed_at, expires_at}
+- Ngày đã qua (giờ VN): expires_at = None, giữ mãi (chỉ bị xoá khi có prediction
+  ghi muộn cho ngày đó).
+- Hôm nay: hết hạn sau LEAK_OVERVIEW_TODAY_TTL giây và bị xoá ngay khi có
+  prediction mới cho hôm nay.
+- total_meters đếm theo danh sách meter hiện tại nên thêm / xoá / chuyển chi nhánh
+  meter thì xoá toàn bộ cache (invalidate_all, hiếm xảy ra).
+Trường hợp thường gặp chỉ tốn 1 lần find_one theo _id. TTL index dọn entry hết hạn.
+
+Chống ghi giá trị cũ khi invalidate chạy trong lúc đang compute: leak_overview_gen
+giữ bộ đếm {_id: <date> | "*", gen}; invalidate tăng gen rồi mới xoá entry. Lúc
+cache miss đọc gen trước compute, ghi entry, đọc lại gen: đổi thì xoá entry vừa
+ghi (invalidate tăng gen sau lần đọc lại thì bước xoá của nó đã dọn entry này).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List
+
+from flask import current_app
+from pymongo import ASCENDING, UpdateOne
+
+from ...extensions import get_db
+from ...indexes import declare_index
+from ...utils.time_utils import day_bounds_utc
+
+COL = "leak_overview_cache"
+GEN_COL = "leak_overview_gen"
+ALL = "*"
+
+declare_index(COL, [("expires_at", ASCENDING)], expireAfterSeconds=0, name="ttl_overview_expires")
+declare_index(COL, [("date", ASCENDING)], name="idx_overview_date")
+
+
+def _today() -> str:
+    return day_bounds_utc(None)[0]
+
+
+def _gens(db, date: str) -> Dict[str, int]:
+    return {d["_id"]: d.get("gen", 0) for d in db[GEN_COL].find({"_id": {"$in": [date, ALL]}})}
+
+
+def _bump(db, keys: List[str]):
+    db[GEN_COL].bulk_write([UpdateOne({"_id": k}, {"$inc": {"gen": 1}}, upsert=True) for k in keys],
+                           ordered=False)
+
+
+def get_or_compute(date: str, scope: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    db = get_db()
+    key = f"{date}|{scope}"
+    now = datetime.now(timezone.utc)
+    doc = db[COL].find_one({"_id": key}, {"value": 1, "expires_at": 1})
+    if doc:
+        exp = doc.get("expires_at")
+        if exp is None or exp.replace(tzinfo=timezone.utc) > now:
+            return doc["value"]
+
+    before = _gens(db, date)
+    value = compute()
+    ttl = float(current_app.config.get("LEAK_OVERVIEW_TODAY_TTL", 30))
+    expires_at = None if date < _today() else now + timedelta(seconds=ttl)
+    db[COL].replace_one(
+        {"_id": key},
+        {"date": date, "scope": scope, "value": value, "computed_at": now, "expires_at": expires_at},
+        upsert=True,
+    )
+    if _gens(db, date) != before:
+        # bị invalidate trong lúc compute: không để lại giá trị cũ (nhất là ngày đã qua, giữ mãi)
+        db[COL].delete_one({"_id": key, "computed_at": now})
+    return value
+
+
+def invalidate_dates(dates: Iterable[str], db=None):
+    dates = sorted(set(dates))
+    if not dates:
+        return
+    db = db if db is not None else get_db()
+    _bump(db, dates)
+    db[COL].delete_many({"date": {"$in": dates}})
+
+
+def invalidate_all(db=None):
+    db = db if db is not None else get_db()
+    _bump(db, [ALL])
+    db[COL].delete_many({})
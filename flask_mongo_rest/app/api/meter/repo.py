@@ -1,16 +1,21 @@
-from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime, timedelta, timezone
-from zoneinfo import ZoneInfo
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 from bson import ObjectId
 from ...extensions import get_db
 from ...utils.bson import to_object_id, oid_str
 from datetime import datetime
 from werkzeug.exceptions import NotFound, Conflict, BadRequest
 from ...extensions import get_db
-from pymongo import errors
+from pymongo import errors, ASCENDING, DESCENDING
 import hashlib
 from bson import ObjectId
+from ...indexes import declare_index
+from ..common.pagination import parse_sort, apply_keyset, encode_cursor
+from ...logging_setup import get_logger, log_doc
+from ..measurements.repo import measurements_collection
+from .state import delete_state
+from . import daily_status, overview_cache
 COL = "meters"
+logger = get_logger(__name__)
 
 # def insert(doc: Dict[str, Any]) -> Dict[str, Any]:
 #     res = get_db()[COL].insert_one(doc)
@@ -18,10 +23,22 @@ COL = "meters"
 
 COL = "meters"
 
+declare_index(COL, [("branch_id", ASCENDING)], name="idx_meter_branch")
+declare_index(COL, [("meter_name", ASCENDING)], name="idx_meter_name")
+# keyset pagination: sort theo (branch_id?, meter_name, _id)
+declare_index(COL, [("meter_name", ASCENDING), ("_id", ASCENDING)], name="idx_meter_name_id")
+declare_index(COL, [("branch_id", ASCENDING), ("meter_name", ASCENDING), ("_id", ASCENDING)], name="idx_meter_branch_name_id")
+
+# field sort được phép (có index) -> unique?
+SORTABLE = {"_id": True, "meter_name": False}
+# Dữ liệu con của meter (xoá kèm trong delete())
+declare_index("meter_manual_thresholds", [("meter_id", ASCENDING), ("set_time", DESCENDING)], name="idx_thresh_meter_time")
+declare_index("meter_consumptions", [("meter_id", ASCENDING), ("recording_date", DESCENDING)], name="idx_consume_meter_month")
+declare_index("meter_repairs", [("meter_id", ASCENDING), ("repair_time", DESCENDING)], name="idx_repair_meter_time")
+
 def _db_to_api(d: dict) -> dict:
-    print(f"{d.keys()}")
     if "_id" in d:
-        print("Converting _id to id for document:", d)
+        log_doc(logger, "Converting _id to id for document:", d)
         d["id"] = oid_str(d.pop("_id"))
     for key in d:
         if isinstance(d[key], ObjectId):
@@ -35,7 +52,7 @@ def _meter_id_from_name(meter_name: str) -> str:
 def find_branch_by_name(branch_name: str) -> Dict[str, Any]:
     db = get_db()
     b = db.branches.find_one({"name": branch_name})
-    print(f"Finding branch by name '{branch_name}':", b)
+    log_doc(logger, "Finding branch by name %r:", b, branch_name)
     if not b:
         raise NotFound(f"Branch '{branch_name}' not found")
     return b
@@ -80,22 +97,21 @@ def insert(doc: dict) -> dict:
     }
     res = get_db()[COL].insert_one(payload)
     payload["_id"] = res.inserted_id
-    print("Insert payload:", payload)
-    print("Inserted ID:", res.inserted_id)
+    log_doc(logger, "Inserted meter:", payload)
     return _db_to_api(payload)
 
 
 def get(mid: str) -> Optional[Dict[str, Any]]:
     d = get_db()[COL].find_one({"_id": to_object_id(mid)})
-    print("Get meter by ID:", mid, "Result:", d)
     if not d: return None
     d["id"] = oid_str(d.pop("_id"))
-    print("Found meter document:", d)
     d["branch_id"] = oid_str(d["branch_id"])
-    print("Converted meter document:", d)
+    log_doc(logger, "Get meter %s:", d, mid)
     return d
 
-def list_paginated(page:int, page_size:int, branch_ids: Optional[list[str]], q: Optional[str], sort: Optional[str]) -> Tuple[List[Dict[str,Any]], bool]:
+def list_paginated(page:int, page_size:int, branch_ids: Optional[list[str]], q: Optional[str], sort: Optional[str],
+                   cursor: Optional[str] = None) -> Tuple[List[Dict[str,Any]], bool, Optional[str]]:
+    """Trả về (items, has_next, next_cursor). Có cursor thì bỏ qua page (keyset)."""
     db = get_db()
     flt: Dict[str, Any] = {}
     if branch_ids:
@@ -103,22 +119,24 @@ def list_paginated(page:int, page_size:int, branch_ids: Optional[list[str]], q:
     if q:
         flt["meter_name"] = {"$regex": q, "$options": "i"}
 
-    srt = [("_id",1)]
-    if sort:
-        field = sort.lstrip("-"); direc = -1 if sort.startswith("-") else 1
-        srt = [(field, direc)]
+    srt = parse_sort(sort, SORTABLE)
+    flt = apply_keyset(flt, srt, cursor)
+
+    cur = db[COL].find(flt).sort(srt)
+    if not cursor:
+        cur = cur.skip((page-1) * page_size)
+    docs = list(cur.limit(page_size+1))
 
-    skip = (page-1) * page_size
-    cur = db[COL].find(flt).sort(srt).skip(skip).limit(page_size+1)
+    has_next = len(docs) > page_size
+    if has_next: docs = docs[:page_size]
+    next_cursor = encode_cursor(docs[-1], srt) if has_next else None
 
     out = []
-    for d in cur:
+    for d in docs:
         d["id"] = oid_str(d.pop("_id"))
         d["branch_id"] = oid_str(d["branch_id"])
         out.append(d)
-    has_next = len(out) > page_size
-    if has_next: out = out[:page_size]
-    return out, has_next
+    return out, has_next, next_cursor
 
 def update(mid: str, patch: Dict[str, Any]) -> bool:
     res = get_db()[COL].update_one({"_id": to_object_id(mid)}, {"$set": patch})
@@ -142,7 +160,7 @@ def delete(mid: str) -> dict:
 
     # 3) Xoá liên quan (đổi lại tên collection/field nếu của bạn khác)
     related = [
-        ("meter_measurements",      "meter_id"),
+        (measurements_collection(), "meter_id"),
         ("meter_manual_thresholds", "meter_id"),
         ("meter_repairs",           "meter_id"),
         ("meter_consumptions",      "meter_id"),
@@ -150,79 +168,59 @@ def delete(mid: str) -> dict:
     for col, field in related:
         r = db[col].delete_many({field: id_query})
         result[col] = r.deleted_count
+    delete_state(oid, db)
+    daily_status.delete_meter(oid, db)
+    overview_cache.invalidate_all(db)
 
     # 4) Có thể thêm ghi log tại đây
 
     return result
 
 
-def list_meters_with_status(date_str: str | None = None) -> List[Dict[str, Any]]:
-    db = get_db()
-
-    # Nếu không truyền thì mặc định hôm nay theo giờ VN
-    vn = ZoneInfo("Asia/Ho_Chi_Minh")
-    if not date_str:
-        date_str = datetime.now(vn).strftime("%Y-%m-%d")
-
-    # Tính khoảng thời gian UTC cho ngày đó
-    d = datetime.strptime(date_str, "%Y-%m-%d").date()
-    start_local = datetime(d.year, d.month, d.day, 0, 0, 0, tzinfo=vn)
-    end_local   = start_local + timedelta(days=1)
-    start_utc, end_utc = start_local.astimezone(timezone.utc), end_local.astimezone(timezone.utc)
-
-    pipeline = [
-        {
-            "$lookup": {
-                "from": "branches",
-                "localField": "branch_id",
-                "foreignField": "_id",
-                "as": "branch"
-            }
-        },
-        {"$unwind": "$branch"},
-        {
-            "$lookup": {
-                "from": "predictions",                 
-                "let": {"mid": "$_id"},
-                "pipeline": [
-                    { 
-                        "$match": { 
-                            "$expr": { "$eq": ["$meter_id", "$$mid"] },
-                            "prediction_time": {"$gte": start_utc, "$lt": end_utc}
-                        } 
-                    },
-                    { "$sort": { "prediction_time": -1 } },
-                    { "$limit": 1 }
-                ],
-                "as": "prediction"
-            }
-        },
-        { "$unwind": { "path": "$prediction", "preserveNullAndEmptyArrays": True } },
-        {
-            "$project": {
-                "_id": 0,
-                "id": { "$toString": "$_id" },
-                "meter_name": 1,
-                "address": "$branch.address",
-                "status": { "$ifNull": ["$prediction.predicted_label", "no_prediction"] },
-                "prediction_time": "$prediction.prediction_time"
-            }
-        }
-    ]
-    
-    result = list(db[COL].aggregate(pipeline))
-    for doc in result:
-        for k, v in doc.items():
-            if isinstance(v, ObjectId):
-                doc[k] = str(v)
-    return result
-
-def count_total_meters(branch_id: Optional[ObjectId] = None) -> int:
+def count_total_meters(branch_id: Optional[ObjectId] = None, company_id: Optional[ObjectId] = None) -> int:
     """
-    Đếm tổng số đồng hồ. Nếu truyền branch_id thì giới hạn theo chi nhánh.
+    Đếm tổng số đồng hồ. Nếu truyền branch_id / company_id thì giới hạn theo chi nhánh / công ty.
     """
     db = get_db()
     query = {}
     if branch_id:
         query["branch_id"] = branch_id
-    return db[COL].count_documents(query)
\ No newline at end of file
+    elif company_id:
+        query["branch_id"] = {"$in": branch_ids_in_company(company_id)}
+    return db[COL].count_documents(query)
+
+def branch_ids_in_company(company_id) -> List[ObjectId]:
+    db = get_db()
+    return [b["_id"] for b in db.branches.find({"company_id": to_object_id(company_id)}, {"_id": 1})]
+
+def iter_meter_ref_chunks(branch_ids: List[ObjectId], chunk_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+    """Mọi meter của các chi nhánh, từng chunk {_id, meter_name, branch_id} theo keyset _id
+    (không giới hạn tổng số như list_meter_refs)."""
+    last = None
+    while True:
+        flt: Dict[str, Any] = {"branch_id": {"$in": branch_ids}}
+        if last is not None:
+            flt["_id"] = {"$gt": last}
+        chunk = list(get_db()[COL].find(flt, {"_id": 1, "meter_name": 1, "branch_id": 1})
+                     .sort("_id", 1).limit(chunk_size))
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]["_id"]
+
+def list_meter_refs(meter_ids: Optional[List[ObjectId]], branch_ids: Optional[List[ObjectId]],
+                    limit: int, after: Optional[ObjectId] = None) -> List[Dict[str, Any]]:
+    """{_id, meter_name, branch_id} của các meter khớp (giao) meter_ids và branch_ids;
+    None = không lọc theo điều kiện đó. Sắp theo _id (keyset sau after) để phần bị cắt
+    bởi limit luôn giống nhau giữa các lần gọi. Dùng idx_meter_branch / _id."""
+    flt: Dict[str, Any] = {}
+    if meter_ids is not None:
+        flt["_id"] = {"$in": meter_ids}
+    if after is not None:
+        flt.setdefault("_id", {})["$gt"] = after
+    if branch_ids is not None:
+        flt["branch_id"] = {"$in": branch_ids}
+    cur = get_db()[COL].find(flt, {"_id": 1, "meter_name": 1, "branch_id": 1}).sort("_id", 1)
+    return list(cur.limit(limit))
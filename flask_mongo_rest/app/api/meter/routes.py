@@ -2,31 +2,29 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt, jwt_required
 from ..authz.require import *
 from .schemas import MeterCreate, MeterUpdate, MeterOut
-from .service import create_meter_admin_only, get_meter, list_meters, update_meter, remove_meter, get_meters_list, build_leak_overview
+from .service import create_meter_admin_only, get_meter, update_meter, remove_meter, get_meters_list, get_leak_overview
+# alias: route /with_status/ bên dưới cũng tên list_meters
+from .service import list_meters as list_meters_scoped
 from ..common.response import json_ok, created, no_content
 from ..common.pagination import parse_pagination, build_links
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, HTTPException
 from typing import Optional, Dict, Any, List, Tuple
-import traceback
+from ...logging_setup import get_logger
 from ...errors import BadRequest
 from datetime import datetime
-from...utils.time_utils import day_bounds_utc
 
 bp = Blueprint("meters", __name__, url_prefix="meters")
+logger = get_logger(__name__)
 
 @bp.post("/")
 @jwt_required()
 @require_password_confirmation()
 @require_role("admin")
 def create():
-    print("Creating meter...")
     try:
-        current_user = get_jwt()
-        print("Current user claims:", current_user)
         data = MeterCreate(**(request.get_json(silent=True) or {}))
-        print("Parsed data:", data)
     except Exception as e:
-        traceback.print_exc()
+        logger.debug("Invalid meter create payload", exc_info=True)
         raise BadRequest(f"Invalid request: {e}")
     m = create_meter_admin_only(data)
     return created(f"/api/v1/meters/{m.id}", m.model_dump())
@@ -39,9 +37,12 @@ def list_():
     page, page_size = parse_pagination(request.args)
     q = request.args.get("q")
     sort = request.args.get("sort")
-    items, has_next = list_meters(page, page_size, q, sort)
-    body = {"items": [MeterOut(**x).model_dump() for x in items], "page": page, "page_size": page_size}
-    links = build_links("/api/v1/meters", page, page_size, has_next, {"q": q or "", "sort": sort or ""})
+    cursor = request.args.get("cursor")
+    items, has_next, next_cursor = list_meters_scoped(page, page_size, q, sort, cursor)
+    body = {"items": [MeterOut(**x).model_dump() for x in items], "page": page, "page_size": page_size,
+            "next_cursor": next_cursor}
+    links = build_links("/api/v1/meters", page, page_size, has_next, {"q": q or "", "sort": sort or ""},
+                        cursor=cursor, next_cursor=next_cursor)
     return json_ok(body, headers={"Link": links})
 
 
@@ -51,12 +52,11 @@ def list_():
 @require_password_confirmation()
 @require_role("admin")
 def update(mid):
-    print(f"Updating meter {mid}...")
     try:
         data = MeterUpdate(**(request.get_json(silent=True) or {}))
     except Exception as e:
         raise BadRequest(str(e))
-    print("Parsed update data:", data)
+    logger.debug("Updating meter %s with %s", mid, data)
     m = update_meter(mid, data)
     return json_ok(MeterOut(**m).model_dump()) if m else json_ok({"error":{"code":"NOT_FOUND","message":"Not found"}}, 404)
 
@@ -76,31 +76,50 @@ def remove(mid):
 @jwt_required()
 @require_role(["admin", "company_manager"])
 def list_meters():
+    """
+    Trạng thái dự đoán trong ngày của từng meter (có phân trang).
+    Query: date (YYYY-MM-DD, mặc định hôm nay giờ VN), branch_id, company_id, q,
+           sort=meter_name|-meter_name|_id, page, page_size | cursor
+    """
     date_str = request.args.get("date")   # ví dụ: /with_status/?date=2025-09-12
-    items = get_meters_list(date_str)
-    return jsonify({"items": items}), 200
+    page, page_size = parse_pagination(request.args)
+    q = request.args.get("q")
+    sort = request.args.get("sort")
+    cursor = request.args.get("cursor")
+    branch_id = request.args.get("branch_id")
+    company_id = request.args.get("company_id")
+    date, items, has_next, next_cursor = get_meters_list(
+        date_str, page, page_size, q, sort, cursor, branch_id, company_id)
+    body = {"items": items, "date": date, "page": page, "page_size": page_size, "next_cursor": next_cursor}
+    params = {k: v for k, v in {"date": date, "q": q, "sort": sort, "branch_id": branch_id,
+                                "company_id": company_id}.items() if v}
+    links = build_links("/api/v1/meters/with_status/", page, page_size, has_next, params,
+                        cursor=cursor, next_cursor=next_cursor)
+    return json_ok(body, headers={"Link": links})
 
 @bp.get("/count/leak-overview")
 @jwt_required()
 @require_role(["admin", "company_manager"])
 def leak_overview():
     """
-    Tổng toàn hệ thống :
+    Tổng trong phạm vi của user (admin: toàn hệ thống, company_manager: công ty mình):
       - total_meters
       - leak_meters (distinct theo meter_id trong ngày)
       - normal_meters
     Query: ?date=YYYY-MM-DD (mặc định: hôm nay theo Asia/Ho_Chi_Minh)
+           ?branch_id=... (tuỳ chọn, chỉ tính trong chi nhánh)
+    Kết quả đọc từ leak_overview_cache (xem overview_cache.py).
     """
     try:
-        date_q = request.args.get("date")
-        date_str, start_utc, end_utc = day_bounds_utc(date_q)
-
-        result = build_leak_overview(start_utc, end_utc)
+        date_str, result = get_leak_overview(request.args.get("date"), request.args.get("branch_id"))
         return jsonify({"success": True, "date": date_str, **result}), 200
 
     except ValueError:
         return jsonify({"success": False, "error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    except (HTTPException, BadRequest):
+        raise
     except Exception:
+        logger.exception("leak-overview failed")
         return jsonify({"success": False, "error": "Internal server error"}), 500
 
 
@@ -7,11 +7,15 @@ from .schemas import MeterCreate, MeterUpdate, MeterOut
 from werkzeug.exceptions import NotFound, Conflict, Forbidden
 from datetime import datetime
 from . import repo
-from ..predictions.repo import count_distinct_leak_meters_in_day
+from . import daily_status, overview_cache
+from ..predictions.repo import count_distinct_leak_meters_in_day, sync_meter_scope
 from flask_jwt_extended import get_jwt
 from bson import ObjectId
 from ...utils.time_utils import day_bounds_utc
-from flask import  request, jsonify
+from flask import  request, jsonify, current_app
+from ...logging_setup import get_logger
+
+logger = get_logger(__name__)
 
 def _get_user_scope():
     claims = get_jwt()
@@ -30,7 +34,7 @@ def _role_name() -> str:
     return claims.get("role_name")
 
 def create_meter_admin_only(data: MeterCreate) -> MeterOut:
-    print("Creating meter with data:", data)
+    logger.debug("Creating meter with data: %s", data)
     if _role_name() != "admin":
         raise Forbidden("Only admin can create meter")
 
@@ -39,14 +43,13 @@ def create_meter_admin_only(data: MeterCreate) -> MeterOut:
     if repo.exists_meter_by_branchid_meterid(
         branch["_id"], repo._meter_id_from_name(data.meter_name)
     ):
-        print(repo.exists_meter_by_branchid_meterid(
-        branch["_id"], repo._meter_id_from_name(data.meter_name)
-    ))
         raise Conflict(
             f"Meter '{data.meter_name}' already exists in branch '{branch['name']}'"
         )
 
     doc = repo.insert_meter(branch["_id"], data.meter_name, data.installation_time)
+    daily_status.add_meter(ObjectId(doc["id"]))
+    overview_cache.invalidate_all()
     doc["branch_name"] = branch["name"]
     return MeterOut(**doc)
 
@@ -61,15 +64,15 @@ def get_meter(mid: str):
             return None
     return m
 
-def list_meters(page:int, page_size:int, q: Optional[str], sort: Optional[str]):
+def list_meters(page:int, page_size:int, q: Optional[str], sort: Optional[str], cursor: Optional[str] = None):
     company_id, branch_id, role_id, role_name = _get_user_scope()
     if branch_id:
-        return repo.list_paginated(page, page_size, [oid_str(branch_id)], q, sort)
+        return repo.list_paginated(page, page_size, [oid_str(branch_id)], q, sort, cursor)
     if company_id:
         branches = _branch_ids_in_company(company_id)
-        return repo.list_paginated(page, page_size, branches, q, sort)
+        return repo.list_paginated(page, page_size, branches, q, sort, cursor)
     # admin: không giới hạn
-    return repo.list_paginated(page, page_size, None, q, sort)
+    return repo.list_paginated(page, page_size, None, q, sort, cursor)
 
 def update_meter(mid: str, data: MeterUpdate):
     # Lấy quyền từ JWT
@@ -82,7 +85,6 @@ def update_meter(mid: str, data: MeterUpdate):
 
     # 2) Lấy meter hiện tại
     cur = repo.get(mid)
-    print("Current meter data:", cur)
     if not cur:
         raise NotFound("Meter not found")
 
@@ -120,6 +122,11 @@ def update_meter(mid: str, data: MeterUpdate):
     ok = repo.update(mid, patch)   # nên trả True/False hoặc doc sau update
     if not ok:
         raise BadRequest("Update failed")
+    if "meter_name" in patch or "branch_id" in patch:
+        daily_status.sync_meter(to_object_id(mid))
+    if "branch_id" in patch:
+        sync_meter_scope([to_object_id(mid)])
+        overview_cache.invalidate_all()
 
     # 7) Trả lại meter sau khi cập nhật
     return repo.get(mid)
@@ -135,29 +142,93 @@ def remove_meter(mid: str):
             return False
     return repo.delete(mid)
 
-def get_meters_list(date_str: str | None = None):
+def get_meters_list(date_str: str | None, page: int, page_size: int, q: Optional[str] = None,
+                    sort: Optional[str] = None, cursor: Optional[str] = None,
+                    branch_id: Optional[str] = None, company_id: Optional[str] = None):
     """
-    Lấy danh sách đồng hồ và trạng thái dự đoán trong ngày.
+    Lấy danh sách đồng hồ và trạng thái dự đoán trong ngày (đọc meter_daily_status).
     - Nếu truyền date_str (YYYY-MM-DD) thì lấy đúng ngày đó
     - Nếu không truyền thì mặc định hôm nay (theo giờ VN)
+    - Chỉ tự dựng dữ liệu cho DAILY_STATUS_WINDOW_DAYS ngày gần nhất; ngày tương lai
+      hoặc ngày cũ hơn chưa backfill -> 400 (xem không được kéo theo ghi cả fleet)
+    - Lọc branch_id / company_id, luôn giới hạn trong phạm vi của user
+    Trả (date, items, has_next, next_cursor).
     """
-    return repo.list_meters_with_status(date_str)
+    try:
+        date, _, _ = day_bounds_utc(date_str)
+    except ValueError:
+        raise BadRequest("Invalid date format. Use YYYY-MM-DD")
+    window = int(current_app.config.get("DAILY_STATUS_WINDOW_DAYS", 30))
+    oldest = daily_status.window_start(window)
+    if date > day_bounds_utc(None)[0]:
+        raise BadRequest("date must not be in the future")
+    if date < oldest and not daily_status.is_materialized(date):
+        raise BadRequest(f"Status is only available for the last {window} days")
+    claims_company, claims_branch, _, _ = _get_user_scope()
+
+    for v, name in ((branch_id, "branch_id"), (company_id, "company_id")):
+        if v and not ObjectId.is_valid(v):
+            raise BadRequest(f"Invalid {name}")
+    branch_ids = [ObjectId(branch_id)] if branch_id else None
+    company = ObjectId(company_id) if company_id else None
+    if claims_branch:
+        if branch_ids and branch_ids != [to_object_id(claims_branch)]:
+            raise Forbidden("Branch outside of your scope")
+        branch_ids = [to_object_id(claims_branch)]
+    elif claims_company:
+        if company and company != to_object_id(claims_company):
+            raise Forbidden("Company outside of your scope")
+        company = to_object_id(claims_company)
+
+    items, has_next, next_cursor = daily_status.list_paginated(
+        date, page, page_size, branch_ids, company, q, sort, cursor, materialize=date >= oldest)
+    return date, items, has_next, next_cursor
 
 def build_leak_overview(
                         start_utc,
                         end_utc,
-                        branch_id: Optional[ObjectId] = None) -> Dict[str, Any]:
+                        branch_id: Optional[ObjectId] = None,
+                        company_id: Optional[ObjectId] = None) -> Dict[str, Any]:
     """
     Tạo overview:
       - total_meters
       - leak_meters (distinct theo meter_id trong ngày)
       - normal_meters = total - leak
-    Có thể truyền branch_id để giới hạn theo chi nhánh (nếu sau này bạn cần).
+    Có thể truyền branch_id / company_id để giới hạn theo chi nhánh / công ty.
     """
-    total = repo.count_total_meters( branch_id=branch_id)
-    leak  = count_distinct_leak_meters_in_day( start_utc, end_utc, branch_id=branch_id)
+    total = repo.count_total_meters( branch_id=branch_id, company_id=company_id)
+    leak  = count_distinct_leak_meters_in_day( start_utc, end_utc, branch_id=branch_id, company_id=company_id)
     return {
         "total_meters": total,
         "leak_meters": leak,
         "normal_meters": max(0, total - leak),
     }
+
+def get_leak_overview(date_str: str | None, branch_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    build_leak_overview qua cache leak_overview_cache (key = ngày + scope).
+    Scope theo JWT giống scope_branch_ids: user có branch_id chỉ xem chi nhánh của mình,
+    user có company_id chỉ xem công ty mình (hoặc 1 chi nhánh trong đó), ngoài scope -> 403.
+    Ngày sai định dạng -> ValueError (giống day_bounds_utc).
+    """
+    date, start_utc, end_utc = day_bounds_utc(date_str)
+    bid = None
+    if branch_id:
+        if not ObjectId.is_valid(branch_id):
+            raise BadRequest("Invalid branch_id")
+        bid = ObjectId(branch_id)
+    claims_company, claims_branch, _, _ = _get_user_scope()
+    cid = None
+    if claims_branch:
+        if bid and bid != to_object_id(claims_branch):
+            raise Forbidden("Branch outside of your scope")
+        bid = to_object_id(claims_branch)
+    elif claims_company:
+        if bid and oid_str(bid) not in _branch_ids_in_company(to_object_id(claims_company)):
+            raise Forbidden("Branch outside of your scope")
+        if not bid:
+            cid = to_object_id(claims_company)
+    scope = f"branch:{bid}" if bid else f"company:{cid}" if cid else "all"
+    value = overview_cache.get_or_compute(
+        date, scope, lambda: build_leak_overview(start_utc, end_utc, branch_id=bid, company_id=cid))
+    return date, value
@@ -0,0 +1,159 @@
+"""Trạng thái "mới nhất" của từng meter, ghi sẵn lúc ghi dữ liệu.
+
+meter_state (_id = meters._id):
+  last_reading     {time, instant_flow, instant_pressure}
+  last_prediction  {time, label, confidence, predicted_threshold, prediction_id}
+  last_repair      {time (= repair_time), recorded_time, leak_reason, ...}
+  active_threshold {time (= set_time), ...}
+
+Mỗi field chỉ được thay khi time mới > time đang lưu (update pipeline có $cond),
+nên ghi trễ / ghi lại không làm lùi trạng thái và upsert an toàn khi chạy song song.
+Đọc "giá trị hiện tại" chỉ còn 1 lần đọc theo _id thay vì sort measurements/predictions.
+rebuild_meter_state() dựng lại từ dữ liệu gốc (backfill / sửa lệch).
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from ...extensions import get_db
+from ...indexes import declare_index
+from ...logging_setup import get_logger
+from ..measurements.repo import measurements_collection
+
+COL = "meter_state"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# /stream/status poll các meter vừa đổi trạng thái
+declare_index(COL, [("updated_at", ASCENDING)], name="idx_state_updated")
+
+logger = get_logger(__name__)
+
+# field trong meter_state -> (collection nguồn, field thời gian)
+SOURCES = {
+    "last_prediction": ("predictions", "prediction_time"),
+    "last_repair": ("meter_repairs", "repair_time"),
+    "active_threshold": ("meter_manual_thresholds", "set_time"),
+}
+
+
+def _advance_op(meter_id: ObjectId, field: str, value: Dict[str, Any]) -> UpdateOne:
+    newer = {"$gt": [value["time"], {"$ifNull": [f"${field}.time", EPOCH]}]}
+    return UpdateOne(
+        {"_id": meter_id},
+        [{"$set": {
+            field: {"$cond": [newer, {"$literal": value}, f"${field}"]},
+            # chỉ đổi khi field thực sự tiến (ghi trễ / ghi lại không làm /stream/status đọc lại)
+            "updated_at": {"$cond": [newer, "$$NOW", "$updated_at"]},
+        }}],
+        upsert=True,
+    )
+
+
+def advance(field: str, values: Dict[ObjectId, Dict[str, Any]], db=None) -> int:
+    """Ghi {meter_id: value} vào field (value phải có "time"), 1 bulk_write."""
+    if not values:
+        return 0
+    db = db if db is not None else get_db()
+    ops = [_advance_op(mid, field, v) for mid, v in values.items()]
+    db[COL].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def _latest_by_meter(docs: Iterable[Dict[str, Any]], time_key: str) -> Dict[ObjectId, Dict[str, Any]]:
+    out: Dict[ObjectId, Dict[str, Any]] = {}
+    for d in docs:
+        cur = out.get(d["meter_id"])
+        if cur is None or d[time_key] > cur[time_key]:
+            out[d["meter_id"]] = d
+    return out
+
+
+def record_readings(docs: Iterable[Dict[str, Any]], db=None) -> int:
+    """Gọi sau khi ghi measurements (docs có meter_id, measurement_time, ...)."""
+    latest = _latest_by_meter(docs, "measurement_time")
+    return advance("last_reading", {
+        mid: {"time": d["measurement_time"],
+              "instant_flow": d.get("instant_flow"),
+              "instant_pressure": d.get("instant_pressure")}
+        for mid, d in latest.items()
+    }, db)
+
+
+def _prediction_value(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {"time": d["prediction_time"],
+            "label": d.get("predicted_label"),
+            "confidence": d.get("confidence"),
+            "predicted_threshold": d.get("predicted_threshold"),
+            "prediction_id": d.get("_id")}
+
+
+def _strip(d: Dict[str, Any], time_key: str) -> Dict[str, Any]:
+    value = {k: v for k, v in d.items() if k not in ("_id", "meter_id", time_key)}
+    value["time"] = d[time_key]
+    return value
+
+
+def record_predictions(docs: Iterable[Dict[str, Any]], db=None) -> int:
+    """Gọi sau khi ghi predictions (docs đã có _id)."""
+    latest = _latest_by_meter(docs, "prediction_time")
+    return advance("last_prediction", {mid: _prediction_value(d) for mid, d in latest.items()}, db)
+
+
+def record_repairs(docs: Iterable[Dict[str, Any]], db=None) -> int:
+    latest = _latest_by_meter(docs, "repair_time")
+    return advance("last_repair", {mid: _strip(d, "repair_time") for mid, d in latest.items()}, db)
+
+
+def record_thresholds(docs: Iterable[Dict[str, Any]], db=None) -> int:
+    latest = _latest_by_meter(docs, "set_time")
+    return advance("active_threshold", {mid: _strip(d, "set_time") for mid, d in latest.items()}, db)
+
+
+def get_state(meter_id: ObjectId, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    proj = {f: 1 for f in fields} if fields else None
+    return get_db()[COL].find_one({"_id": meter_id}, proj)
+
+
+def get_states(meter_ids: List[ObjectId], fields: Optional[List[str]] = None) -> Dict[ObjectId, Dict[str, Any]]:
+    if not meter_ids:
+        return {}
+    proj = {f: 1 for f in fields} if fields else None
+    return {d["_id"]: d for d in get_db()[COL].find({"_id": {"$in": meter_ids}}, proj)}
+
+
+def delete_state(meter_id: ObjectId, db=None):
+    db = db if db is not None else get_db()
+    db[COL].delete_one({"_id": meter_id})
+
+
+def _latest_docs(db, col: str, time_key: str, meter_ids: Optional[List[ObjectId]]) -> List[Dict[str, Any]]:
+    """Bản ghi mới nhất mỗi meter từ collection nguồn ($sort khớp index (meter_id, time desc))."""
+    pipeline: List[Dict[str, Any]] = []
+    if meter_ids:
+        pipeline.append({"$match": {"meter_id": {"$in": meter_ids}}})
+    pipeline += [
+        {"$sort": {"meter_id": 1, time_key: -1}},
+        {"$group": {"_id": "$meter_id", "doc": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$doc"}},
+    ]
+    return list(db[col].aggregate(pipeline, allowDiskUse=True))
+
+
+def rebuild_meter_state(db=None, meter_ids: Optional[List[ObjectId]] = None) -> Dict[str, int]:
+    """Backfill từ measurements / predictions / repairs / thresholds.
+    Dùng cùng đường ghi đơn điệu nên chạy lúc app đang ghi cũng không làm lùi state."""
+    db = db if db is not None else get_db()
+    result = {
+        "last_reading": record_readings(
+            _latest_docs(db, measurements_collection(), "measurement_time", meter_ids), db),
+        "last_prediction": record_predictions(
+            _latest_docs(db, *SOURCES["last_prediction"], meter_ids), db),
+        "last_repair": record_repairs(
+            _latest_docs(db, *SOURCES["last_repair"], meter_ids), db),
+        "active_threshold": record_thresholds(
+            _latest_docs(db, *SOURCES["active_threshold"], meter_ids), db),
+    }
+    logger.info("meter_state rebuilt: %s", result)
+    return result
@@ -0,0 +1,233 @@
+"""Job phát hiện rò rỉ theo lô: đọc measurements của cửa sổ [start, end), ghi predictions.
+
+- Meter chia thành chunk; mỗi chunk = 1 find measurements + 1 aggregation ngưỡng
+  + 1 insert_many predictions + 1 bulk_write meter_state. Chunk chạy song song
+  trên process pool (mỗi process 1 MongoClient riêng).
+- Luật tính bằng NumPy trên cả chunk một lúc (reduceat theo đoạn từng meter,
+  median/MAD bằng lexsort), không lặp theo từng bản ghi:
+    leak                  có ngưỡng thủ công (meter_manual_thresholds.threshold) và
+                          >= leak_fraction số điểm vượt ngưỡng
+    anomaly_high_flow     flow lớn nhất lệch median >= z lần scale
+    anomaly_low_pressure  pressure nhỏ nhất lệch median >= z lần scale
+    normal                còn lại
+  scale = max(MAD * 1.4826, min_rel_scale * |median|, min_scale): MAD = 0 (hơn nửa số
+  điểm bằng nhau, hay gặp với flow lượng tử hoá) thì không để dao động nhỏ thành bất thường.
+  Pressure thiếu là NaN và bị bỏ qua (không coi là 0).
+- Mỗi prediction có window_end; index uniq_pred_meter_model_window chặn nhân bản
+  khi chạy lại cùng cửa sổ.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import MongoClient
+
+from ...logging_setup import get_logger
+from .events import after_predictions_written
+from .repo import register_model, latest_thresholds, insert_predictions
+
+logger = get_logger(__name__)
+
+MODEL_NAME = "rule_leak_detector_v1"
+MAD_SCALE = 1.4826  # MAD -> độ lệch chuẩn nếu phân phối chuẩn
+EPS = 1e-9
+
+DEFAULT_PARAMS = {
+    "z": 3.5,
+    "leak_fraction": 0.8,
+    "min_points": 3,
+    "min_rel_scale": 0.05,
+    "min_scale": 0.05,
+}
+
+
+# -----------------------
+# Luật (NumPy)
+# -----------------------
+def _segment_median(values: np.ndarray, seg: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Median từng đoạn, bỏ qua NaN (đoạn toàn NaN -> NaN); seg không giảm (dữ liệu đã sort theo meter)."""
+    v = values[np.lexsort((values, seg))]  # NaN xếp cuối mỗi đoạn
+    valid = np.add.reduceat((~np.isnan(values)).astype(np.int64), starts)
+    return (v[starts + np.maximum(valid - 1, 0) // 2] + v[starts + valid // 2]) / 2
+
+
+def _scale(mad: np.ndarray, med: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    return np.maximum.reduce([mad * MAD_SCALE, float(params["min_rel_scale"]) * np.abs(med),
+                              np.full_like(mad, max(float(params["min_scale"]), EPS))])
+
+
+def evaluate(flow: np.ndarray, pressure: np.ndarray, starts: np.ndarray, threshold: np.ndarray,
+             params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """flow/pressure nối liền của nhiều meter, starts = vị trí đầu đoạn mỗi meter,
+    threshold = ngưỡng thủ công mỗi meter (NaN nếu không có), pressure thiếu = NaN."""
+    n = len(flow)
+    counts = np.diff(np.append(starts, n))
+    seg = np.repeat(np.arange(len(starts)), counts)
+    z = float(params["z"])
+
+    flow_med = _segment_median(flow, seg, starts)
+    flow_sd = _scale(_segment_median(np.abs(flow - flow_med[seg]), seg, starts), flow_med, params)
+    p_med = _segment_median(pressure, seg, starts)
+    p_sd = _scale(_segment_median(np.abs(pressure - p_med[seg]), seg, starts), p_med, params)
+
+    has_thr = ~np.isnan(threshold)
+    over = flow > np.where(has_thr, threshold, np.inf)[seg]
+    frac_over = np.add.reduceat(over.astype(np.float64), starts) / counts
+    z_flow = (np.maximum.reduceat(flow, starts) - flow_med) / flow_sd
+    # fmin bỏ qua NaN; meter không có pressure nào -> z_p NaN -> không gắn low_pressure
+    z_p = (p_med - np.fmin.reduceat(pressure, starts)) / p_sd
+
+    leak = has_thr & (frac_over >= float(params["leak_fraction"]))
+    high = ~leak & (z_flow >= z)
+    lowp = ~leak & ~high & (z_p >= z)
+    label = np.select([leak, high, lowp], ["leak", "anomaly_high_flow", "anomaly_low_pressure"], "normal")
+    confidence = np.select(
+        [leak, high, lowp],
+        [frac_over, np.clip(z_flow / (2 * z), 0.5, 1.0), np.clip(z_p / (2 * z), 0.5, 1.0)],
+        np.clip(1.0 - frac_over, 0.5, 1.0),
+    )
+    return {
+        "label": label,
+        "confidence": np.round(confidence, 3),
+        "threshold": np.where(has_thr, threshold, flow_med + z * flow_sd),
+        "last_flow": flow[starts + counts - 1],
+        "points": counts,
+    }
+
+
+# -----------------------
+# 1 chunk meter
+# -----------------------
+def _load_columns(db, meas_col: str, meter_ids: List[ObjectId], start: datetime, end: datetime):
+    cur = db[meas_col].find(
+        {"meter_id": {"$in": meter_ids}, "measurement_time": {"$gte": start, "$lt": end}},
+        {"_id": 0, "meter_id": 1, "instant_flow": 1, "instant_pressure": 1},
+        sort=[("meter_id", 1), ("measurement_time", 1)],
+        batch_size=10000,
+    )
+    flow: List[float] = []
+    pressure: List[float] = []
+    starts: List[int] = []
+    seg_ids: List[ObjectId] = []
+    last = None
+    for d in cur:
+        if d["meter_id"] != last:
+            last = d["meter_id"]
+            starts.append(len(flow))
+            seg_ids.append(last)
+        flow.append(d.get("instant_flow") or 0.0)
+        p = d.get("instant_pressure")
+        pressure.append(np.nan if p is None else p)
+    return (np.asarray(flow, dtype=np.float64), np.asarray(pressure, dtype=np.float64),
+            np.asarray(starts, dtype=np.int64), seg_ids)
+
+
+def detect_chunk(db, meas_col: str, meter_ids: List[ObjectId], start: datetime, end: datetime,
+                 model_id: ObjectId, params: Dict[str, Any]) -> Dict[str, int]:
+    flow, pressure, starts, seg_ids = _load_columns(db, meas_col, meter_ids, start, end)
+    if not seg_ids:
+        return {"meters": 0, "inserted": 0, "duplicates": 0, "leak": 0}
+
+    thresholds = latest_thresholds(seg_ids, end, db)
+    thr = np.array([float(thresholds[m].get("threshold", np.nan)) if m in thresholds else np.nan
+                    for m in seg_ids], dtype=np.float64)
+    res = evaluate(flow, pressure, starts, thr, params)
+
+    now = datetime.now(timezone.utc)
+    keep = res["points"] >= int(params["min_points"])
+    docs = [{
+        "meter_id": seg_ids[i],
+        "model_id": model_id,
+        "prediction_time": end,
+        "window_start": start,
+        "window_end": end,
+        "predicted_threshold": round(float(res["threshold"][i]), 3),
+        "predicted_label": str(res["label"][i]),
+        "confidence": float(res["confidence"][i]),
+        "recorded_instant_flow": float(res["last_flow"][i]),
+        "points": int(res["points"][i]),
+        "created_at": now,
+    } for i in np.flatnonzero(keep).tolist()]
+
+    inserted, dup_pos = insert_predictions(docs, db)
+    if dup_pos:
+        dup = set(dup_pos)
+        docs = [d for i, d in enumerate(docs) if i not in dup]
+    after_predictions_written(docs, db)
+    return {"meters": len(seg_ids), "inserted": inserted, "duplicates": len(dup_pos),
+            "leak": sum(1 for d in docs if d["predicted_label"] == "leak")}
+
+
+# -----------------------
+# Process pool
+# -----------------------
+_worker_db = None
+_worker_meas_col = None
+
+
+def _init_worker(uri: str, db_name: str, meas_col: str):
+    global _worker_db, _worker_meas_col
+    _worker_db = MongoClient(uri)[db_name]
+    _worker_meas_col = meas_col
+
+
+def _run_chunk(args: Tuple) -> Dict[str, int]:
+    return detect_chunk(_worker_db, _worker_meas_col, *args)
+
+
+def window_bounds(end: Optional[datetime], window: timedelta) -> Tuple[datetime, datetime]:
+    """Cửa sổ kết thúc ở biên bội số của window (chạy lại cùng lúc -> cùng cửa sổ)."""
+    end = end or datetime.now(timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    step = int(window.total_seconds())
+    end = datetime.fromtimestamp(int(end.timestamp()) // step * step, tz=timezone.utc)
+    return end - window, end
+
+
+def run_detection(db, cfg, meas_col: str, end: Optional[datetime] = None, window: Optional[timedelta] = None,
+                  workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                  params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Chạy 1 cửa sổ cho toàn bộ meter. workers <= 1 thì chạy ngay trong process."""
+    window = window or timedelta(minutes=int(cfg.get("DETECTION_WINDOW_MINUTES", 60)))
+    workers = workers if workers is not None else int(cfg.get("DETECTION_WORKERS", 0)) or (os.cpu_count() or 1)
+    chunk_size = chunk_size or int(cfg.get("DETECTION_CHUNK_SIZE", 500))
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    start, end = window_bounds(end, window)
+
+    model_id = register_model(MODEL_NAME, {
+        "type": "rule_based",
+        "version": 1,
+        "params": params,
+        "window_minutes": int(window.total_seconds() // 60),
+    }, db)
+    meter_ids = [m["_id"] for m in db["meters"].find({}, {"_id": 1}).sort("_id", 1)]
+    chunks = [meter_ids[i:i + chunk_size] for i in range(0, len(meter_ids), chunk_size)]
+    jobs = [(c, start, end, model_id, params) for c in chunks]
+
+    totals = {"meters": 0, "inserted": 0, "duplicates": 0, "leak": 0}
+    pool = None
+    if workers <= 1 or len(chunks) <= 1:
+        results = (detect_chunk(db, meas_col, *j) for j in jobs)
+    else:
+        # spawn: process cha có thread nền (log listener, pymongo monitor) nên không fork
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker,
+                                   initargs=(cfg["MONGO_URI"], cfg["MONGO_DB"], meas_col))
+        results = pool.map(_run_chunk, jobs)
+    try:
+        for r in results:
+            for k in totals:
+                totals[k] += r[k]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    out = {"window_start": start.isoformat(), "window_end": end.isoformat(), "model_id": str(model_id),
+           "chunks": len(chunks), **totals}
+    logger.info("Leak detection: %s", out)
+    return out
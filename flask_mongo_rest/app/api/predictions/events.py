@@ -0,0 +1,15 @@
+"""Việc cần làm sau khi ghi predictions (dùng chung cho job theo lô và chấm điểm online)."""
+from typing import Any, Dict, List
+
+from ..meter.state import record_predictions
+from ..meter.daily_status import record_daily_status, local_date
+from ..meter.overview_cache import invalidate_dates
+
+
+def after_predictions_written(docs: List[Dict[str, Any]], db) -> None:
+    """docs = các prediction đã ghi thành công (bỏ bản trùng)."""
+    if not docs:
+        return
+    record_predictions(docs, db)
+    record_daily_status(docs, db)
+    invalidate_dates({local_date(d["prediction_time"]) for d in docs}, db)
@@ -0,0 +1,201 @@
+"""Chấm điểm bất thường online lúc ingest (EWMA z-score, tính O(1) mỗi bản ghi).
+
+Mỗi meter có EWMA mean/variance của flow và pressure (lưu trong Mongo, xem dưới):
+  z_flow >= Z          -> anomaly_high_flow
+  z_pressure <= -Z     -> anomaly_low_pressure
+  còn lại              -> normal   (chỉ chấm sau ONLINE_WARMUP bản ghi)
+Chỉ ghi prediction khi nhãn của meter đổi (transition), gom theo batch ingest.
+
+State nằm ở online_scorer_state (1 doc / meter, trường v = version), không giữ
+trong process, nên mọi worker dùng chung 1 state. Mỗi batch: 1 find các meter
+trong batch -> tính trong Python -> bulk UpdateOne có điều kiện v không đổi
+(compare-and-swap) -> 1 find kiểm tra token ghi. Meter bị worker khác ghi chen
+thì đọc lại và tính lại (tối đa ONLINE_CAS_RETRIES lần); transition chỉ phát từ
+lần ghi thắng nên không trùng / lệch giữa các worker.
+
+Chi phí: mỗi batch ingest tốn ít nhất 3 round trip Mongo (find state, bulk_write
+CAS, find kiểm tra), cộng 3 round trip mỗi lần thử lại khi tranh chấp, không phụ
+thuộc số bản ghi trong batch. Không còn là phép tính thuần trong bộ nhớ; tắt bằng
+ONLINE_SCORING=0 nếu đường ingest cần nhanh hơn.
+"""
+import math
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ...extensions import get_db
+from ...logging_setup import get_logger
+from .events import after_predictions_written
+from .repo import register_model, insert_predictions
+
+logger = get_logger(__name__)
+
+STATE_COL = "online_scorer_state"
+MODEL_NAME = "online_ewma_v1"
+WRITERS_KEPT = 8
+DUPLICATE_KEY = 11000
+
+
+class MeterStats:
+    __slots__ = ("n", "mean_f", "var_f", "mean_p", "var_p", "label", "last_time", "dirty")
+
+    def __init__(self, d: Optional[Dict[str, Any]] = None):
+        d = d or {}
+        self.n = int(d.get("n", 0))
+        self.mean_f = float(d.get("mean_f", 0.0))
+        self.var_f = float(d.get("var_f", 0.0))
+        self.mean_p = float(d.get("mean_p", 0.0))
+        self.var_p = float(d.get("var_p", 0.0))
+        self.label = d.get("label", "normal")
+        t = d.get("last_time")
+        self.last_time = t.replace(tzinfo=timezone.utc) if t is not None and t.tzinfo is None else t
+        self.dirty = False
+
+    def to_doc(self) -> Dict[str, Any]:
+        return {"n": self.n, "mean_f": self.mean_f, "var_f": self.var_f, "mean_p": self.mean_p,
+                "var_p": self.var_p, "label": self.label, "last_time": self.last_time}
+
+
+class OnlineScorer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._model_id: Optional[ObjectId] = None
+
+    def _params(self):
+        cfg = current_app.config
+        return (float(cfg.get("ONLINE_ALPHA", 0.05)), float(cfg.get("ONLINE_Z", 4.0)),
+                int(cfg.get("ONLINE_WARMUP", 30)))
+
+    def _ensure_model(self, db, alpha: float, z: float, warmup: int):
+        """Đăng ký model 1 lần mỗi process (sau fork thì làm lại)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._model_id = register_model(MODEL_NAME, {
+                "type": "online_ewma", "version": 1,
+                "params": {"alpha": alpha, "z": z, "warmup": warmup},
+            }, db)
+            self._pid = os.getpid()
+
+    def _score_one(self, s: MeterStats, flow: float, pressure: float, alpha: float, z: float, warmup: int):
+        """Trả (label, confidence, threshold) theo state trước khi cập nhật, rồi cập nhật EWMA."""
+        label, confidence = "normal", 0.5
+        sd_f = math.sqrt(s.var_f) if s.var_f > 0 else 0.0
+        if s.n >= warmup:
+            sd_p = math.sqrt(s.var_p) if s.var_p > 0 else 0.0
+            z_f = (flow - s.mean_f) / sd_f if sd_f else 0.0
+            z_p = (pressure - s.mean_p) / sd_p if sd_p else 0.0
+            if z_f >= z:
+                label, confidence = "anomaly_high_flow", min(1.0, z_f / (2 * z))
+            elif z_p <= -z:
+                label, confidence = "anomaly_low_pressure", min(1.0, -z_p / (2 * z))
+            else:
+                confidence = max(0.5, 1.0 - max(abs(z_f), abs(z_p)) / (2 * z))
+        threshold = s.mean_f + z * sd_f
+
+        if s.n == 0:
+            s.mean_f, s.mean_p = flow, pressure
+        else:
+            d = flow - s.mean_f
+            s.mean_f += alpha * d
+            s.var_f = (1 - alpha) * (s.var_f + alpha * d * d)
+            d = pressure - s.mean_p
+            s.mean_p += alpha * d
+            s.var_p = (1 - alpha) * (s.var_p + alpha * d * d)
+        s.n += 1
+        return label, round(max(confidence, 0.5), 3), threshold
+
+    def _step(self, s: MeterStats, readings: List[Dict[str, Any]], alpha: float, z: float,
+              warmup: int) -> List[Dict[str, Any]]:
+        """Chạy các bản ghi (đã sắp theo thời gian) qua state s; trả prediction cho các transition."""
+        out = []
+        for d in readings:
+            t = d["measurement_time"]
+            if s.last_time is not None and t <= s.last_time:
+                continue  # bản ghi trễ / lặp: không chấm lại
+            flow = float(d.get("instant_flow") or 0.0)
+            label, confidence, threshold = self._score_one(
+                s, flow, float(d.get("instant_pressure") or 0.0), alpha, z, warmup)
+            s.last_time, s.dirty = t, True
+            if label != s.label:
+                s.label = label
+                out.append({
+                    "meter_id": d["meter_id"],
+                    "model_id": self._model_id,
+                    "prediction_time": t,
+                    "predicted_threshold": round(threshold, 3),
+                    "predicted_label": label,
+                    "confidence": confidence,
+                    "recorded_instant_flow": flow,
+                    "source": "online",
+                    "created_at": datetime.now(timezone.utc),
+                })
+        return out
+
+    def observe_many(self, docs: Iterable[Dict[str, Any]], db=None) -> int:
+        """Cập nhật state theo các bản ghi vừa ghi; ghi prediction cho các transition.
+        Trả số prediction đã ghi."""
+        db = db if db is not None else get_db()
+        alpha, z, warmup = self._params()
+        retries = int(current_app.config.get("ONLINE_CAS_RETRIES", 5))
+        self._ensure_model(db, alpha, z, warmup)
+
+        by_meter: Dict[ObjectId, List[Dict[str, Any]]] = {}
+        for d in sorted(docs, key=lambda x: x["measurement_time"]):
+            by_meter.setdefault(d["meter_id"], []).append(d)
+
+        out: List[Dict[str, Any]] = []
+        pending = set(by_meter)
+        for _ in range(retries):
+            if not pending:
+                break
+            token = ObjectId()
+            ops, trans = [], {}
+            states = {d["_id"]: d for d in db[STATE_COL].find({"_id": {"$in": list(pending)}})}
+            for mid in pending:
+                doc = states.get(mid)
+                s = MeterStats(doc)
+                t = self._step(s, by_meter[mid], alpha, z, warmup)
+                if not s.dirty:
+                    continue  # toàn bản ghi cũ: không cần ghi
+                trans[mid] = t
+                # CAS theo v: chỉ ghi khi chưa ai ghi sau lần đọc ở trên.
+                # Doc chưa có thì upsert; worker khác chèn trước -> trùng _id -> thua.
+                flt = {"_id": mid, "v": doc["v"]} if doc and "v" in doc else {"_id": mid, "v": {"$exists": False}}
+                ops.append(UpdateOne(flt, {
+                    "$set": s.to_doc(), "$inc": {"v": 1},
+                    "$push": {"writers": {"$each": [token], "$slice": -WRITERS_KEPT}},
+                }, upsert=doc is None))
+            if not ops:
+                break
+            try:
+                db[STATE_COL].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                    raise
+            # writers giữ token của vài lần ghi gần nhất nên vẫn nhận ra lần ghi
+            # của mình dù worker khác đã ghi tiếp ngay sau
+            won = {d["_id"] for d in db[STATE_COL].find({"_id": {"$in": list(trans)}, "writers": token}, {"_id": 1})}
+            for mid in won:
+                out.extend(trans[mid])
+            pending = set(trans) - won
+
+        if pending:
+            logger.warning("Online scorer gave up on %d meters after %d contended attempts", len(pending), retries)
+        if out:
+            _, dup_pos = insert_predictions(out, db)
+            dup = set(dup_pos)
+            after_predictions_written([d for i, d in enumerate(out) if i not in dup], db)
+        return len(out)
+
+
+scorer = OnlineScorer()
@@ -1,45 +1,140 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 from bson import ObjectId
 from ...extensions import get_db
 from ...utils.bson import to_object_id, oid_str
+from ...indexes import declare_index
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateMany, errors
+from typing import Any, Dict, List, Tuple
 
 COL = "predictions"
 
+declare_index(COL, [("meter_id", ASCENDING), ("prediction_time", DESCENDING)], name="idx_pred_meter_time")
+declare_index(COL, [("model_id", ASCENDING)], name="idx_pred_model")
+# Job phát hiện rò rỉ: 1 prediction / (meter, model, cửa sổ) -> chạy lại không nhân bản
+declare_index(COL, [("meter_id", ASCENDING), ("model_id", ASCENDING), ("window_end", ASCENDING)], unique=True,
+              partialFilterExpression={"window_end": {"$exists": True}}, name="uniq_pred_meter_model_window")
+# Đếm leak theo ngày (toàn hệ thống / chi nhánh / công ty): index covered, không $lookup meters
+declare_index(COL, [("predicted_label", ASCENDING), ("prediction_time", ASCENDING), ("meter_id", ASCENDING)],
+              name="idx_pred_label_time_meter")
+declare_index(COL, [("predicted_label", ASCENDING), ("branch_id", ASCENDING), ("prediction_time", ASCENDING),
+                    ("meter_id", ASCENDING)], name="idx_pred_label_branch_time_meter")
+declare_index(COL, [("predicted_label", ASCENDING), ("company_id", ASCENDING), ("prediction_time", ASCENDING),
+                    ("meter_id", ASCENDING)], name="idx_pred_label_company_time_meter")
+# /stats/leaks/breakdown: lọc theo thời gian, group (branch, meter, nhãn) chỉ bằng index
+declare_index(COL, [("prediction_time", ASCENDING), ("branch_id", ASCENDING), ("meter_id", ASCENDING),
+                    ("predicted_label", ASCENDING)], name="idx_pred_time_branch_meter_label")
+declare_index("ai_models", [("name", ASCENDING)], unique=True, name="uniq_model_name")
+
 
 def count_distinct_leak_meters_in_day(
                                       start_utc: datetime,
                                       end_utc: datetime,
-                                      branch_id: Optional[ObjectId] = None) -> int:
+                                      branch_id: Optional[ObjectId] = None,
+                                      company_id: Optional[ObjectId] = None) -> int:
     """
     Đếm số đồng hồ bị rò rỉ trong NGÀY (distinct theo meter_id).
-    Nếu branch_id != None: chỉ tính trong chi nhánh đó.
+    Nếu branch_id / company_id != None: chỉ tính trong chi nhánh / công ty đó
+    (predictions mang sẵn branch_id, company_id, xem attach_meter_scope).
     """
     db = get_db()
-    match_stage = {
-        "predicted_label": "leak",
-        "prediction_time": {"$gte": start_utc, "$lt": end_utc},
-    }
-
-    pipeline = [{"$match": match_stage}]
-
-    # Nếu cần giới hạn theo chi nhánh, join sang meters để lọc branch
+    match_stage: Dict[str, Any] = {"predicted_label": "leak"}
     if branch_id:
-        pipeline += [
-            {"$lookup": {
-                "from": "meters",
-                "localField": "meter_id",
-                "foreignField": "_id",
-                "as": "m"
-            }},
-            {"$unwind": "$m"},
-            {"$match": {"m.branch_id": branch_id}},
-        ]
-
-    pipeline += [
+        match_stage["branch_id"] = branch_id
+    elif company_id:
+        match_stage["company_id"] = company_id
+    match_stage["prediction_time"] = {"$gte": start_utc, "$lt": end_utc}
+
+    pipeline = [
+        {"$match": match_stage},
+        {"$project": {"_id": 0, "meter_id": 1}},  # chỉ cần field trong index -> covered
         {"$group": {"_id": "$meter_id"}},  # distinct meter_id
         {"$count": "leak_meters"}
     ]
 
     doc = list(db[COL].aggregate(pipeline))
-    return int(doc[0]["leak_meters"]) if doc else 0
\ No newline at end of file
+    return int(doc[0]["leak_meters"]) if doc else 0
+
+
+def meter_scopes(meter_ids: List[ObjectId], db=None) -> Dict[ObjectId, Dict[str, Any]]:
+    """{meter_id: {branch_id, company_id}} bằng 2 query (meters, branches)."""
+    db = db if db is not None else get_db()
+    meters = list(db["meters"].find({"_id": {"$in": list(meter_ids)}}, {"branch_id": 1}))
+    companies = {b["_id"]: b.get("company_id") for b in db["branches"].find(
+        {"_id": {"$in": list({m.get("branch_id") for m in meters})}}, {"company_id": 1})}
+    return {m["_id"]: {"branch_id": m.get("branch_id"), "company_id": companies.get(m.get("branch_id"))}
+            for m in meters}
+
+
+def attach_meter_scope(docs: List[Dict[str, Any]], db=None) -> None:
+    """Gắn branch_id / company_id của meter vào các prediction sắp ghi (tại chỗ)."""
+    missing = {d["meter_id"] for d in docs if "branch_id" not in d}
+    if not missing:
+        return
+    scopes = meter_scopes(list(missing), db)
+    for d in docs:
+        if "branch_id" not in d:
+            d.update(scopes.get(d["meter_id"], {"branch_id": None, "company_id": None}))
+
+
+def sync_meter_scope(meter_ids: Optional[List[ObjectId]] = None, db=None, batch_size: int = 500) -> Dict[str, int]:
+    """Ghi lại branch_id / company_id trên predictions của các meter (None = mọi meter).
+    Dùng cho backfill và khi meter đổi chi nhánh; chỉ đụng doc đang lệch nên chạy lại được."""
+    db = db if db is not None else get_db()
+    flt = {"_id": {"$in": list(meter_ids)}} if meter_ids is not None else {}
+    ids = [m["_id"] for m in db["meters"].find(flt, {"_id": 1}).sort("_id", 1)]
+    out = {"meters": 0, "modified": 0}
+    for i in range(0, len(ids), batch_size):
+        scopes = meter_scopes(ids[i:i + batch_size], db)
+        ops = [UpdateMany(
+            {"meter_id": mid, "$or": [{"branch_id": {"$ne": sc["branch_id"]}},
+                                      {"company_id": {"$ne": sc["company_id"]}}]},
+            {"$set": sc},
+        ) for mid, sc in scopes.items()]
+        if ops:
+            out["modified"] += db[COL].bulk_write(ops, ordered=False).modified_count
+        out["meters"] += len(ops)
+    return out
+
+
+def register_model(name: str, info: Dict[str, Any], db=None) -> ObjectId:
+    """Upsert ai_models theo name (uniq_model_name), trả _id."""
+    db = db if db is not None else get_db()
+    now = datetime.now(timezone.utc)
+    doc = db["ai_models"].find_one_and_update(
+        {"name": name},
+        {"$set": {**info, "updated_at": now}, "$setOnInsert": {"name": name, "created_at": now}},
+        upsert=True, return_document=ReturnDocument.AFTER, projection={"_id": 1},
+    )
+    return doc["_id"]
+
+
+def latest_thresholds(meter_ids: List[ObjectId], at: datetime, db=None) -> Dict[ObjectId, Dict[str, Any]]:
+    """Ngưỡng thủ công mới nhất (set_time <= at) của mỗi meter, theo idx_thresh_meter_time."""
+    if not meter_ids:
+        return {}
+    db = db if db is not None else get_db()
+    pipeline = [
+        {"$match": {"meter_id": {"$in": meter_ids}, "set_time": {"$lte": at}}},
+        {"$sort": {"meter_id": 1, "set_time": -1}},
+        {"$group": {"_id": "$meter_id", "doc": {"$first": "$$ROOT"}}},
+    ]
+    return {d["_id"]: d["doc"] for d in db["meter_manual_thresholds"].aggregate(pipeline)}
+
+
+def insert_predictions(docs: List[Dict[str, Any]], db=None) -> Tuple[int, List[int]]:
+    """insert_many unordered; trùng (meter, model, window_end) thì bỏ qua.
+    Trả (số đã ghi, vị trí các doc bị trùng). docs được gắn _id, branch_id, company_id tại chỗ."""
+    if not docs:
+        return 0, []
+    db = db if db is not None else get_db()
+    attach_meter_scope(docs, db)
+    try:
+        res = db[COL].insert_many(docs, ordered=False)
+        return len(res.inserted_ids), []
+    except errors.BulkWriteError as e:
+        details = e.details or {}
+        write_errors = details.get("writeErrors", [])
+        if any(we.get("code") != 11000 for we in write_errors):
+            raise
+        return int(details.get("nInserted", 0)), [int(we["index"]) for we in write_errors]
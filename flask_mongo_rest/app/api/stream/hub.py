@@ -0,0 +1,228 @@
+"""Fan-out sự kiện trong 1 worker cho GET /stream/status (SSE).
+
+1 thread nền / process poll MongoDB mỗi STREAM_POLL_SECONDS (chỉ khi có người nghe):
+  - meter_state theo updated_at (idx_state_updated) -> "reading" khi last_reading mới hơn,
+    "status" khi nhãn last_prediction đổi
+  - alerts theo _id -> "alert"
+rồi đẩy vào queue của từng subscriber hợp scope. N client = 1 luồng query.
+Scope (branch/company) của meter lấy từ bảng meter -> chi nhánh, nạp lại mỗi
+STREAM_REFS_SECONDS để meter chuyển chi nhánh không phát nhầm scope cũ mãi.
+
+Event id = "<epoch>-<seq>", epoch đổi mỗi lần process khởi động. Buffer STREAM_BUFFER
+sự kiện gần nhất để client nối lại bằng Last-Event-ID; không nối được (worker khác,
+quá cũ) thì client nhận event "snapshot" để đồng bộ lại.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from ...extensions import get_db
+from ...logging_setup import get_logger
+from ..alerts.repo import COL as ALERT_COL
+from ..meter.daily_status import meter_refs
+from ..meter.state import COL as STATE_COL
+
+logger = get_logger(__name__)
+
+KINDS = ("status", "alert", "reading")
+OVERLAP = timedelta(seconds=2)  # đọc lùi để không sót doc commit trễ; trùng thì bỏ theo time
+
+
+def _iso(t: Optional[datetime]) -> Optional[str]:
+    return (t if t.tzinfo else t.replace(tzinfo=timezone.utc)).isoformat() if t else None
+
+
+class Event:
+    __slots__ = ("seq", "kind", "branch_id", "company_id", "data")
+
+    def __init__(self, seq: int, kind: str, branch_id, company_id, data: Dict[str, Any]):
+        self.seq, self.kind, self.branch_id, self.company_id, self.data = seq, kind, branch_id, company_id, data
+
+
+class Subscriber:
+    def __init__(self, branch_ids: Optional[List[ObjectId]], kinds: Tuple[str, ...], maxsize: int):
+        self.branch_ids = set(branch_ids) if branch_ids is not None else None
+        self.kinds = kinds
+        self.queue: "queue.Queue[Optional[Event]]" = queue.Queue(maxsize=maxsize)
+        self.lagged = False
+        self.start_id = ""
+
+    def wants(self, e: Event) -> bool:
+        return e.kind in self.kinds and (self.branch_ids is None or e.branch_id in self.branch_ids)
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: List[Subscriber] = []
+        self._buffer: deque = deque()
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self.epoch = ""
+
+    # -----------------------
+    # Subscriber
+    # -----------------------
+    def subscribe(self, app, branch_ids: Optional[List[ObjectId]], kinds: Tuple[str, ...],
+                  last_event_id: Optional[str]) -> Tuple[Subscriber, Optional[List[Event]]]:
+        """Trả (subscriber, sự kiện cần phát lại); None = không nối lại được, cần snapshot."""
+        self._ensure_started(app)
+        sub = Subscriber(branch_ids, kinds, int(app.config.get("STREAM_QUEUE_SIZE", 1000)))
+        with self._lock:
+            self._subs.append(sub)
+            sub.start_id = f"{self.epoch}-{self._last_seq}"
+            replay = self._replay(sub, last_event_id)
+        self._wake.set()
+        return sub, replay
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def _replay(self, sub: Subscriber, last_event_id: Optional[str]) -> Optional[List[Event]]:
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq == self._last_seq:
+            return []
+        if not self._buffer or self._buffer[0].seq > seq + 1:
+            return None  # đã trôi khỏi buffer / có lúc hub nghỉ
+        return [e for e in self._buffer if e.seq > seq and sub.wants(e)]
+
+    def event_id(self, e: Event) -> str:
+        return f"{self.epoch}-{e.seq}"
+
+    # -----------------------
+    # Thread poll
+    # -----------------------
+    def _ensure_started(self, app):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self.epoch = uuid.uuid4().hex[:8]
+            self._buffer = deque(maxlen=int(app.config.get("STREAM_BUFFER", 2000)))
+            self._subs = []
+            self._thread = threading.Thread(target=self._run, args=(app,), name="stream-hub", daemon=True)
+            self._thread.start()
+
+    def _run(self, app):
+        interval = float(app.config.get("STREAM_POLL_SECONDS", 2))
+        with app.app_context():
+            poller = _Poller(get_db(), float(app.config.get("STREAM_REFS_SECONDS", 60)))
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                with self._lock:
+                    idle = not self._subs
+                    if idle and poller.since is not None:
+                        # không ai nghe -> ngừng poll; sự kiện trong lúc nghỉ không có,
+                        # nên id cũ không được nối lại (nhảy seq, xoá buffer)
+                        self._buffer.clear()
+                        self._last_seq = next(self._seq)
+                if idle:
+                    poller.pause()
+                    continue
+                try:
+                    for kind, branch_id, company_id, data in poller.poll():
+                        self._publish(kind, branch_id, company_id, data)
+                except Exception:
+                    logger.exception("stream hub poll failed")
+                    time.sleep(interval)
+
+    def _publish(self, kind: str, branch_id, company_id, data: Dict[str, Any]):
+        with self._lock:
+            e = Event(next(self._seq), kind, branch_id, company_id, data)
+            self._last_seq = e.seq
+            self._buffer.append(e)
+            for sub in list(self._subs):
+                if not sub.wants(e):
+                    continue
+                try:
+                    sub.queue.put_nowait(e)
+                except queue.Full:
+                    # client đọc không kịp: ngắt, client tự nối lại bằng Last-Event-ID
+                    sub.lagged = True
+                    self._subs.remove(sub)
+
+
+class _Poller:
+    """Giữ con trỏ + trạng thái đã thấy; lần poll đầu (hoặc sau khi nghỉ) chỉ lấy mốc, không phát."""
+
+    def __init__(self, db, refs_ttl: float = 60.0):
+        self.db = db
+        self.refs: Dict[ObjectId, Dict[str, Any]] = {}
+        self.refs_ttl = refs_ttl
+        self.refs_at: Optional[float] = None
+        self.pause()
+
+    def pause(self):
+        self.since: Optional[datetime] = None
+        self.alert_after: Optional[ObjectId] = None
+        self.seen: Dict[ObjectId, Tuple[Any, Any]] = {}
+
+    def _ref(self, mid: ObjectId) -> Dict[str, Any]:
+        if mid not in self.refs:
+            self.refs.update(meter_refs([mid], self.db))
+        return self.refs.get(mid, {})
+
+    def poll(self):
+        baseline = self.since is None
+        if baseline or self.refs_at is None or time.monotonic() - self.refs_at >= self.refs_ttl:
+            self.refs = meter_refs([], self.db)
+            self.refs_at = time.monotonic()
+        if baseline:
+            self.since = datetime(1970, 1, 1, tzinfo=timezone.utc)
+            self.alert_after = ObjectId.from_datetime(datetime.now(timezone.utc))
+
+        out = []
+        cur = self.db[STATE_COL].find({"updated_at": {"$gt": self.since - OVERLAP}},
+                                      {"last_reading": 1, "last_prediction": 1, "updated_at": 1})
+        for d in cur:
+            mid = d["_id"]
+            reading, pred = d.get("last_reading") or {}, d.get("last_prediction") or {}
+            prev_time, prev_label = self.seen.get(mid, (None, None))
+            self.seen[mid] = (reading.get("time"), pred.get("label"))
+            if d.get("updated_at") and d["updated_at"].replace(tzinfo=timezone.utc) > self.since:
+                self.since = d["updated_at"].replace(tzinfo=timezone.utc)
+            if baseline:
+                continue
+            ref = self._ref(mid)
+            if reading.get("time") and reading["time"] != prev_time:
+                out.append(("reading", ref.get("branch_id"), ref.get("company_id"), {
+                    "meter_id": str(mid), "time": _iso(reading["time"]),
+                    "instant_flow": reading.get("instant_flow"), "instant_pressure": reading.get("instant_pressure"),
+                }))
+            if pred.get("label") and pred["label"] != prev_label:
+                out.append(("status", ref.get("branch_id"), ref.get("company_id"), {
+                    "meter_id": str(mid), "meter_name": ref.get("meter_name"), "status": pred["label"],
+                    "previous": prev_label, "time": _iso(pred.get("time")),
+                }))
+
+        for a in self.db[ALERT_COL].find({"_id": {"$gt": self.alert_after}}).sort("_id", 1):
+            self.alert_after = a["_id"]
+            out.append(("alert", a.get("branch_id"), a.get("company_id"), {
+                "id": str(a["_id"]), "meter_id": str(a["meter_id"]), "label": a.get("label"),
+                "confidence": a.get("confidence"), "time": _iso(a.get("time")),
+            }))
+        return out
+
+
+hub = Hub()
@@ -0,0 +1,99 @@
+import json
+import queue
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from bson import ObjectId
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask_jwt_extended import jwt_required
+
+from ...errors import BadRequest
+from ..authz.require import require_role
+from ..meter.repo import list_meter_refs
+from ..meter.state import get_states
+from ..measurements.service import scope_branch_ids
+from .hub import KINDS, hub
+
+bp = Blueprint("stream", __name__)
+
+# EventSource không gửi được header Authorization -> nhận thêm ?jwt=
+TOKEN_LOCATIONS = ["headers", "query_string"]
+
+
+def _iso(t: Optional[datetime]) -> Optional[str]:
+    return (t if t.tzinfo else t.replace(tzinfo=timezone.utc)).isoformat() if t else None
+
+
+def _sse(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _snapshot(branch_ids: Optional[List[ObjectId]], limit: int) -> Dict[str, Any]:
+    """Trạng thái hiện tại (meter_state) của các meter trong scope, để client đồng bộ lại."""
+    refs = list_meter_refs(None, branch_ids, limit)
+    states = get_states([m["_id"] for m in refs], ["last_reading", "last_prediction"])
+    items = []
+    for m in refs:
+        st = states.get(m["_id"], {})
+        reading, pred = st.get("last_reading") or {}, st.get("last_prediction") or {}
+        items.append({
+            "meter_id": str(m["_id"]),
+            "meter_name": m.get("meter_name"),
+            "status": pred.get("label"),
+            "status_time": _iso(pred.get("time")),
+            "reading_time": _iso(reading.get("time")),
+            "instant_flow": reading.get("instant_flow"),
+            "instant_pressure": reading.get("instant_pressure"),
+        })
+    return {"meters": items, "truncated": len(refs) >= limit}
+
+
+@bp.get("/status")
+@jwt_required(locations=TOKEN_LOCATIONS)
+@require_role(["admin", "company_manager", "branch_manager"], locations=TOKEN_LOCATIONS)
+def status():
+    """
+    SSE: event "status" (đổi nhãn), "alert" (alert mới), "reading" (số đo mới nhất),
+    "snapshot" khi mới kết nối / không nối lại được. Heartbeat ": ping" mỗi STREAM_HEARTBEAT_SECONDS.
+    Query: ?types=status,alert,reading (mặc định tất cả), ?jwt= cho EventSource (không gửi được header).
+    Nối lại: header Last-Event-ID (EventSource tự gửi) hoặc ?last_event_id=.
+    """
+    kinds = tuple(t for t in (request.args.get("types") or ",".join(KINDS)).split(",") if t)
+    if not kinds or any(k not in KINDS for k in kinds):
+        raise BadRequest(f"types must be a subset of {','.join(KINDS)}")
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    branch_ids = scope_branch_ids()
+
+    app = current_app._get_current_object()
+    cfg = app.config
+    heartbeat = float(cfg.get("STREAM_HEARTBEAT_SECONDS", 15))
+    sub, replay = hub.subscribe(app, branch_ids, kinds, last_event_id)
+    # snapshot đọc ngay trong request (còn app context), trước khi trả stream
+    try:
+        snapshot = _snapshot(branch_ids, int(cfg.get("LATEST_MAX_METERS", 2000))) if replay is None else None
+    except Exception:
+        hub.unsubscribe(sub)
+        raise
+
+    def gen() -> Iterator[str]:
+        try:
+            yield f"retry: {int(cfg.get('STREAM_RETRY_MS', 3000))}\n\n"
+            if snapshot is not None:
+                yield _sse("snapshot", snapshot, sub.start_id)
+            for e in replay or []:
+                yield _sse(e.kind, e.data, hub.event_id(e))
+            while True:
+                try:
+                    e = sub.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    if sub.lagged:
+                        return  # bị hub ngắt vì đọc chậm; client nối lại bằng Last-Event-ID
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(e.kind, e.data, hub.event_id(e))
+        finally:
+            hub.unsubscribe(sub)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(gen()), mimetype="text/event-stream", headers=headers)
@@ -1,5 +1,11 @@
 from ...extensions import get_db
 from ...utils.bson import to_object_id, oid_str
+from ...indexes import declare_index
+from pymongo import ASCENDING
+
+declare_index("user_meters", [("user_id", ASCENDING)], name="idx_um_user")
+declare_index("user_meters", [("meter_id", ASCENDING)], name="idx_um_meter")
+declare_index("user_meters", [("user_id", ASCENDING), ("meter_id", ASCENDING)], unique=True, name="uniq_um")
 
 def list_meters_of_user(user_id: str):
     db = get_db()
@@ -8,8 +8,17 @@ from typing import Dict, Any, Optional
 from bson import ObjectId
 from pymongo import ASCENDING, errors, ReturnDocument
 from werkzeug.exceptions import NotFound, Conflict
+from ...indexes import declare_index
+from ..common.pagination import parse_sort, apply_keyset, encode_cursor
+from ...logging_setup import get_logger, log_doc
 
 COL = "users"
+logger = get_logger(__name__)
+
+declare_index(COL, [("username", ASCENDING)], unique=True, name="uniq_user_username")
+
+# field sort được phép (có index) -> unique?
+SORTABLE = {"_id": True, "username": True}
 
 
 def _oid_str(v) -> str:
@@ -96,41 +105,43 @@ def _build_filter(q: Optional[str]) -> Dict[str, Any]:
     }
 
 def _build_sort(sort: Optional[str]):
-    if not sort:
-        return [("_id", 1)]
-    field = sort.lstrip("-")
-    direction = -1 if sort.startswith("-") else 1
-    return [(field, direction)]
+    return parse_sort(sort, SORTABLE)
 
-def list_users_paginated(page: int, page_size: int, q: Optional[str], sort: Optional[str]) -> Tuple[List[Dict[str, Any]], bool]:
+def list_users_paginated(page: int, page_size: int, q: Optional[str], sort: Optional[str],
+                         cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+    """Trả về (items, has_next, next_cursor). Có cursor thì bỏ qua page (keyset)."""
     db = get_db()
-    flt = _build_filter(q)
     srt = _build_sort(sort)
-    skip = (page - 1) * page_size
-    cur = db[COL].find(flt).sort(srt).skip(skip).limit(page_size + 1)
+    flt = apply_keyset(_build_filter(q), srt, cursor)
+    cur = db[COL].find(flt).sort(srt)
+    if not cursor:
+        cur = cur.skip((page - 1) * page_size)
+    docs = list(cur.limit(page_size + 1))
+    has_next = len(docs) > page_size
+    if has_next:
+        docs = docs[:page_size]
+    next_cursor = encode_cursor(docs[-1], srt) if has_next else None
     out = []
-    for d in cur:
+    for d in docs:
         d["id"] = oid_str(d.pop("_id"))
         out.append(d)
-    has_next = len(out) > page_size
-    if has_next:
-        out = out[:page_size]
-    return out, has_next
+    return out, has_next, next_cursor
 
-def update_user(user_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+def update_user(user_id: str, updates: Dict[str, Any], bump_authz_epoch: bool = False) -> Dict[str, Any]:
     db = get_db()
-    print("Úer ID to update:", user_id)
-
-    user = db[COL].find_one({"_id": ObjectId(user_id)})
-    print("Current user data:", user)
+    user = db[COL].find_one({"_id": ObjectId(user_id)}, {"_id": 1})
     if not user:
-        print("User not found in update_user")
+        logger.info("update_user: user %s not found", user_id)
         raise NotFound("User not found")
 
-    print("Line 125 reached in repo.py with updates:", updates)
+    log_doc(logger, "Updating user %s with:", updates, user_id)
+    change: Dict[str, Any] = {"$set": updates, "$currentDate": {"updated_at": True}}
+    if bump_authz_epoch:
+        # token cũ mang authz_epoch cũ -> require_* sẽ không tin claims nữa
+        change["$inc"] = {"authz_epoch": 1}
     doc = db[COL].find_one_and_update(
         {"_id": ObjectId(user_id)},
-        {"$set": updates, "$currentDate": {"updated_at": True}},
+        change,
         return_document=ReturnDocument.AFTER
     )
     return db_to_api(doc)
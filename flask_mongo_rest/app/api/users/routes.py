@@ -1,5 +1,4 @@
 
-import traceback
 from flask import Blueprint, request
 from .schemas import UserCreate, UserUpdate, UserOut
 from ...errors import BadRequest
@@ -12,8 +11,10 @@ from flask_jwt_extended import jwt_required
 from pydantic import ValidationError
 from .schemas import UserCreate
 from .service import *
+from ...logging_setup import get_logger
 
 bp = Blueprint("users", __name__)
+logger = get_logger(__name__)
 
 @bp.post("/")
 @jwt_required()
@@ -35,13 +36,16 @@ def list_():
     page, page_size = parse_pagination(request.args)
     q = request.args.get("q")
     sort = request.args.get("sort")
-    items, has_next = list_user(page, page_size, q, sort)
+    cursor = request.args.get("cursor")
+    items, has_next, next_cursor = list_user(page, page_size, q, sort, cursor)
     body = {
         "items": [UserOut(**u).model_dump() for u in items],
         "page": page,
-        "page_size": page_size
+        "page_size": page_size,
+        "next_cursor": next_cursor
     }
-    links = build_links("/api/v1/users", page, page_size, has_next, extra_params={"q": q or "", "sort": sort or ""})
+    links = build_links("/api/v1/users", page, page_size, has_next, extra_params={"q": q or "", "sort": sort or ""},
+                        cursor=cursor, next_cursor=next_cursor)
     return json_ok(body, headers={"Link": links})
 
 @bp.get("/<string:uid>")
@@ -62,7 +66,7 @@ def update_user(uid):
     try:
         payload = UserUpdate(**request.get_json(force=True))
     except ValidationError as e:
-        print(traceback.format_exc())
+        logger.debug("Invalid user update payload", exc_info=True)
         return jsonify({"error": "ValidationError", "details": e.errors()}), 422
 
     user = update_user_admin_only(uid, payload)
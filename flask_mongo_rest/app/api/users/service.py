@@ -6,6 +6,11 @@ from typing import Dict, Any
 from bson import ObjectId
 from .schemas import UserCreate, UserOut, UserUpdate
 from . import repo
+from ...extensions import get_db
+from ..authz.cache import invalidate_user
+from ...logging_setup import get_logger
+
+logger = get_logger(__name__)
 
 def _role_name() -> str | None:
     claims = get_jwt()
@@ -30,16 +35,15 @@ def create_user_admin_only(data: UserCreate) -> UserOut:
 def get_user(uid: str):
     return repo.find_by_id(uid)
 
-def list_user(page: int, page_size: int, q: str | None, sort: str | None):
-    return repo.list_users_paginated(page, page_size, q, sort)
+def list_user(page: int, page_size: int, q: str | None, sort: str | None, cursor: str | None = None):
+    return repo.list_users_paginated(page, page_size, q, sort, cursor)
 
 def update_user_admin_only(user_id: str, data: UserUpdate) -> UserOut:
-    print(f"Attempting to update user {user_id} with data: {data}")
+    logger.debug("Updating user %s (fields: %s)", user_id, sorted(data.model_dump(exclude_none=True)))
     if _role_name() != "admin":
         raise Forbidden("Only admin can update users")
 
     updates: Dict[str, Any] = {}
-    print("Line 42 reached")
     # if data.user_name is not None:
     #     # kiểm tra trùng username với user khác
     if repo.username_taken_by_other(data.user_name, user_id):
@@ -48,7 +52,6 @@ def update_user_admin_only(user_id: str, data: UserUpdate) -> UserOut:
     if data.password is not None:
         updates["password"] = _hash_password(data.password)
 
-    print('Line 51 reached')
     if data.role_name is not None:
         role = repo.find_role_by_name(data.role_name)
         updates["role_id"] = role["_id"]
@@ -57,10 +60,13 @@ def update_user_admin_only(user_id: str, data: UserUpdate) -> UserOut:
     if not updates:
         raise BadRequest("No valid fields to update")
 
-    print("Line 60 reached, updates to apply:", updates)
-    out = repo.update_user(user_id, updates)
-    print("Update result:", out)
+    out = repo.update_user(user_id, updates, bump_authz_epoch="role_id" in updates)
+    if "role_id" in updates:
+        invalidate_user(get_db(), user_id)
     return UserOut(**out)
 
 def remove_user(uid: str):
-    return repo.delete_user(uid)
+    ok = repo.delete_user(uid)
+    if ok:
+        invalidate_user(get_db(), uid)
+    return ok
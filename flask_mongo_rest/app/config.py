@@ -1,4 +1,3 @@
-
 import os
 
 class BaseConfig:
@@ -8,8 +7,97 @@ class BaseConfig:
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "change-me-jwt")
     JSON_SORT_KEYS = False
 
+    # Connection pool của MongoClient (1 client / worker process)
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+
+    # "sync" | "background" | "off" — xem app/indexes.py:ensure_indexes_on_boot
+    INDEX_RECONCILE = os.getenv("INDEX_RECONCILE", "sync")
+
+    # Đếm command MongoDB theo request + header Server-Timing
+    MONGO_INSTRUMENTATION = os.getenv("MONGO_INSTRUMENTATION", "1") == "1"
+    SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "1") == "1"
+
+    # Cache role/permission cho @require_role / @require_permissions
+    AUTHZ_CACHE_TTL = int(os.getenv("AUTHZ_CACHE_TTL", "300"))
+    AUTHZ_VERSION_CHECK_SECONDS = int(os.getenv("AUTHZ_VERSION_CHECK_SECONDS", "5"))
+    # "claims": tin role/permissions trong JWT khi authz epoch còn khớp; "db": luôn đọc (cache) từ DB
+    AUTHZ_MODE = os.getenv("AUTHZ_MODE", "claims")
+
+    # Xác nhận mật khẩu: step-up token (POST /auth/confirm) + pool bcrypt
+    STEP_UP_TOKEN_TTL_SECONDS = int(os.getenv("STEP_UP_TOKEN_TTL_SECONDS", "300"))
+    BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", "2"))
+    BCRYPT_TIMEOUT_SECONDS = float(os.getenv("BCRYPT_TIMEOUT_SECONDS", "5"))
+
+    # Tổng số log ở GET /logs: cache theo scope + đếm có trần ("at least N")
+    LOG_TOTAL_CACHE_TTL = int(os.getenv("LOG_TOTAL_CACHE_TTL", "30"))
+    LOG_COUNT_CAP = int(os.getenv("LOG_COUNT_CAP", "10000"))
+
+    # Logging (app/logging_setup.py)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # vd: "app.api.meter=DEBUG,app.api.auth=WARNING"
+    LOG_DOC_SAMPLE_RATE = float(os.getenv("LOG_DOC_SAMPLE_RATE", "0.01"))
+
+    # POST /meters/measurements:batch
+    MEAS_BATCH_MAX_ROWS = int(os.getenv("MEAS_BATCH_MAX_ROWS", "100000"))
+    MEAS_BATCH_CHUNK_SIZE = int(os.getenv("MEAS_BATCH_CHUNK_SIZE", "5000"))
+
+    # Dữ liệu đo: để trống = meter_measurements; đặt tên collection time-series
+    # (vd "meter_measurements_ts") sau khi chạy `flask migrate-measurements-ts`
+    MEASUREMENTS_COLLECTION = os.getenv("MEASUREMENTS_COLLECTION", "")
+    MEAS_TS_GRANULARITY = os.getenv("MEAS_TS_GRANULARITY", "minutes")
+    # Cập nhật rollup giờ/ngày ngay khi ingest (tắt thì dùng `flask rollup-measurements`)
+    ROLLUP_ON_INGEST = os.getenv("ROLLUP_ON_INGEST", "1") == "1"
+    # Trần cho ?max_points= của các endpoint series (LTTB)
+    SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "5000"))
+    # Số meter tối đa cho POST /meters/instant-flow:latest
+    LATEST_MAX_METERS = int(os.getenv("LATEST_MAX_METERS", "2000"))
+    # Export stream: số doc mỗi batch cursor, kích thước chunk gửi đi, số meter mỗi nhóm (export chi nhánh)
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+    EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+    EXPORT_METER_CHUNK = int(os.getenv("EXPORT_METER_CHUNK", "500"))
+    # Job phát hiện rò rỉ (flask detect-leaks); DETECTION_WORKERS=0 -> số CPU
+    DETECTION_WINDOW_MINUTES = int(os.getenv("DETECTION_WINDOW_MINUTES", "60"))
+    DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", "0"))
+    DETECTION_CHUNK_SIZE = int(os.getenv("DETECTION_CHUNK_SIZE", "500"))
+    # Chấm điểm online lúc ingest (EWMA z-score, xem predictions/online.py); state dùng
+    # chung trong Mongo: >= 3 round trip mỗi batch ingest (+3 mỗi lần thử lại CAS)
+    ONLINE_SCORING = os.getenv("ONLINE_SCORING", "1") == "1"
+    ONLINE_ALPHA = float(os.getenv("ONLINE_ALPHA", "0.05"))
+    ONLINE_Z = float(os.getenv("ONLINE_Z", "4.0"))
+    ONLINE_WARMUP = int(os.getenv("ONLINE_WARMUP", "30"))
+    ONLINE_CAS_RETRIES = int(os.getenv("ONLINE_CAS_RETRIES", "5"))
+    # /meters/with_status/: số ngày gần nhất được tự dựng meter_daily_status khi xem
+    # (cũ hơn thì chạy `flask backfill-daily-status --days N` trước)
+    DAILY_STATUS_WINDOW_DAYS = int(os.getenv("DAILY_STATUS_WINDOW_DAYS", "30"))
+    # Cache leak-overview: ngày đã qua giữ mãi, hôm nay hết hạn sau N giây
+    LEAK_OVERVIEW_TODAY_TTL = float(os.getenv("LEAK_OVERVIEW_TODAY_TTL", "30"))
+    # GET /stats/leaks/breakdown: số ngày tối đa của ?from=&to=
+    BREAKDOWN_MAX_DAYS = int(os.getenv("BREAKDOWN_MAX_DAYS", "31"))
+    # Worker sinh alert (flask alerts-worker): nhãn cần cảnh báo, cooldown mỗi meter, polling khi không có replica set
+    ALERT_LABELS = os.getenv("ALERT_LABELS", "leak,anomaly_high_flow,anomaly_low_pressure")
+    ALERT_COOLDOWN_MINUTES = float(os.getenv("ALERT_COOLDOWN_MINUTES", "60"))
+    ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "500"))
+    ALERT_POLL_SECONDS = float(os.getenv("ALERT_POLL_SECONDS", "5"))
+    ALERT_POLL_LOOKBACK_SECONDS = float(os.getenv("ALERT_POLL_LOOKBACK_SECONDS", "300"))
+    # SSE /stream/status: chu kỳ poll của hub (1 luồng / worker), heartbeat, buffer cho Last-Event-ID
+    STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "2"))
+    STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+    STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", "2000"))
+    STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "1000"))
+    STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", "3000"))
+    # Chu kỳ nạp lại meter -> branch/company của hub (meter chuyển chi nhánh)
+    STREAM_REFS_SECONDS = float(os.getenv("STREAM_REFS_SECONDS", "60"))
+
 class DevConfig(BaseConfig):
     DEBUG = True
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+    LOG_DOC_SAMPLE_RATE = float(os.getenv("LOG_DOC_SAMPLE_RATE", "1.0"))
 
 class ProdConfig(BaseConfig):
     DEBUG = False
@@ -1,5 +1,8 @@
 
 from flask import Flask, jsonify
+from .logging_setup import get_logger
+
+logger = get_logger(__name__)
 
 class BadRequest(Exception): ...
 class Unauthorized(Exception): ...
@@ -27,4 +30,5 @@ def register_error_handlers(app: Flask):
 
     @app.errorhandler(500)
     def _500(e):
+        logger.error("Unhandled error: %s", e, exc_info=getattr(e, "original_exception", None) or e)
         return _err({"code": "INTERNAL", "message": "Internal Server Error"}, 500)
@@ -1,68 +1,149 @@
-from pymongo import MongoClient, ASCENDING, DESCENDING
+import os
+import threading
+from pymongo import MongoClient, monitoring
 from flask import current_app, g
 from flask_jwt_extended import JWTManager
+from .instrumentation import command_stats
 
 jwt = JWTManager()
 
+# 1 MongoClient dùng chung cho cả process (worker). Client được tạo lazy ở lần
+# get_db() đầu tiên và tạo lại nếu PID đổi (gunicorn fork sau khi master đã tạo).
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Đếm số connection của pool để xem qua get_pool_stats()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.checkout_failed = 0
+            self.pools_cleared = 0
+
+    def _inc(self, attr: str, delta: int = 1):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + delta)
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_ready(self, event): pass
+
+    def pool_cleared(self, event):
+        self._inc("pools_cleared")
+
+    def connection_created(self, event):
+        self._inc("created")
+
+    def connection_closed(self, event):
+        self._inc("closed")
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._inc("checked_out")
+
+    def connection_checked_in(self, event):
+        self._inc("checked_out", -1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "in_use": self.checked_out,
+                "created": self.created,
+                "closed": self.closed,
+                "checkout_failed": self.checkout_failed,
+                "pools_cleared": self.pools_cleared,
+            }
+
+
+pool_stats = PoolStatsListener()
+
+
+def _client_options(cfg) -> dict:
+    return {
+        "maxPoolSize": cfg.get("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": cfg.get("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": cfg.get("MONGO_MAX_IDLE_TIME_MS", 60000),
+        "waitQueueTimeoutMS": cfg.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": cfg.get("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": cfg.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": cfg.get("MONGO_SOCKET_TIMEOUT_MS", 30000),
+    }
+
+
+def get_client() -> MongoClient:
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # Client kế thừa từ process cha (trước fork) không an toàn để dùng,
+            # chỉ bỏ tham chiếu chứ không close() vì socket đang thuộc process cha.
+            cfg = current_app.config
+            pool_stats.reset()
+            _client = MongoClient(
+                cfg["MONGO_URI"],
+                event_listeners=[pool_stats, command_stats],
+                **_client_options(cfg),
+            )
+            _client_pid = pid
+    return _client
+
+
 def get_db():
-    if "mongo_client" not in g:
-        uri = current_app.config["MONGO_URI"]
-        g.mongo_client = MongoClient(uri)
-    client = g.mongo_client
+    client = get_client()
     dbname = current_app.config["MONGO_DB"]
     return client[dbname]
 
 
-def init_indexes(db):
-    # Users & AuthZ
-   
-    db.users.create_index([("username", ASCENDING)], unique=True, name="uniq_user_username")
-    db.roles.create_index([("role_name", ASCENDING)], unique=True, name="uniq_role_name")
-    db.permissions.create_index([("description", ASCENDING)], unique=True, name="uniq_perm_desc")
-    db.role_permissions.create_index([("role_id", ASCENDING)], name="idx_rp_role")
-    db.role_permissions.create_index([("permission_id", ASCENDING)], name="idx_rp_perm")
-
-    # Company–Branch–Meter
-    db.companies.create_index([("name", ASCENDING)], unique=True, name="uniq_company_name")
-    db.branches.create_index([("company_id", ASCENDING)], name="idx_branch_company")
-    db.branches.create_index([("name", ASCENDING)], name="idx_branch_name")
-    db.meters.create_index([("branch_id", ASCENDING)], name="idx_meter_branch")
-    db.meters.create_index([("meter_name", ASCENDING)], name="idx_meter_name")
-
-    # User–Meter (n–n)
-    db.user_meters.create_index([("user_id", ASCENDING)], name="idx_um_user")
-    db.user_meters.create_index([("meter_id", ASCENDING)], name="idx_um_meter")
-    db.user_meters.create_index(
-        [("user_id", ASCENDING), ("meter_id", ASCENDING)],
-        unique=True,
-        name="uniq_um" 
-    )
-
-    # Meter data
-    db.meter_manual_thresholds.create_index([("meter_id", ASCENDING), ("set_time", DESCENDING)], name="idx_thresh_meter_time")
-    db.meter_consumptions.create_index([("meter_id", ASCENDING), ("recording_date", DESCENDING)], name="idx_consume_meter_month")
-    db.meter_repairs.create_index([("meter_id", ASCENDING), ("repair_time", DESCENDING)], name="idx_repair_meter_time")
-    db.meter_measurements.create_index([("meter_id", ASCENDING), ("measurement_time", DESCENDING)], name="idx_meas_meter_time")
-
-    # AI & Prediction & Alert
-    db.ai_models.create_index([("name", ASCENDING)], unique=True, name="uniq_model_name")
-    db.predictions.create_index([("meter_id", ASCENDING), ("prediction_time", DESCENDING)], name="idx_pred_meter_time")
-    db.predictions.create_index([("model_id", ASCENDING)], name="idx_pred_model")
-    db.alerts.create_index([("p_id", ASCENDING)], unique=True, name="uniq_alert_prediction")  # 1-1
-    db.alerts.create_index([("time", DESCENDING)], name="idx_alert_time")
-
-    db.roles.create_index([("role_name", ASCENDING)], unique=True, name="uniq_role_name")
-    db.permissions.create_index([("description", ASCENDING)], unique=True, name="uniq_perm_desc")
-    db.role_permissions.create_index([("role_id", ASCENDING)], name="idx_rp_role")
-    db.role_permissions.create_index([("permission_id", ASCENDING)], name="idx_rp_perm")
-    db.role_permissions.create_index([("role_id", ASCENDING), ("permission_id", ASCENDING)],
-                                     unique=True, name="uniq_rp_role_perm")
+def get_pool_stats() -> dict:
+    """Thống kê pool của client trong process hiện tại."""
+    opts = _client.options.pool_options if _client is not None else None
+    return {
+        "pid": os.getpid(),
+        "client_pid": _client_pid,
+        "initialized": _client is not None and _client_pid == os.getpid(),
+        "max_pool_size": opts.max_pool_size if opts else None,
+        "min_pool_size": opts.min_pool_size if opts else None,
+        **pool_stats.snapshot(),
+    }
+
+
+def init_indexes(db, force: bool = True):
+    """Reconcile toàn bộ index khai báo trong registry (app/indexes.py)."""
+    from .indexes import load_declarations, reconcile_indexes
+    load_declarations()
+    return reconcile_indexes(db, force=force)
 
 
 def close_db(e=None):
-    client = g.pop("mongo_client", None)
-    if client:
-        client.close()
+    # Client là process-wide nên không đóng theo request nữa; connection tự
+    # trả về pool. Giữ hàm để teardown_appcontext cũ vẫn dùng được.
+    g.pop("mongo_client", None)
+
+
+def close_client():
+    """Đóng hẳn client của process (dùng khi worker tắt)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
 
 # nơi lưu jti bị block
 TOKEN_BLOCKLIST = set()
@@ -0,0 +1,203 @@
+"""Registry index MongoDB.
+
+Mỗi repo module tự khai báo index của collection mình quản lý bằng
+declare_index(). Khi boot, worker chỉ đọc 1 document marker (schema_meta)
+và so version với registry; chỉ khi lệch mới reconcile (tạo/sửa index).
+"""
+import hashlib
+import importlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from pymongo import errors
+
+from .logging_setup import get_logger
+
+META_COL = "schema_meta"
+MARKER_ID = "indexes"
+LOCK_ID = "indexes_lock"
+LOCK_TTL = timedelta(minutes=10)
+
+# Các module có gọi declare_index(); import để registry đầy đủ
+# (seed script / CLI không đi qua create_app nên cần load tường minh).
+DECLARING_MODULES = [
+    "app.api.users.repo",
+    "app.api.authz.repo",
+    "app.api.companies.repo",
+    "app.api.branches.repo",
+    "app.api.meter.repo",
+    "app.api.meter.overview_cache",
+    "app.api.user_meter.repo",
+    "app.api.measurements.repo",
+    "app.api.measurements.rollups",
+    "app.api.predictions.repo",
+    "app.api.alerts.repo",
+    "app.api.log.repo",
+]
+
+# (collection, index name) -> spec
+_REGISTRY: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+logger = get_logger(__name__)
+
+
+def declare_index(collection: str, keys: List[Tuple[str, int]], name: str, **opts):
+    """Khai báo 1 index. Khai báo lại cùng (collection, name) sẽ ghi đè."""
+    _REGISTRY[(collection, name)] = {
+        "collection": collection,
+        "keys": [(k, int(v)) for k, v in keys],
+        "name": name,
+        "opts": opts,
+    }
+
+
+def load_declarations() -> List[Dict[str, Any]]:
+    for mod in DECLARING_MODULES:
+        importlib.import_module(mod)
+    return declared_indexes()
+
+
+def declared_indexes() -> List[Dict[str, Any]]:
+    return [_REGISTRY[k] for k in sorted(_REGISTRY)]
+
+
+def schema_version() -> str:
+    """Hash ổn định của toàn bộ registry, đổi khi thêm/sửa index."""
+    raw = json.dumps(declared_indexes(), sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def stored_version(db) -> str | None:
+    doc = db[META_COL].find_one({"_id": MARKER_ID}, {"version": 1})
+    return doc.get("version") if doc else None
+
+
+def is_up_to_date(db) -> bool:
+    return stored_version(db) == schema_version()
+
+
+def _norm_keys(keys):
+    return tuple((k, int(v)) for k, v in keys)
+
+
+# Option ảnh hưởng tới hành vi index; đổi option mà giữ tên thì phải build lại
+OPTION_KEYS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _norm_opts(opts: Dict[str, Any]) -> str:
+    out = {}
+    for k in OPTION_KEYS:
+        v = opts.get(k)
+        if v is None or v is False:
+            continue
+        out[k] = int(v) if k == "expireAfterSeconds" else v
+    return json.dumps(out, sort_keys=True, default=str)
+
+
+def _ensure_one(coll, spec: Dict[str, Any], existing: Dict[str, Any]) -> str:
+    name = spec["name"]
+    if name in existing:
+        cur = existing[name]
+        if _norm_keys(cur["key"]) == _norm_keys(spec["keys"]) and _norm_opts(cur) == _norm_opts(spec["opts"]):
+            return "kept"
+        coll.drop_index(name)
+        coll.create_index(spec["keys"], name=name, **spec["opts"])
+        return "rebuilt"
+    coll.create_index(spec["keys"], name=name, **spec["opts"])
+    return "created"
+
+
+def reconcile_indexes(db, force: bool = False) -> Dict[str, Any]:
+    """Đồng bộ index theo registry rồi ghi marker version.
+
+    Không force: nếu marker đã khớp thì chỉ tốn 1 lần đọc.
+    """
+    version = schema_version()
+    if not force and stored_version(db) == version:
+        return {"version": version, "skipped": True}
+
+    result: Dict[str, List[str]] = {"created": [], "rebuilt": [], "kept": [], "failed": []}
+    info_cache: Dict[str, Dict[str, Any]] = {}
+    for spec in declared_indexes():
+        col = spec["collection"]
+        if col not in info_cache:
+            info_cache[col] = db[col].index_information()
+        label = f"{col}.{spec['name']}"
+        try:
+            state = _ensure_one(db[col], spec, info_cache[col])
+        except errors.OperationFailure as e:
+            logger.error("%s failed: %s", label, e)
+            result["failed"].append(label)
+            continue
+        result[state].append(label)
+
+    # Chỉ ghi marker khi mọi index đều OK để lần sau còn thử lại
+    if not result["failed"]:
+        db[META_COL].update_one(
+            {"_id": MARKER_ID},
+            {"$set": {"version": version, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    return {"version": version, "skipped": False, **result}
+
+
+def _acquire_lock(db) -> bool:
+    """Lease trong schema_meta để chỉ 1 worker build index tại 1 thời điểm."""
+    now = datetime.now(timezone.utc)
+    try:
+        db[META_COL].update_one(
+            {"_id": LOCK_ID, "$or": [{"until": {"$lt": now}}, {"until": {"$exists": False}}]},
+            {"$set": {"until": now + LOCK_TTL, "pid": os.getpid()}},
+            upsert=True,
+        )
+        return True
+    except errors.DuplicateKeyError:
+        return False
+
+
+def _release_lock(db):
+    db[META_COL].delete_one({"_id": LOCK_ID, "pid": os.getpid()})
+
+
+def reconcile_with_lock(db, force: bool = False) -> Dict[str, Any]:
+    if not _acquire_lock(db):
+        return {"version": schema_version(), "skipped": True, "reason": "locked"}
+    try:
+        return reconcile_indexes(db, force=force)
+    finally:
+        _release_lock(db)
+
+
+def reconcile_in_background(app) -> threading.Thread:
+    """Build index ở thread riêng để worker boot không bị chặn."""
+    def _run():
+        with app.app_context():
+            from .extensions import get_db
+            try:
+                logger.info("background reconcile: %s", reconcile_with_lock(get_db()))
+            except Exception:
+                logger.exception("background reconcile failed")
+
+    t = threading.Thread(target=_run, name="index-reconcile", daemon=True)
+    t.start()
+    return t
+
+
+def ensure_indexes_on_boot(app, db):
+    """Gọi trong create_app. INDEX_RECONCILE:
+    - "sync": reconcile ngay nếu version lệch (mặc định)
+    - "background": reconcile ở thread nền nếu version lệch
+    - "off": không làm gì, chạy bằng CLI `flask reconcile-indexes`
+    """
+    mode = app.config.get("INDEX_RECONCILE", "sync")
+    if mode == "off":
+        return
+    if is_up_to_date(db):
+        return
+    if mode == "background":
+        reconcile_in_background(app)
+    else:
+        logger.info("reconcile: %s", reconcile_with_lock(db))
@@ -0,0 +1,169 @@
+"""Đo số lệnh MongoDB theo từng request Flask.
+
+CommandStatsListener gắn vào MongoClient (xem extensions.get_client). Mỗi
+request có 1 RequestStats trong ContextVar; listener cộng dồn số command,
+round trip, số document trả về và thời gian theo collection. Cuối request:
+- gắn header Server-Timing
+- cộng vào thống kê theo endpoint (trong process, đọc qua /stats/mongo)
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from flask import Flask, request
+from pymongo import monitoring
+
+_current: ContextVar[Optional["RequestStats"]] = ContextVar("mongo_request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("started_at", "commands", "round_trips", "docs", "duration_ms", "by_collection", "_pending")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.commands: Dict[str, int] = {}
+        self.round_trips = 0
+        self.docs = 0
+        self.duration_ms = 0.0
+        self.by_collection: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[int, str] = {}
+
+    def add(self, collection: str, command_name: str, duration_ms: float, docs: int):
+        self.round_trips += 1
+        self.docs += docs
+        self.duration_ms += duration_ms
+        self.commands[command_name] = self.commands.get(command_name, 0) + 1
+        c = self.by_collection.setdefault(collection, {"round_trips": 0, "docs": 0, "duration_ms": 0.0})
+        c["round_trips"] += 1
+        c["docs"] += docs
+        c["duration_ms"] += duration_ms
+
+
+def _collection_of(event) -> str:
+    if event.command_name == "getMore":
+        return str(event.command.get("collection", "?"))
+    target = event.command.get(event.command_name)
+    return str(target) if isinstance(target, str) else event.command_name
+
+
+def _docs_in_reply(reply) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        return len(batch) if batch is not None else 0
+    n = reply.get("n")
+    return int(n) if isinstance(n, (int, float)) else 0
+
+
+class CommandStatsListener(monitoring.CommandListener):
+    """Listener chạy đồng bộ trong thread gọi pymongo nên đọc được ContextVar
+    của request. Lệnh ngoài request (thread nền, CLI) bị bỏ qua."""
+
+    def started(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats._pending[event.request_id] = _collection_of(event)
+
+    def succeeded(self, event):
+        stats = _current.get()
+        if stats is None:
+            return
+        col = stats._pending.pop(event.request_id, event.command_name)
+        stats.add(col, event.command_name, event.duration_micros / 1000.0, _docs_in_reply(event.reply))
+
+    def failed(self, event):
+        stats = _current.get()
+        if stats is None:
+            return
+        col = stats._pending.pop(event.request_id, event.command_name)
+        stats.add(col, event.command_name, event.duration_micros / 1000.0, 0)
+
+
+command_stats = CommandStatsListener()
+
+
+class EndpointStats:
+    """Thống kê cộng dồn theo endpoint trong process hiện tại."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, endpoint: str, stats: RequestStats, total_ms: float):
+        with self._lock:
+            e = self._data.setdefault(endpoint, {
+                "requests": 0, "round_trips": 0, "max_round_trips": 0, "docs": 0,
+                "mongo_ms": 0.0, "total_ms": 0.0, "commands": {}, "by_collection": {},
+            })
+            e["requests"] += 1
+            e["round_trips"] += stats.round_trips
+            e["max_round_trips"] = max(e["max_round_trips"], stats.round_trips)
+            e["docs"] += stats.docs
+            e["mongo_ms"] += stats.duration_ms
+            e["total_ms"] += total_ms
+            for name, n in stats.commands.items():
+                e["commands"][name] = e["commands"].get(name, 0) + n
+            for col, c in stats.by_collection.items():
+                agg = e["by_collection"].setdefault(col, {"round_trips": 0, "docs": 0, "duration_ms": 0.0})
+                agg["round_trips"] += c["round_trips"]
+                agg["docs"] += c["docs"]
+                agg["duration_ms"] += c["duration_ms"]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for endpoint, e in self._data.items():
+                n = e["requests"] or 1
+                out[endpoint] = {
+                    **e,
+                    "commands": dict(e["commands"]),
+                    "by_collection": {k: dict(v) for k, v in e["by_collection"].items()},
+                    "avg_round_trips": round(e["round_trips"] / n, 2),
+                    "avg_mongo_ms": round(e["mongo_ms"] / n, 3),
+                    "avg_total_ms": round(e["total_ms"] / n, 3),
+                }
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+endpoint_stats = EndpointStats()
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def _server_timing(stats: RequestStats, total_ms: float) -> str:
+    parts = [f'mongo;dur={stats.duration_ms:.2f};desc="{stats.round_trips} round trips, {stats.docs} docs"']
+    for col, c in sorted(stats.by_collection.items()):
+        parts.append(f'mongo-{col};dur={c["duration_ms"]:.2f};desc="{c["round_trips"]} rt"')
+    parts.append(f"app;dur={total_ms:.2f}")
+    return ", ".join(parts)
+
+
+def init_instrumentation(app: Flask):
+    if not app.config.get("MONGO_INSTRUMENTATION", True):
+        return
+
+    @app.before_request
+    def _start_mongo_stats():
+        _current.set(RequestStats())
+
+    @app.after_request
+    def _finish_mongo_stats(resp):
+        stats = _current.get()
+        if stats is None:
+            return resp
+        total_ms = (time.perf_counter() - stats.started_at) * 1000.0
+        endpoint_stats.record(request.endpoint or "<unmatched>", stats, total_ms)
+        if app.config.get("SERVER_TIMING_HEADER", True):
+            resp.headers["Server-Timing"] = _server_timing(stats, total_ms)
+        return resp
+
+    @app.teardown_request
+    def _clear_mongo_stats(exc=None):
+        _current.set(None)
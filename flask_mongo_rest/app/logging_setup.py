@@ -0,0 +1,136 @@
+"""Logging cho app: thay cho print() trong repo/service/routes.
+
+- Handler thật (stdout) chạy ở thread nền qua QueueHandler/QueueListener,
+  request chỉ tốn 1 lần put vào queue.
+- Level theo module từ config LOG_LEVEL / LOG_LEVELS ("app.api.meter=DEBUG,...").
+- Mỗi request có request_id (header X-Request-ID hoặc tự sinh), gắn vào mọi
+  dòng log và trả lại trong response header.
+- log_doc(): dump document ở DEBUG, có lấy mẫu (LOG_DOC_SAMPLE_RATE) và che
+  các field nhạy cảm (password...).
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from flask import Flask, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+SENSITIVE_KEYS = {"password", "password_user", "password_hash", "access_token", "refresh_token", "confirm_token"}
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(process)d] [%(request_id)s] %(name)s: %(message)s"
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="-")
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid: Optional[int] = None
+_doc_sample_rate = 1.0
+
+
+class RequestIdFilter(logging.Filter):
+    """Chạy ở thread ghi log (trước khi vào queue) nên đọc được ContextVar."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+def _redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: ("***" if k in SENSITIVE_KEYS else _redact(v)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(v) for v in value]
+    return value
+
+
+def log_doc(logger: logging.Logger, msg: str, doc: Any, *args):
+    """Dump document ở DEBUG: bỏ qua ngay nếu không bật DEBUG, có lấy mẫu và che
+    field nhạy cảm. repr() chỉ chạy khi thực sự ghi."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if _doc_sample_rate < 1.0 and random.random() >= _doc_sample_rate:
+        return
+    logger.debug(msg + " %r", *args, _redact(doc))
+
+
+def _parse_levels(spec: str) -> dict:
+    out = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, level = part.split("=", 1)
+        out[name.strip()] = level.strip().upper()
+    return out
+
+
+def _start_listener(handler: logging.Handler) -> logging.handlers.QueueHandler:
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    q: queue.Queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(q, handler, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    qh = logging.handlers.QueueHandler(q)
+    qh.addFilter(RequestIdFilter())
+    return qh
+
+
+def setup_logging(cfg) -> None:
+    """Cấu hình logger "app" (gọi 1 lần trong create_app)."""
+    global _doc_sample_rate
+    _doc_sample_rate = float(cfg.get("LOG_DOC_SAMPLE_RATE", 1.0))
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger("app")
+    root.handlers.clear()
+    root.addHandler(_start_listener(stream))
+    root.setLevel(cfg.get("LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+
+    for name, level in _parse_levels(cfg.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def ensure_listener_after_fork():
+    """Thread của QueueListener không sống qua fork (gunicorn preload)."""
+    if _listener is not None and _listener_pid != os.getpid():
+        root = logging.getLogger("app")
+        stream = _listener.handlers[0]
+        root.handlers.clear()
+        root.addHandler(_start_listener(stream))
+
+
+def stop_logging():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+def init_request_logging(app: Flask):
+    @app.before_request
+    def _assign_request_id():
+        ensure_listener_after_fork()
+        rid = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        _request_id.set(rid[:64])
+
+    @app.after_request
+    def _echo_request_id(resp):
+        resp.headers[REQUEST_ID_HEADER] = _request_id.get()
+        return resp
+
+    @app.teardown_request
+    def _clear_request_id(exc=None):
+        _request_id.set("-")
@@ -0,0 +1,46 @@
+import threading
+import time
+from typing import Any, Callable, Dict
+
+
+class TTLCache:
+    """Dict trong process, entry hết hạn sau ttl giây (ttl truyền lúc đọc)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[Any, tuple] = {}
+
+    def get(self, key, ttl: float):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, stored_at = item
+        if time.monotonic() - stored_at > ttl:
+            with self._lock:
+                self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_or_load(self, key, ttl: float, loader: Callable[[], Any]):
+        """Lấy từ cache, hết hạn/chưa có thì gọi loader (None thì không cache)."""
+        value = self.get(key, ttl)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
@@ -0,0 +1,61 @@
+"""Giảm số điểm cho chuỗi vẽ chart: Largest-Triangle-Three-Buckets (LTTB).
+
+Điểm đầu/cuối giữ nguyên, phần giữa chia thành (n_out - 2) bucket, mỗi bucket
+chọn điểm tạo tam giác lớn nhất với điểm đã chọn trước và trung bình bucket
+sau. Tính trên mảng NumPy; vòng lặp chỉ chạy theo số bucket, không theo số điểm.
+
+LTTB giữ hình dáng nhưng có thể bỏ sót đỉnh hẹp, nên envelope() trả thêm
+min/max của từng bucket để client vẽ dải bao (spike rò rỉ không bị mất).
+"""
+from typing import Tuple
+
+import numpy as np
+
+MIN_POINTS = 3
+
+
+def bucket_edges(n: int, n_out: int) -> np.ndarray:
+    """Biên các bucket giữa: bucket i = [edges[i], edges[i+1]), từ 1 tới n-1."""
+    # số nguyên chính xác (linspace + astype có thể lệch 1 do làm tròn float)
+    return 1 + (np.arange(n_out - 1, dtype=np.int64) * (n - 2)) // (n_out - 2)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Trả (indices đã chọn, edges). Nếu không cần giảm thì indices = tất cả."""
+    n = len(x)
+    if n_out < MIN_POINTS or n <= n_out:
+        return np.arange(n), np.arange(n + 1)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = bucket_edges(n, n_out)
+    counts = np.diff(edges)
+
+    # Trung bình của bucket kế tiếp; bucket cuối dùng điểm cuối.
+    # reduceat theo cả edges (kết thúc ở n-1) để bucket cuối không cộng lẫn điểm cuối.
+    avg_x = np.add.reduceat(x, edges)[:-1] / counts
+    avg_y = np.add.reduceat(y, edges)[:-1] / counts
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    # edges đầy đủ cho envelope: [0,1) điểm đầu, các bucket giữa, [n-1,n) điểm cuối
+    return out, np.concatenate(([0], edges, [n]))
+
+
+def envelope(values: np.ndarray, edges: np.ndarray,
+             lows: np.ndarray | None = None, highs: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Min/max theo bucket (cùng thứ tự với indices của lttb_indices).
+    Với dữ liệu đã rollup, truyền lows/highs là cột min/max sẵn có."""
+    lows = np.asarray(values if lows is None else lows, dtype=np.float64)
+    highs = np.asarray(values if highs is None else highs, dtype=np.float64)
+    starts = edges[:-1]
+    return np.minimum.reduceat(lows, starts), np.maximum.reduceat(highs, starts)
@@ -1,10 +1,49 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import bcrypt as bc
+from flask import current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable
+
+# bcrypt tốn CPU (hàng chục ms); chạy trong pool giới hạn để số lần check đồng
+# thời không vượt quá BCRYPT_MAX_WORKERS. bcrypt nhả GIL nên thread khác vẫn chạy.
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _cfg(key: str, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                # thread của pool không sống qua fork -> tạo lại theo PID
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(_cfg("BCRYPT_MAX_WORKERS", 2)),
+                    thread_name_prefix="bcrypt",
+                )
+                _executor_pid = pid
+    return _executor
 
 def hash_password(plain: str) -> str:
     return bc.hashpw(plain.encode("utf-8"), bc.gensalt()).decode("utf-8")
 
-def verify_password(plain: str, hashed: str) -> bool:
+def _checkpw(plain: str, hashed: str) -> bool:
     if not isinstance(hashed, str):
         hashed = hashed.decode("utf-8", errors="ignore")
     hashed = hashed.strip()
-    return bc.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
\ No newline at end of file
+    return bc.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+
+def verify_password(plain: str, hashed: str) -> bool:
+    """Check bcrypt qua pool giới hạn. Pool quá tải (chờ quá BCRYPT_TIMEOUT_SECONDS)
+    thì trả 503 chứ không coi là sai mật khẩu."""
+    fut = _pool().submit(_checkpw, plain, hashed)
+    try:
+        return fut.result(timeout=float(_cfg("BCRYPT_TIMEOUT_SECONDS", 5)))
+    except FutureTimeout:
+        # chỉ huỷ được nếu chưa chạy; đang chạy thì để nó xong trong pool
+        fut.cancel()
+        raise ServiceUnavailable("Password check is busy, please retry", retry_after=1)
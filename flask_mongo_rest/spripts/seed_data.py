@@ -1,10 +1,19 @@
 import os
+import sys
 import random
 from datetime import datetime, timezone, timedelta, time
 import bcrypt as bc
 from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
 from typing import Optional, Dict, Any, List, Set
 
+# Cho phép import registry index của app khi chạy `python spripts/seed_data.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.indexes import load_declarations, reconcile_indexes
+from app.api.authz.cache import bump_authz_version
+from app.api.meter.state import rebuild_meter_state
+from app.api.meter import daily_status
+from app.api.predictions.repo import sync_meter_scope
+
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017")
 MONGO_DB  = os.getenv("MONGO_DB", "Nuoc_HP")
 
@@ -29,9 +38,11 @@ def reset_collections():
         "users","roles","permissions","role_permissions",
         "user_meters",
         "meter_manual_thresholds","meter_consumptions","meter_repairs","meter_measurements",
-        "ai_models","predictions","alerts"
+        "ai_models","predictions","alerts","meter_state","meter_daily_status","leak_overview_cache","leak_overview_gen"
     ]:
         db[col].drop()
+    # marker "đã mở ngày" của meter_daily_status
+    db.schema_meta.delete_many({"_id": {"$regex": "^daily_status:"}})
 
     # Xóa toàn bộ index (trừ _id_)
     for col_name in db.list_collection_names():
@@ -39,66 +50,10 @@ def reset_collections():
             if idx_name != "_id_":
                 db[col_name].drop_index(idx_name)
 
-# --- index helper (idempotent) ---
-def _norm_keys(keys):
-    return tuple((k, int(v)) for k, v in keys)
-
-def ensure_index(coll, keys, name: str, **opts):
-    info = coll.index_information()
-    if name in info:
-        if _norm_keys(info[name]["key"]) != _norm_keys(keys):
-            coll.drop_index(name)
-            return coll.create_index(keys, name=name, **opts)
-        return name
-    return coll.create_index(keys, name=name, **opts)
-
 def init_indexes(db):
-    # Users / Roles / Permissions / Role-Permissions
-    ensure_index(db.users,       [("username", ASCENDING)],    unique=True,  name="uniq_user_username")
-    ensure_index(db.roles,       [("role_name", ASCENDING)],   unique=True,  name="uniq_role_name")
-    ensure_index(db.permissions, [("description", ASCENDING)], unique=True,  name="uniq_perm_desc")
-
-    ensure_index(db.role_permissions, [("role_id", ASCENDING)],       name="idx_rp_role")
-    ensure_index(db.role_permissions, [("permission_id", ASCENDING)], name="idx_rp_perm")
-    ensure_index(db.role_permissions,
-                 [("role_id", ASCENDING), ("permission_id", ASCENDING)],
-                 unique=True, name="uniq_rp_role_perm")
-
-    # Company–Branch–Meter
-    ensure_index(db.companies, [("name", ASCENDING)], unique=True, name="uniq_company_name")
-    ensure_index(db.branches,  [("company_id", ASCENDING)],        name="idx_branch_company")
-    ensure_index(db.branches,  [("name", ASCENDING)],              name="idx_branch_name")
-    ensure_index(db.meters,    [("branch_id", ASCENDING)],         name="idx_meter_branch")
-    ensure_index(db.meters,    [("meter_name", ASCENDING)],        name="idx_meter_name")
-
-    # User–Meter (n–n)
-    ensure_index(db.user_meters, [("user_id", ASCENDING)],  name="idx_um_user")
-    ensure_index(db.user_meters, [("meter_id", ASCENDING)], name="idx_um_meter")
-    ensure_index(db.user_meters,
-                 [("user_id", ASCENDING), ("meter_id", ASCENDING)],
-                 unique=True, name="uniq_um")
-
-    # Meter data
-    ensure_index(db.meter_manual_thresholds,
-                 [("meter_id", ASCENDING), ("set_time", DESCENDING)],
-                 name="idx_thresh_meter_time")
-    ensure_index(db.meter_consumptions,
-                 [("meter_id", ASCENDING), ("recording_date", DESCENDING)],
-                 name="idx_consume_meter_month")
-    ensure_index(db.meter_repairs,
-                 [("meter_id", ASCENDING), ("repair_time", DESCENDING)],
-                 name="idx_repair_meter_time")
-    ensure_index(db.meter_measurements,
-                 [("meter_id", ASCENDING), ("measurement_time", DESCENDING)],
-                 name="idx_meas_meter_time")
-
-    # AI & Prediction & Alert
-    ensure_index(db.ai_models,   [("name", ASCENDING)],                    unique=True, name="uniq_model_name")
-    ensure_index(db.predictions, [("meter_id", ASCENDING), ("prediction_time", DESCENDING)],
-                 name="idx_pred_meter_time")
-    ensure_index(db.predictions, [("model_id", ASCENDING)],                name="idx_pred_model")
-    ensure_index(db.alerts,      [("p_id", ASCENDING)],                    unique=True, name="uniq_alert_prediction")
-    ensure_index(db.alerts,      [("time", DESCENDING)],                   name="idx_alert_time")
+    # Dùng chung registry với app (mỗi repo module tự khai báo index)
+    load_declarations()
+    print("Indexes:", reconcile_indexes(db, force=True))
 
 # -----------------------
 # PERMISSIONS & ROLES
@@ -120,6 +75,7 @@ def seed_permissions_roles():
         {"key": "log:read",      "description": "Xem nhật ký hệ thống"},
         {"key": "log:create",    "description": "Tạo nhật ký hệ thống"},
         {"key": "log:delete",    "description": "Xóa nhật ký hệ thống"},
+        {"key": "measurement:create", "description": "Ghi dữ liệu đo"},
     ]
     for p in perms:
         upsert("permissions", {"key": p["key"]}, p)
@@ -336,6 +292,8 @@ def main():
     print(f"Connecting to {MONGO_URI}, DB={MONGO_DB}")
     reset_collections()
     seed_permissions_roles()
+    # roles/permissions vừa đổi -> báo các worker đang chạy xoá cache phân quyền
+    bump_authz_version(db)
     company_id, branch_ids = seed_org()
     seed_users(company_id, branch_ids)
 
@@ -346,6 +304,9 @@ def main():
     seed_meter_measurements()
     seed_meter_repairs()
     seed_predictions()
+    sync_meter_scope(None, db)
+    rebuild_meter_state(db)
+    daily_status.backfill(15, db)
 
     # --- Demo hành vi theo yêu cầu ---
     print("\n[READ] company_manager có thể xem:")
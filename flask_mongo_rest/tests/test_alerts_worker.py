@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+from pymongo import ASCENDING
+from werkzeug.exceptions import Forbidden
+
+from app.api.alerts import repo as alert_repo, service, worker
+from app.api.predictions.repo import COL as PRED_COL
+
+CFG = {"ALERT_COOLDOWN_MINUTES": 60, "ALERT_POLL_LOOKBACK_SECONDS": 300, "ALERT_BATCH_SIZE": 2,
+       "ALERT_LABELS": "leak"}
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient(tz_aware=True).db
+    db[alert_repo.COL].create_index([("p_id", ASCENDING)], unique=True, name="uniq_alert_prediction")
+    return db
+
+
+def _pred(db, mid, t, label="leak", branch=None, company=None):
+    doc = {"_id": ObjectId(), "meter_id": mid, "predicted_label": label, "prediction_time": t,
+           "branch_id": branch, "company_id": company}
+    db[PRED_COL].insert_one(doc)
+    return doc
+
+
+def test_cooldown_within_batch_and_against_stored_alerts(db):
+    m1, m2 = ObjectId(), ObjectId()
+    t = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+    preds = [_pred(db, m1, t), _pred(db, m1, t + timedelta(minutes=30)), _pred(db, m1, t + timedelta(minutes=61)),
+             _pred(db, m2, t + timedelta(minutes=5))]
+    # m2 đã có alert 20 phút trước prediction -> còn cooldown
+    db[alert_repo.COL].insert_one({"p_id": ObjectId(), "meter_id": m2, "time": t - timedelta(minutes=15)})
+
+    r = worker.process_batch(list(reversed(preds)), db, CFG)
+    assert r == {"predictions": 4, "inserted": 2, "duplicates": 0, "cooldown": 2}
+    got = sorted((a["meter_id"], a["time"]) for a in db[alert_repo.COL].find({"label": "leak"}))
+    assert got == [(m1, t), (m1, t + timedelta(minutes=61))]
+
+
+def test_poll_rereads_lookback_without_duplicates_and_moves_checkpoint(db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    m1, m2, m3 = ObjectId(), ObjectId(), ObjectId()
+    _pred(db, m1, now - timedelta(minutes=3))
+    _pred(db, m2, now - timedelta(minutes=2))
+    _pred(db, m3, now - timedelta(minutes=1), label="normal")  # không thuộc ALERT_LABELS
+
+    r1 = worker.poll_once(db, CFG)
+    assert (r1["predictions"], r1["inserted"]) == (2, 2)
+    cp1 = worker.load_checkpoint(db)["last_time"]
+    assert cp1 == now - timedelta(minutes=2)
+
+    # lượt sau đọc lại 2 prediction cũ (trong lookback) + 1 prediction mới
+    _pred(db, m3, now)
+    r2 = worker.poll_once(db, CFG)
+    assert (r2["predictions"], r2["inserted"], r2["cooldown"]) == (3, 1, 2)
+    assert db[alert_repo.COL].count_documents({}) == 3
+    assert worker.load_checkpoint(db)["last_time"] == now
+
+    # không có cooldown thì uniq_alert_prediction vẫn chặn alert trùng
+    r3 = worker.poll_once(db, {**CFG, "ALERT_COOLDOWN_MINUTES": 0}, since=now - timedelta(minutes=1))
+    assert (r3["predictions"], r3["inserted"], r3["duplicates"]) == (3, 0, 3)
+
+    # không có gì mới: checkpoint không lùi
+    worker.poll_once(db, CFG)
+    assert worker.load_checkpoint(db)["last_time"] == now
+    assert db[alert_repo.COL].count_documents({}) == 3
+
+
+def test_poll_starts_from_lookback_before_checkpoint(db):
+    t = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+    _pred(db, ObjectId(), t - timedelta(minutes=10))  # trước lookback 5 phút
+    late = _pred(db, ObjectId(), t - timedelta(minutes=4))  # ghi trễ, vẫn trong lookback
+    worker.save_checkpoint(db, last_time=t)
+
+    r = worker.poll_once(db, CFG)
+    assert (r["predictions"], r["inserted"]) == (1, 1)
+    assert db[alert_repo.COL].find_one()["p_id"] == late["_id"]
+    assert worker.load_checkpoint(db)["last_time"] == t
+
+
+@pytest.fixture
+def scoped(db, monkeypatch):
+    monkeypatch.setattr(alert_repo, "get_db", lambda: db)
+    c1, c2 = ObjectId(), ObjectId()
+    b1, b2, b3 = ObjectId(), ObjectId(), ObjectId()
+    t = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db[alert_repo.COL].insert_many([
+        {"p_id": ObjectId(), "meter_id": ObjectId(), "branch_id": b, "company_id": c, "label": "leak",
+         "status": "open", "time": t + timedelta(minutes=k)}
+        for k, (b, c) in enumerate(((b1, c1), (b2, c1), (b3, c2)))])
+    app = Flask(__name__)
+    with app.app_context():
+        yield {"c1": c1, "c2": c2, "b1": b1, "b2": b2, "b3": b3}
+
+
+def _as(monkeypatch, **claims):
+    monkeypatch.setattr(service, "get_jwt", lambda: {k: str(v) for k, v in claims.items()})
+
+
+def _branches(items):
+    return {i["branch_id"] for i in items}
+
+
+def test_list_alerts_branch_scope(scoped, monkeypatch):
+    _as(monkeypatch, company_id=scoped["c1"], branch_id=scoped["b1"])
+    items, has_next, _ = service.list_alerts(1, 10)
+    assert _branches(items) == {str(scoped["b1"])} and not has_next
+    # company_id trong query không mở rộng được phạm vi chi nhánh
+    items, _, _ = service.list_alerts(1, 10, company_id=str(scoped["c2"]))
+    assert _branches(items) == {str(scoped["b1"])}
+    with pytest.raises(Forbidden):
+        service.list_alerts(1, 10, branch_id=str(scoped["b2"]))
+
+
+def test_list_alerts_company_scope(scoped, monkeypatch):
+    _as(monkeypatch, company_id=scoped["c1"])
+    items, _, _ = service.list_alerts(1, 10)
+    assert _branches(items) == {str(scoped["b1"]), str(scoped["b2"])}
+    assert service.list_alerts(1, 10, branch_id=str(scoped["b3"]))[0] == []
+    with pytest.raises(Forbidden):
+        service.list_alerts(1, 10, company_id=str(scoped["c2"]))
+
+
+def test_list_alerts_admin_sees_all_and_pages(scoped, monkeypatch):
+    _as(monkeypatch, role_name="admin")
+    items, has_next, cursor = service.list_alerts(1, 2)
+    assert [i["branch_id"] for i in items] == [str(scoped["b3"]), str(scoped["b2"])] and has_next
+    items, has_next, _ = service.list_alerts(1, 2, cursor=cursor)
+    assert [i["branch_id"] for i in items] == [str(scoped["b1"])] and not has_next
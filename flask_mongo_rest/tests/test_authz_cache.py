@@ -0,0 +1,59 @@
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from app.api.authz import cache, repo
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    monkeypatch.setattr(repo, "get_db", lambda: db)
+    monkeypatch.setattr(cache, "_known_version", None)
+    monkeypatch.setattr(cache, "_known_users_version", None)
+    cache.clear_local()
+    app = Flask(__name__)
+    app.config["AUTHZ_VERSION_CHECK_SECONDS"] = 0
+    with app.app_context():
+        yield db
+    cache.clear_local()
+
+
+def _user(db):
+    return str(db.users.insert_one({"authz_epoch": 0}).inserted_id)
+
+
+def _change_role(db, uid):
+    # users.service.update_user_admin_only: tăng authz_epoch rồi invalidate_user
+    db.users.update_one({"_id": ObjectId(uid)}, {"$inc": {"authz_epoch": 1}})
+    cache.invalidate_user(db, uid)
+
+
+def test_editing_one_user_keeps_other_users_claims_fresh(db):
+    a, b = _user(db), _user(db)
+    claims_a, claims_b = repo.authz_claims(a, 0), repo.authz_claims(b, 0)
+    assert repo.claims_are_fresh(a, claims_a) and repo.claims_are_fresh(b, claims_b)
+
+    _change_role(db, a)
+    assert not repo.claims_are_fresh(a, claims_a)
+    assert repo.claims_are_fresh(b, claims_b)
+    assert repo.authz_claims(b, 0)["authz_v"] == claims_b["authz_v"]
+
+
+def test_other_worker_drops_cached_user_on_users_version(db):
+    a = _user(db)
+    claims_a = repo.authz_claims(a, 0)
+    assert repo.claims_are_fresh(a, claims_a)  # epoch 0 đã nằm trong cache
+
+    # worker khác sửa user: ghi DB + tăng users_version, cache của worker này không bị đụng
+    db.users.update_one({"_id": ObjectId(a)}, {"$inc": {"authz_epoch": 1}})
+    db[cache.META_COL].update_one({"_id": cache.VERSION_ID}, {"$inc": {"users_version": 1}}, upsert=True)
+    assert not repo.claims_are_fresh(a, claims_a)
+
+
+def test_role_permission_change_still_revokes_all_claims(db):
+    a, b = _user(db), _user(db)
+    claims_a, claims_b = repo.authz_claims(a, 0), repo.authz_claims(b, 0)
+    cache.bump_authz_version(db)
+    assert not repo.claims_are_fresh(a, claims_a) and not repo.claims_are_fresh(b, claims_b)
@@ -0,0 +1,142 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from bson import ObjectId
+from flask import Flask
+from werkzeug.exceptions import NotAcceptable
+
+from app.api.common import columnar
+from app.api.measurements import service
+from app.utils.downsample import envelope, lttb_indices
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+MID = str(ObjectId())
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def _raw_cols(n=200):
+    rng = np.random.default_rng(7)
+    return {
+        "time": [T0 + timedelta(minutes=k) for k in range(n)],
+        "instant_flow": (10 + rng.normal(0, 1, n)).tolist(),
+        "instant_pressure": (3 + rng.normal(0, 0.1, n)).tolist(),
+    }
+
+
+def _rollup_rows(n=120):
+    rng = np.random.default_rng(3)
+    rows = []
+    for k in range(n):
+        row = {"time": (T0 + timedelta(hours=k)).isoformat(), "count": int(rng.integers(1, 60))}
+        for f in service.SERIES_FIELDS:
+            v = float(rng.normal(10, 2))
+            row.update({f: v, f"{f}_min": v - 1, f"{f}_max": v + 1, f"{f}_first": v, f"{f}_last": v})
+        rows.append(row)
+    return rows
+
+
+def _rows_to_rollup_cols(rows):
+    cols = {"time": [datetime.fromisoformat(r["time"]).replace(tzinfo=None) for r in rows],
+            "count": [r["count"] for r in rows]}
+    for src, short in (("instant_flow", "flow"), ("instant_pressure", "pressure")):
+        cols[f"{short}_sum"] = [r[src] * r["count"] for r in rows]
+        for part in ("min", "max", "first", "last"):
+            cols[f"{short}_{part}"] = [r[f"{src}_{part}"] for r in rows]
+    return cols
+
+
+# Cách dựng JSON max_points trước khi chuyển sang cột NumPy (user-013), để so shape.
+def _old_downsample_columns(cols, n_out):
+    times = cols["time"]
+    x = np.array([t.timestamp() for t in times])
+    values = {f: np.asarray(cols[f], dtype=np.float64) for f in service.SERIES_FIELDS}
+    idx, edges = lttb_indices(x, values["instant_flow"], n_out)
+    env = {f: envelope(values[f], edges) for f in service.SERIES_FIELDS}
+    out = []
+    for k, i in enumerate(idx.tolist()):
+        row = {"time": times[i].isoformat()}
+        for f in service.SERIES_FIELDS:
+            row[f] = float(values[f][i])
+            row[f"{f}_min"] = float(env[f][0][k])
+            row[f"{f}_max"] = float(env[f][1][k])
+        out.append(row)
+    return out
+
+
+def _old_downsample_rollup_rows(rows, n_out):
+    x = np.array([datetime.fromisoformat(r["time"]).timestamp() for r in rows])
+    col = lambda key: np.array([r[key] for r in rows], dtype=np.float64)
+    avg = {f: col(f) for f in service.SERIES_FIELDS}
+    idx, edges = lttb_indices(x, avg["instant_flow"], n_out)
+    env = {f: envelope(avg[f], edges, lows=col(f"{f}_min"), highs=col(f"{f}_max")) for f in service.SERIES_FIELDS}
+    counts = np.add.reduceat(col("count"), edges[:-1])
+    out = []
+    for k, i in enumerate(idx.tolist()):
+        row = dict(rows[i], count=int(counts[k]))
+        for f in service.SERIES_FIELDS:
+            row[f"{f}_min"] = float(env[f][0][k])
+            row[f"{f}_max"] = float(env[f][1][k])
+        out.append(row)
+    return out
+
+
+def _approx_rows(a, b):
+    assert len(a) == len(b)
+    for ra, rb in zip(a, b):
+        assert set(ra) == set(rb) and ra["time"] == rb["time"]
+        for k in ra:
+            if k != "time":
+                assert ra[k] == pytest.approx(rb[k])
+
+
+def test_npz_roundtrip(app):
+    cols = _raw_cols(5)
+    cols["time"][0] = datetime(2024, 1, 1, 7, 0, tzinfo=timezone(timedelta(hours=7)))  # = T0 UTC
+    arrays = service.raw_arrays(cols)
+    meta = {"meter_id": MID, "total_points": 5, "from": T0}
+    resp = columnar.columnar_response(arrays, meta, columnar.NPZ)
+    assert resp.mimetype == columnar.NPZ and resp.headers["Vary"] == "Accept"
+
+    z = np.load(io.BytesIO(resp.get_data()))
+    assert z["time"].dtype == np.dtype("datetime64[ms]")
+    assert z["time"][0] == np.datetime64("2024-01-01T00:00:00.000")
+    assert z["time"][1] == np.datetime64("2024-01-01T00:01:00.000")
+    np.testing.assert_array_equal(z["instant_flow"], np.asarray(cols["instant_flow"]))
+    assert json.loads(str(z["meta"])) == {"meter_id": MID, "total_points": 5, "from": str(T0)}
+
+
+def test_arrow_without_pyarrow_is_406(app, monkeypatch):
+    monkeypatch.setattr(columnar, "pa", None)
+    with app.test_request_context(headers={"Accept": columnar.ARROW}):
+        with pytest.raises(NotAcceptable) as e:
+            columnar.negotiate()
+        assert e.value.code == 406
+    with app.test_request_context(headers={"Accept": "*/*"}):
+        assert columnar.negotiate() == columnar.JSON
+
+
+def test_json_max_points_raw_matches_previous_shape(app, monkeypatch):
+    cols = _raw_cols()
+    monkeypatch.setattr(service, "get_meter", lambda mid: {"_id": mid})
+    monkeypatch.setattr(service, "list_series_columns", lambda mid, s, e: cols)
+    data = service.get_daily_flow(MID, "2024-01-01", "50")
+    assert data["total_points"] == 200 and set(data) == {"items", "total_points"}
+    _approx_rows(data["items"], _old_downsample_columns(cols, 50))
+
+
+def test_json_max_points_rollup_matches_previous_shape(app, monkeypatch):
+    rows = _rollup_rows()
+    monkeypatch.setattr(service, "get_meter", lambda mid: {"_id": mid})
+    monkeypatch.setattr(service, "rollup_columns", lambda mid, s, e, res: _rows_to_rollup_cols(rows))
+    data = service.get_flow_series(MID, "2024-01-01", "2024-01-10", "1h", "40")
+    assert data["resolution"] == "1h" and data["total_points"] == 120
+    _approx_rows(data["items"], _old_downsample_rollup_rows(rows, 40))
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from app.api.meter import daily_status, service
+from app.errors import BadRequest
+from app.utils.time_utils import day_bounds_utc
+
+
+class Calls(list):
+    db = None
+
+
+@pytest.fixture
+def ensured(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    calls = Calls()
+    monkeypatch.setattr(daily_status, "get_db", lambda: db)
+    monkeypatch.setattr(daily_status, "_ensured_days", set())
+    monkeypatch.setattr(daily_status, "ensure_day", lambda date, db=None, force=False: calls.append(date))
+    monkeypatch.setattr(service, "_get_user_scope", lambda: (None, None, None, "admin"))
+    app = Flask(__name__)
+    app.config["DAILY_STATUS_WINDOW_DAYS"] = 3
+    with app.app_context():
+        calls.db = db
+        yield calls
+
+
+def _day(offset: int) -> str:
+    today = datetime.strptime(day_bounds_utc(None)[0], "%Y-%m-%d")
+    return (today + timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+def test_window_days_are_materialized(ensured):
+    for d in (0, -2):
+        service.get_meters_list(_day(d), 1, 10)
+    assert ensured == [_day(0), _day(-2)]
+
+
+def test_outside_window_is_rejected_without_writes(ensured):
+    for d in (1, -3, -400):
+        with pytest.raises(BadRequest):
+            service.get_meters_list(_day(d), 1, 10)
+    assert ensured == []
+    assert ensured.db[daily_status.COL].count_documents({}) == 0
+
+
+def test_backfilled_old_day_is_read_only(ensured):
+    date = _day(-10)
+    ensured.db[daily_status.META_COL].insert_one({"_id": f"daily_status:{date}"})
+    ensured.db[daily_status.COL].insert_one({"meter_id": 1, "date": date, "meter_name": "a", "status": "normal"})
+    _, items, has_next, _ = service.get_meters_list(date, 1, 10)
+    assert [i["status"] for i in items] == ["normal"] and not has_next
+    assert ensured == []
+
+
+def test_address_follows_branch_updates(ensured):
+    date, bid = _day(-10), ObjectId()
+    ensured.db.branches.insert_one({"_id": bid, "address": "old"})
+    ensured.db[daily_status.META_COL].insert_one({"_id": f"daily_status:{date}"})
+    ensured.db[daily_status.COL].insert_one({"meter_id": 1, "date": date, "meter_name": "a", "branch_id": bid,
+                                             "address": "stale copy", "status": "normal"})
+    ensured.db.branches.update_one({"_id": bid}, {"$set": {"address": "new"}})
+    _, items, _, _ = service.get_meters_list(date, 1, 10)
+    assert [i["address"] for i in items] == ["new"]
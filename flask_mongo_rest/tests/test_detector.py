@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import numpy as np
+import pytest
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from app.api.predictions import detector, repo as pred_repo
+from app.api.predictions.detector import DEFAULT_PARAMS, evaluate, window_bounds
+
+NAN = float("nan")
+
+
+def _eval(flows, pressures=None, thresholds=None, **params):
+    """flows / pressures: list các list (1 list / meter)."""
+    pressures = pressures or [[3.0] * len(f) for f in flows]
+    starts = np.cumsum([0] + [len(f) for f in flows[:-1]])
+    return evaluate(np.array([v for f in flows for v in f], dtype=float),
+                    np.array([v for p in pressures for v in p], dtype=float),
+                    starts, np.array(thresholds or [NAN] * len(flows), dtype=float),
+                    {**DEFAULT_PARAMS, **params})
+
+
+def test_leak_by_threshold_fraction():
+    res = _eval([[5, 6, 7, 8, 9], [5, 6, 1, 1, 9]], thresholds=[4.0, 4.0])
+    assert res["label"].tolist() == ["leak", "normal"]
+    assert res["confidence"][0] == 1.0 and res["threshold"].tolist() == [4.0, 4.0]
+
+
+def test_high_flow_and_low_pressure():
+    res = _eval([[2, 2.1, 1.9, 2, 9], [2, 2.1, 1.9, 2, 2]],
+                [[3] * 5, [3, 3.1, 2.9, 3, 1]])
+    assert res["label"].tolist() == ["anomaly_high_flow", "anomaly_low_pressure"]
+
+
+def test_flat_series_is_normal_even_with_tiny_changes():
+    # MAD = 0: dao động nhỏ không được thành bất thường (trước đây chia cho 1e-9)
+    res = _eval([[2, 2, 2, 2.01, 2, 2], [0, 0, 0, 0], [5, 5, 5, 5]],
+                [[3] * 6, [3] * 4, [3, 3, 2.99, 3]])
+    assert res["label"].tolist() == ["normal", "normal", "normal"]
+    # còn nhảy lớn thì vẫn bắt được
+    assert _eval([[2, 2, 2, 2, 2, 6]])["label"].tolist() == ["anomaly_high_flow"]
+
+
+def test_missing_pressure_is_ignored():
+    res = _eval([[2, 2, 2], [2, 2, 2]], [[3, NAN, 3], [NAN, NAN, NAN]])
+    assert res["label"].tolist() == ["normal", "normal"]
+
+
+def test_segments_do_not_leak_into_each_other():
+    # meter giữa có 1 điểm, meter cuối rất lớn: median / max từng đoạn độc lập
+    res = _eval([[1, 1, 1, 1], [7], [100, 101, 99, 100]])
+    assert res["points"].tolist() == [4, 1, 4]
+    assert res["last_flow"].tolist() == [1, 7, 100]
+    assert res["label"].tolist() == ["normal", "normal", "normal"]
+    assert res["threshold"][2] > 100 > res["threshold"][0]
+
+
+def test_window_bounds_align_to_window():
+    w = timedelta(hours=1)
+    start, end = window_bounds(datetime(2024, 1, 1, 10, 37, 5, tzinfo=timezone.utc), w)
+    assert (start, end) == (datetime(2024, 1, 1, 9, tzinfo=timezone.utc), datetime(2024, 1, 1, 10, tzinfo=timezone.utc))
+    # naive = UTC; chạy lại trong cùng giờ -> cùng cửa sổ
+    assert window_bounds(datetime(2024, 1, 1, 10, 59), w) == (start, end)
+    assert window_bounds(datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc), timedelta(minutes=15))[1] == end
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient(tz_aware=True).db
+    db[pred_repo.COL].create_index([("meter_id", ASCENDING), ("model_id", ASCENDING), ("window_end", ASCENDING)],
+                                   unique=True)
+    return db
+
+
+def test_insert_predictions_skips_duplicates(db):
+    model, end = ObjectId(), datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mids = [ObjectId() for _ in range(3)]
+    doc = lambda m: {"meter_id": m, "model_id": model, "window_end": end, "predicted_label": "normal"}
+    assert pred_repo.insert_predictions([doc(mids[0])], db) == (1, [])
+    inserted, dup = pred_repo.insert_predictions([doc(m) for m in mids], db)
+    assert (inserted, dup) == (2, [0])
+    assert db[pred_repo.COL].count_documents({}) == 3
+
+
+def test_detect_chunk_rerun_is_idempotent(db, monkeypatch):
+    written = []
+    monkeypatch.setattr(detector, "after_predictions_written", lambda docs, _db: written.extend(docs))
+    monkeypatch.setattr(detector, "latest_thresholds", lambda ids, at, _db: {})
+    m = ObjectId()
+    start, end = window_bounds(datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc), timedelta(hours=1))
+    db.meter_measurements.insert_many([
+        {"meter_id": m, "measurement_time": start + timedelta(minutes=k), "instant_flow": 2.0,
+         **({} if k == 2 else {"instant_pressure": 3.0})} for k in range(5)])
+    model = ObjectId()
+
+    r1 = detector.detect_chunk(db, "meter_measurements", [m], start, end, model, DEFAULT_PARAMS)
+    r2 = detector.detect_chunk(db, "meter_measurements", [m], start, end, model, DEFAULT_PARAMS)
+    assert (r1["inserted"], r2["inserted"], r2["duplicates"]) == (1, 0, 1)
+    assert [d["predicted_label"] for d in written] == ["normal"]
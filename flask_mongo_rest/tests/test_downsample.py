@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.utils.downsample import bucket_edges, envelope, lttb_indices
+
+
+def reference_lttb(x, y, n_out):
+    """LTTB gốc (Steinarsson 2013), viết thẳng bằng Python để đối chiếu."""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    out, a = [0], 0
+    for i in range(n_out - 2):
+        nxt_lo = math.floor((i + 1) * every) + 1
+        nxt_hi = min(math.floor((i + 2) * every) + 1, n)
+        avg_x = sum(x[nxt_lo:nxt_hi]) / (nxt_hi - nxt_lo)
+        avg_y = sum(y[nxt_lo:nxt_hi]) / (nxt_hi - nxt_lo)
+        lo, hi = math.floor(i * every) + 1, math.floor((i + 1) * every) + 1
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+@pytest.mark.parametrize("n,n_out", [(10, 5), (11, 4), (100, 7), (1000, 50), (997, 13), (5000, 3)])
+def test_matches_reference(n, n_out):
+    rng = np.random.default_rng(n * 31 + n_out)
+    x = np.cumsum(rng.uniform(0.5, 2.0, n))
+    y = rng.normal(size=n)
+    idx, _ = lttb_indices(x, y, n_out)
+    assert idx.tolist() == reference_lttb(x.tolist(), y.tolist(), n_out)
+
+
+def test_last_bucket_average_excludes_final_point():
+    # n=10, n_out=5: bucket cuối là [7, 9). Nếu lẫn điểm 9 (y rất lớn) thì bucket kế cuối chọn sai.
+    x = np.arange(10, dtype=float)
+    y = np.array([0, 0, 0, 0, 5, 0, 0, 0, 0, 1000], dtype=float)
+    idx, _ = lttb_indices(x, y, 5)
+    assert idx.tolist() == reference_lttb(x.tolist(), y.tolist(), 5)
+
+
+def test_bucket_edges_cover_middle_exactly():
+    for n, n_out in [(10, 5), (1001, 37), (12345, 500)]:
+        e = bucket_edges(n, n_out)
+        assert e[0] == 1 and e[-1] == n - 1 and np.all(np.diff(e) > 0)
+
+
+def test_no_downsample_when_small():
+    idx, edges = lttb_indices(np.arange(4.0), np.arange(4.0), 10)
+    assert idx.tolist() == [0, 1, 2, 3] and len(edges) == 5
+
+
+def test_envelope_keeps_spikes():
+    x = np.arange(100, dtype=float)
+    y = np.zeros(100)
+    y[41] = 50.0
+    idx, edges = lttb_indices(x, y, 6)
+    lo, hi = envelope(y, edges)
+    assert len(lo) == len(hi) == len(idx)
+    assert hi.max() == 50.0 and lo.min() == 0.0
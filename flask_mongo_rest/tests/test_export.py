@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from app.api.meter import repo as meter_repo
+from app.api.measurements import export
+from app.api.measurements import repo as meas_repo
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    monkeypatch.setattr(meter_repo, "get_db", lambda: db)
+    monkeypatch.setattr(meas_repo, "get_db", lambda: db)
+    monkeypatch.setattr(meas_repo, "measurements_collection", lambda: "meter_measurements")
+    return db
+
+
+def test_branch_meter_chunks_are_not_truncated(db):
+    branch, other = ObjectId(), ObjectId()
+    db.meters.insert_many([{"meter_name": f"m{i}", "branch_id": branch} for i in range(23)])
+    db.meters.insert_many([{"meter_name": "x", "branch_id": other} for _ in range(5)])
+    chunks = list(meter_repo.iter_meter_ref_chunks([branch], chunk_size=5))
+    assert [len(c) for c in chunks] == [5, 5, 5, 5, 3]
+    ids = [m["_id"] for c in chunks for m in c]
+    assert len(set(ids)) == 23 and ids == sorted(ids)
+
+
+def test_chunk_rows_cover_every_meter_in_order(db):
+    branch = ObjectId()
+    db.meters.insert_many([{"meter_name": f"m{i}", "branch_id": branch} for i in range(7)])
+    t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for m in db.meters.find():
+        db.meter_measurements.insert_many([
+            {"meter_id": m["_id"], "measurement_time": t0 + timedelta(minutes=k), "instant_flow": k,
+             "instant_pressure": 1.0} for k in range(3)])
+
+    rows = list(export._chunk_rows(meter_repo.iter_meter_ref_chunks([branch], chunk_size=2),
+                                   t0, t0 + timedelta(hours=1), batch_size=4))
+    assert len(rows) == 21
+    keys = [(r[1], r[0]) for r in rows]
+    assert keys == sorted(keys)
+    csv = b"".join(export._encode(iter(rows), "csv", 64)).decode()
+    assert csv.splitlines()[0] == ",".join(export.COLUMNS) and len(csv.splitlines()) == 22
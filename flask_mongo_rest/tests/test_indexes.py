@@ -0,0 +1,45 @@
+from app.indexes import _ensure_one
+
+
+class FakeCollection:
+    def __init__(self):
+        self.calls = []
+
+    def drop_index(self, name):
+        self.calls.append(("drop", name))
+
+    def create_index(self, keys, name, **opts):
+        self.calls.append(("create", name, opts))
+
+
+def _spec(**opts):
+    return {"collection": "c", "keys": [("a", 1)], "name": "idx_a", "opts": opts}
+
+
+def test_same_keys_and_options_kept():
+    coll = FakeCollection()
+    existing = {"idx_a": {"key": [("a", 1)], "v": 2, "unique": True}}
+    assert _ensure_one(coll, _spec(unique=True), existing) == "kept"
+    assert coll.calls == []
+
+
+def test_option_change_rebuilds():
+    coll = FakeCollection()
+    existing = {"idx_a": {"key": [("a", 1)], "v": 2}}
+    assert _ensure_one(coll, _spec(unique=True), existing) == "rebuilt"
+    assert coll.calls == [("drop", "idx_a"), ("create", "idx_a", {"unique": True})]
+
+
+def test_partial_filter_and_ttl_compared():
+    existing = {"idx_a": {"key": [("a", 1)], "v": 2, "expireAfterSeconds": 0,
+                          "partialFilterExpression": {"a": {"$exists": True}}}}
+    assert _ensure_one(FakeCollection(), _spec(expireAfterSeconds=0, partialFilterExpression={"a": {"$exists": True}}),
+                       existing) == "kept"
+    assert _ensure_one(FakeCollection(), _spec(expireAfterSeconds=60, partialFilterExpression={"a": {"$exists": True}}),
+                       existing) == "rebuilt"
+    assert _ensure_one(FakeCollection(), _spec(expireAfterSeconds=0), existing) == "rebuilt"
+
+
+def test_missing_index_created():
+    coll = FakeCollection()
+    assert _ensure_one(coll, _spec(), {}) == "created"
@@ -0,0 +1,51 @@
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+from werkzeug.exceptions import Forbidden
+
+from app.api.meter import repo as meter_repo
+from app.api.measurements import service
+
+
+@pytest.fixture
+def branch(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    monkeypatch.setattr(meter_repo, "get_db", lambda: db)
+    monkeypatch.setattr(service, "get_states", lambda ids, fields: {})
+    monkeypatch.setattr(service, "find_latest_for_meters", lambda ids: {})
+    monkeypatch.setattr(service, "scope_branch_ids", lambda: None)
+    b = ObjectId()
+    db.meters.insert_many([{"meter_name": f"m{i}", "branch_id": b} for i in range(7)])
+    app = Flask(__name__)
+    app.config["LATEST_MAX_METERS"] = 3
+    with app.app_context():
+        yield b, sorted(m["_id"] for m in db.meters.find())
+
+
+def test_large_scope_is_paged_and_reports_truncation(branch):
+    b, ids = branch
+    seen, cursor, pages = [], None, 0
+    while True:
+        body = {"branch_id": str(b), **({"cursor": cursor} if cursor else {})}
+        data = service.get_latest_flows(body)
+        pages += 1
+        seen += [i["meter_id"] for i in data["items"]]
+        if not data["truncated"]:
+            assert data["next_cursor"] is None
+            break
+        cursor = data["next_cursor"]
+    assert pages == 3 and seen == [str(i) for i in ids]
+
+
+def test_meter_ids_within_limit_are_not_truncated(branch):
+    _, ids = branch
+    data = service.get_latest_flows({"meter_ids": [str(ids[0]), str(ObjectId())]})
+    assert not data["truncated"] and len(data["items"]) == 1 and len(data["missing"]) == 1
+
+
+def test_scope_outside_caller_is_forbidden(branch, monkeypatch):
+    b, _ = branch
+    monkeypatch.setattr(service, "scope_branch_ids", lambda: [ObjectId()])
+    with pytest.raises(Forbidden):
+        service.get_latest_flows({"branch_id": str(b)})
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+from werkzeug.exceptions import BadRequest as HTTPBadRequest, Forbidden
+
+from app.api.common import repo as common_repo, service
+
+
+def _fake_rows(db, calls):
+    """Cùng kết quả với leak_breakdown_rows (mongomock chưa có $unionWith) để test phần service."""
+    def rows(start_utc, end_utc, branch_ids=None):
+        calls.append(None if branch_ids is None else set(branch_ids))
+        in_scope = lambda b: branch_ids is None or b in branch_ids
+        totals = {}
+        for m in db.meters.find():
+            if in_scope(m.get("branch_id")):
+                totals[m.get("branch_id")] = totals.get(m.get("branch_id"), 0) + 1
+        seen = {(p.get("branch_id"), p["meter_id"], p["predicted_label"]) for p in db.predictions.find()
+                if start_utc <= p["prediction_time"] < end_utc and in_scope(p.get("branch_id"))}
+        labels = {}
+        for b, _, label in seen:
+            labels[(b, label)] = labels.get((b, label), 0) + 1
+        return {"meters": [{"_id": b, "total": t} for b, t in totals.items()],
+                "labels": [{"_id": {"branch_id": b, "label": l}, "meters": n} for (b, l), n in labels.items()]}
+    return rows
+
+
+@pytest.fixture
+def fleet(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    monkeypatch.setattr(common_repo, "get_db", lambda: db)
+    monkeypatch.setattr(service, "get_db", lambda: db)
+    calls = []
+    monkeypatch.setattr(service, "leak_breakdown_rows", _fake_rows(db, calls))
+
+    c1, c2 = ObjectId(), ObjectId()
+    db.companies.insert_many([{"_id": c1, "name": "A"}, {"_id": c2, "name": "B"}])
+    b11, b12, b21 = ObjectId(), ObjectId(), ObjectId()
+    db.branches.insert_many([{"_id": b11, "company_id": c1, "name": "a1"}, {"_id": b12, "company_id": c1, "name": "a2"},
+                             {"_id": b21, "company_id": c2, "name": "b1"}])
+    meters = {b: [ObjectId() for _ in range(n)] for b, n in ((b11, 4), (b12, 3), (b21, 5))}
+    db.meters.insert_many([{"_id": m, "branch_id": b} for b, ms in meters.items() for m in ms])
+
+    t = datetime(2024, 1, 1, 3, tzinfo=timezone.utc)  # 10h giờ VN ngày 2024-01-01
+    preds = [(b11, 0, "leak"), (b11, 0, "leak"), (b11, 1, "leak"), (b11, 2, "normal"),
+             (b12, 0, "anomaly_high_flow"), (b21, 0, "leak"), (b21, 1, "normal")]
+    db.predictions.insert_many([{"meter_id": meters[b][i], "branch_id": b, "predicted_label": label,
+                                 "prediction_time": t + timedelta(minutes=k)}
+                                for k, (b, i, label) in enumerate(preds)])
+    # ngoài khoảng (hôm sau): không được đếm
+    db.predictions.insert_one({"meter_id": meters[b21][2], "branch_id": b21, "predicted_label": "leak",
+                               "prediction_time": t + timedelta(days=1)})
+
+    app = Flask(__name__)
+    app.config["BREAKDOWN_MAX_DAYS"] = 7
+    with app.app_context():
+        yield {"c1": c1, "c2": c2, "b11": b11, "b12": b12, "b21": b21, "calls": calls}
+
+
+def _as(monkeypatch, role, company=None, branch=None):
+    monkeypatch.setattr(service, "_claims", lambda: (role, company and str(company), branch and str(branch)))
+
+
+def test_admin_tree_totals_add_up(fleet, monkeypatch):
+    _as(monkeypatch, "admin")
+    out = service.get_leak_breakdown("2024-01-01", None, None)
+    assert fleet["calls"] == [None]
+    assert (out["from"], out["to"]) == ("2024-01-01", "2024-01-01")
+    assert out["total_meters"] == 12 and out["leak_meters"] == 3 and out["normal_meters"] == 9
+    assert out["labels"] == {"leak": 3, "normal": 2, "anomaly_high_flow": 1}
+
+    a, b = out["companies"]
+    assert (a["name"], a["total_meters"], a["leak_meters"]) == ("A", 7, 2)
+    assert [(br["name"], br["total_meters"], br["labels"]) for br in a["branches"]] == [
+        ("a1", 4, {"leak": 2, "normal": 1}), ("a2", 3, {"anomaly_high_flow": 1})]
+    assert (b["name"], b["total_meters"], b["labels"]) == ("B", 5, {"leak": 1, "normal": 1})
+    for comp in out["companies"]:
+        assert comp["total_meters"] == sum(br["total_meters"] for br in comp["branches"])
+        assert comp["normal_meters"] == comp["total_meters"] - comp["leak_meters"]
+    assert out["total_meters"] == sum(c["total_meters"] for c in out["companies"])
+
+
+def test_admin_can_filter_by_company(fleet, monkeypatch):
+    _as(monkeypatch, "admin")
+    out = service.get_leak_breakdown("2024-01-01", None, None, str(fleet["c2"]))
+    assert fleet["calls"] == [{fleet["b21"]}]
+    assert [c["name"] for c in out["companies"]] == ["B"]
+
+
+def test_company_manager_sees_only_own_company(fleet, monkeypatch):
+    _as(monkeypatch, "company_manager", company=fleet["c1"])
+    out = service.get_leak_breakdown("2024-01-01", None, None)
+    assert fleet["calls"] == [{fleet["b11"], fleet["b12"]}]
+    assert [c["name"] for c in out["companies"]] == ["A"] and out["total_meters"] == 7
+    with pytest.raises(Forbidden):
+        service.get_leak_breakdown("2024-01-01", None, None, str(fleet["c2"]))
+
+
+def test_branch_manager_sees_only_own_branch(fleet, monkeypatch):
+    _as(monkeypatch, "branch_manager", company=fleet["c1"], branch=fleet["b12"])
+    out = service.get_leak_breakdown("2024-01-01", None, None)
+    assert fleet["calls"] == [{fleet["b12"]}]
+    assert [br["name"] for br in out["companies"][0]["branches"]] == ["a2"]
+    assert out["total_meters"] == 3 and out["leak_meters"] == 0
+
+
+def test_other_roles_are_forbidden(fleet, monkeypatch):
+    _as(monkeypatch, "viewer")
+    with pytest.raises(Forbidden):
+        service.get_leak_breakdown("2024-01-01", None, None)
+
+
+def test_range_limits(fleet, monkeypatch):
+    _as(monkeypatch, "admin")
+    out = service.get_leak_breakdown(None, "2024-01-01", "2024-01-02")
+    assert (out["from"], out["to"]) == ("2024-01-01", "2024-01-02")
+    assert out["labels"]["leak"] == 4  # gồm prediction ngày 2
+    assert service.get_leak_breakdown(None, "2024-01-01", "2024-01-07")["to"] == "2024-01-07"
+    for args in ((None, "2024-01-01", "2024-01-08"), (None, "2024-01-03", "2024-01-01"), ("01/01/2024", None, None)):
+        with pytest.raises(HTTPBadRequest):
+            service.get_leak_breakdown(*args)
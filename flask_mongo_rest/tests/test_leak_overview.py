@@ -0,0 +1,85 @@
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+from werkzeug.exceptions import Forbidden
+
+from app.api.meter import overview_cache, service
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    monkeypatch.setattr(overview_cache, "get_db", lambda: db)
+    monkeypatch.setattr(service, "get_db", lambda: db)
+    app = Flask(__name__)
+    with app.app_context():
+        yield db
+
+
+@pytest.fixture
+def fleet(db, monkeypatch):
+    c1, c2 = ObjectId(), ObjectId()
+    b1, b2, b3 = ObjectId(), ObjectId(), ObjectId()
+    db.branches.insert_many([{"_id": b1, "company_id": c1}, {"_id": b2, "company_id": c1},
+                             {"_id": b3, "company_id": c2}])
+    built = []
+    monkeypatch.setattr(service, "build_leak_overview",
+                        lambda s, e, branch_id=None, company_id=None: built.append((branch_id, company_id)) or {})
+    return c1, b1, b2, b3, built
+
+
+def _as(monkeypatch, company=None, branch=None):
+    monkeypatch.setattr(service, "_get_user_scope",
+                        lambda: (str(company) if company else None, str(branch) if branch else None, None, None))
+
+
+def test_branch_claim_cannot_read_sibling_branch(fleet, monkeypatch):
+    c1, b1, b2, _, built = fleet
+    _as(monkeypatch, c1, b1)
+    with pytest.raises(Forbidden):
+        service.get_leak_overview("2024-01-01", str(b2))
+    service.get_leak_overview("2024-01-01", None)
+    assert built == [(b1, None)]
+
+
+def test_company_claim_is_limited_to_its_branches(fleet, db, monkeypatch):
+    c1, b1, _, b3, built = fleet
+    _as(monkeypatch, c1)
+    with pytest.raises(Forbidden):
+        service.get_leak_overview("2024-01-01", str(b3))
+    service.get_leak_overview("2024-01-01", str(b1))
+    service.get_leak_overview("2024-01-01", None)
+    assert built == [(b1, None), (None, c1)]
+    assert sorted(d["scope"] for d in db[overview_cache.COL].find()) == [f"branch:{b1}", f"company:{c1}"]
+
+
+def test_admin_sees_everything(fleet, monkeypatch):
+    _, _, _, b3, built = fleet
+    _as(monkeypatch)
+    service.get_leak_overview("2024-01-01", str(b3))
+    service.get_leak_overview("2024-01-01", None)
+    assert built == [(b3, None), (None, None)]
+
+
+def test_invalidation_during_compute_is_not_cached(db):
+    def compute():
+        overview_cache.invalidate_dates(["2024-01-01"])  # prediction muộn ghi giữa chừng
+        return {"leak_meters": 1}
+
+    assert overview_cache.get_or_compute("2024-01-01", "all", compute) == {"leak_meters": 1}
+    assert db[overview_cache.COL].count_documents({}) == 0
+
+    calls = []
+    value = overview_cache.get_or_compute("2024-01-01", "all", lambda: calls.append(1) or {"leak_meters": 2})
+    assert value == overview_cache.get_or_compute("2024-01-01", "all", lambda: calls.append(1) or {})
+    assert value == {"leak_meters": 2} and calls == [1]
+
+
+def test_invalidate_all_during_compute_is_not_cached(db):
+    def compute():
+        overview_cache.invalidate_all()  # meter mới / chuyển chi nhánh
+        return {"total_meters": 1}
+
+    overview_cache.get_or_compute("2024-01-01", "all", compute)
+    assert db[overview_cache.COL].count_documents({}) == 0
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from app.api.measurements import service
+
+MID = ObjectId()
+
+
+def _row(t):
+    return {"meter_id": str(MID), "measurement_time": t, "instant_flow": 1.5, "instant_pressure": 3}
+
+
+def test_bad_timestamps_are_row_errors(monkeypatch):
+    monkeypatch.setattr(service, "existing_meter_ids", lambda ids: set(ids))
+    rows = [_row(1e20), _row(-5), _row("2300-01-01T00:00:00Z"), _row(float("inf")),
+            _row(1704067200), _row(1704067200000), _row("2024-01-01T07:00:00+07:00")]
+    errors = []
+    docs, pos = service.validate_rows(rows, errors)
+    assert sorted(e["index"] for e in errors) == [0, 1, 2, 3]
+    assert pos == [4, 5, 6]
+    t = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert [d["measurement_time"] for d in docs] == [t, t, t]
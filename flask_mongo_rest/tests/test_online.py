@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from app.api.predictions import online
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient(tz_aware=True).db
+    written = []
+    monkeypatch.setattr(online, "after_predictions_written", lambda docs, _db: written.extend(docs))
+    db.written = written
+    return db
+
+
+@pytest.fixture(autouse=True)
+def app_ctx():
+    app = Flask(__name__)
+    app.config.update(ONLINE_ALPHA=0.2, ONLINE_Z=3.0, ONLINE_WARMUP=5, ONLINE_CAS_RETRIES=5)
+    with app.app_context():
+        yield
+
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _rows(mid, start, n, flow=10.0, pressure=3.0):
+    return [{"meter_id": mid, "measurement_time": T0 + timedelta(minutes=start + k),
+             "instant_flow": flow + (k % 2) * 0.1, "instant_pressure": pressure} for k in range(n)]
+
+
+def test_workers_share_state(db):
+    mid = ObjectId()
+    a, b = online.OnlineScorer(), online.OnlineScorer()  # 2 worker
+    a.observe_many(_rows(mid, 0, 4), db)
+    b.observe_many(_rows(mid, 4, 4), db)
+    a.observe_many(_rows(mid, 0, 8), db)  # lặp lại bản ghi cũ: bỏ qua
+    st = db[online.STATE_COL].find_one({"_id": mid})
+    assert st["n"] == 8 and st["v"] == 2
+    assert st["last_time"] == T0 + timedelta(minutes=7)
+
+    # sau warmup (do cả 2 worker góp) worker b thấy ngay cú tăng flow
+    assert b.observe_many([{"meter_id": mid, "measurement_time": T0 + timedelta(minutes=8),
+                            "instant_flow": 50.0, "instant_pressure": 3.0}], db) == 1
+    assert [p["predicted_label"] for p in db.written] == ["anomaly_high_flow"]
+
+
+def test_lost_cas_recomputes_without_duplicate_transitions(db):
+    mid = ObjectId()
+    a, b = online.OnlineScorer(), online.OnlineScorer()
+    a.observe_many(_rows(mid, 0, 6), db)
+
+    spike = [{"meter_id": mid, "measurement_time": T0 + timedelta(minutes=6),
+              "instant_flow": 50.0, "instant_pressure": 3.0}]
+    step = a._step
+    calls = []
+
+    def racing_step(s, readings, *args):
+        # worker b ghi chen giữa lúc a đọc và a ghi
+        if not calls:
+            b.observe_many(spike, db)
+        calls.append(1)
+        return step(s, readings, *args)
+
+    a._step = racing_step
+    a.observe_many(spike, db)
+    assert len(calls) == 2  # lần 1 thua CAS, lần 2 đọc state mới: spike đã chấm rồi
+    st = db[online.STATE_COL].find_one({"_id": mid})
+    assert st["n"] == 7 and st["label"] == "anomaly_high_flow"
+    assert len(db.written) == 1
+
+
+def test_concurrent_insert_of_new_meter_is_retried(db):
+    mid = ObjectId()
+    a, b = online.OnlineScorer(), online.OnlineScorer()
+    step = a._step
+    calls = []
+
+    def racing_step(s, readings, *args):
+        if not calls:
+            b.observe_many(_rows(mid, 0, 3), db)
+        calls.append(1)
+        return step(s, readings, *args)
+
+    a._step = racing_step
+    a.observe_many(_rows(mid, 3, 3), db)
+    st = db[online.STATE_COL].find_one({"_id": mid})
+    assert len(calls) == 2 and st["n"] == 6 and st["v"] == 2
@@ -0,0 +1,60 @@
+import mongomock
+import pytest
+from bson import ObjectId
+
+from app.errors import BadRequest
+from app.api.common.pagination import (
+    apply_keyset, build_links, decode_cursor, encode_cursor, keyset_filter, parse_sort,
+)
+
+ALLOWED = {"_id": True, "name": False}
+
+
+def test_parse_sort_adds_id_tiebreaker():
+    assert parse_sort(None, ALLOWED, default="name") == [("name", 1), ("_id", 1)]
+    assert parse_sort("-name", ALLOWED) == [("name", -1), ("_id", -1)]
+    assert parse_sort("-_id", ALLOWED) == [("_id", -1)]
+    with pytest.raises(BadRequest):
+        parse_sort("created_at", ALLOWED)
+
+
+def test_cursor_roundtrip_and_validation():
+    srt = parse_sort("name", ALLOWED)
+    doc = {"_id": ObjectId(), "name": "m-01", "other": 1}
+    token = encode_cursor(doc, srt)
+    assert decode_cursor(token, srt) == {"_id": doc["_id"], "name": "m-01"}
+    with pytest.raises(BadRequest):
+        decode_cursor(token, parse_sort("_id", ALLOWED))
+    with pytest.raises(BadRequest):
+        decode_cursor("not-a-cursor", srt)
+
+
+def test_keyset_filter_shape():
+    oid = ObjectId()
+    f = keyset_filter([("name", -1), ("_id", -1)], {"name": "b", "_id": oid})
+    assert f == {"$or": [{"name": {"$lt": "b"}}, {"name": "b", "_id": {"$lt": oid}}]}
+
+
+@pytest.mark.parametrize("sort", ["name", "-name", "_id", "-_id"])
+def test_keyset_pages_match_full_sort(sort):
+    col = mongomock.MongoClient().db.items
+    col.insert_many([{"name": f"n{i % 7}"} for i in range(53)])  # tên trùng -> cần _id tie-breaker
+    srt = parse_sort(sort, ALLOWED)
+    expected = [d["_id"] for d in col.find({}).sort(srt)]
+
+    seen, cursor = [], None
+    while True:
+        docs = list(col.find(apply_keyset({}, srt, cursor)).sort(srt).limit(10))
+        seen += [d["_id"] for d in docs]
+        if len(docs) < 10:
+            break
+        cursor = encode_cursor(docs[-1], srt)
+    assert seen == expected
+
+
+def test_build_links_uses_cursor_for_next():
+    links = build_links("/api/v1/meters", 1, 20, True, {"q": "x"}, cursor="abc", next_cursor="def")
+    assert 'cursor=def' in links and 'rel="next"' in links
+    assert 'rel="prev"' not in links
+    links = build_links("/api/v1/meters", 2, 20, True, {})
+    assert "page=3" in links and "page=1" in links
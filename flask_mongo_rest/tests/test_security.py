@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+from flask import Flask
+from werkzeug.exceptions import ServiceUnavailable
+
+from app.utils import security
+from app.api.auth.step_up import mint_step_up_token, verify_step_up_token
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET_KEY="test-secret", STEP_UP_TOKEN_TTL_SECONDS=60,
+                      BCRYPT_MAX_WORKERS=1, BCRYPT_TIMEOUT_SECONDS=5)
+    with app.app_context():
+        yield app
+
+
+def test_verify_password_roundtrip(app):
+    hashed = security.hash_password("s3cret")
+    assert security.verify_password("s3cret", hashed) is True
+    assert security.verify_password("wrong", hashed) is False
+
+
+def test_pool_timeout_is_503_not_wrong_password(app, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(security, "_checkpw", lambda plain, hashed: release.wait(1) or True)
+    monkeypatch.setattr(security, "_executor", None)
+    app.config["BCRYPT_TIMEOUT_SECONDS"] = 0.05
+    try:
+        with pytest.raises(ServiceUnavailable):
+            security.verify_password("s3cret", "hash")
+    finally:
+        release.set()
+
+
+def test_step_up_token_scopes(app):
+    token, ttl, scopes = mint_step_up_token("u1", ["meters"])
+    assert ttl == 60 and scopes == ["meters"]
+    assert verify_step_up_token(token, "u1", "meters")
+    assert not verify_step_up_token(token, "u1", "users")
+    assert not verify_step_up_token(token, "u2", "meters")
+
+
+def test_step_up_token_all_scopes_and_expiry(app):
+    token, _, scopes = mint_step_up_token("u1")
+    assert scopes == ["*"] and verify_step_up_token(token, "u1", "logs")
+    app.config["STEP_UP_TOKEN_TTL_SECONDS"] = -1
+    expired, _, _ = mint_step_up_token("u1")
+    assert not verify_step_up_token(expired, "u1", "logs")
+    assert not verify_step_up_token("garbage", "u1", "logs")
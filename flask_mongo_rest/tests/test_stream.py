@@ -0,0 +1,131 @@
+import queue
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from app.api.authz import require
+from app.api.stream import routes
+from app.api.stream.hub import KINDS, Hub, Subscriber, _Poller
+
+
+class FakeSub:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lagged = False
+        self.start_id = "e-0"
+
+
+class FakeHub:
+    def __init__(self):
+        self.subscribed = []
+
+    def subscribe(self, app, branch_ids, kinds, last_event_id):
+        self.subscribed.append((branch_ids, kinds, last_event_id))
+        return FakeSub(), None
+
+    def unsubscribe(self, sub):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET_KEY="test-secret-key-with-32-bytes!!!", STREAM_HEARTBEAT_SECONDS=0.01)
+    JWTManager(app)
+    app.register_blueprint(routes.bp, url_prefix="/stream")
+    fake = FakeHub()
+    monkeypatch.setattr(routes, "hub", fake)
+    monkeypatch.setattr(routes, "scope_branch_ids", lambda: None)
+    monkeypatch.setattr(routes, "_snapshot", lambda branch_ids, limit: {"meters": [], "truncated": False})
+    monkeypatch.setattr(require, "claims_are_fresh", lambda uid, claims: True)
+    with app.app_context():
+        token = create_access_token("u1", additional_claims={"role_name": "admin"})
+    client = app.test_client()
+    client.token, client.hub = token, fake
+    return client
+
+
+def _first_chunks(resp, n):
+    it = iter(resp.response)
+    try:
+        chunks = [next(it) for _ in range(n)]
+    finally:
+        resp.close()
+    return "".join(c.decode() if isinstance(c, bytes) else c for c in chunks)
+
+
+def test_query_string_token_is_enough(client):
+    resp = client.get(f"/stream/status?jwt={client.token}", buffered=False)
+    assert resp.status_code == 200 and resp.mimetype == "text/event-stream"
+    body = _first_chunks(resp, 2)
+    assert body.startswith("retry: ") and "event: snapshot" in body
+    assert client.hub.subscribed == [(None, ("status", "alert", "reading"), None)]
+
+
+def test_header_token_still_works(client):
+    resp = client.get("/stream/status?types=alert", headers={"Authorization": f"Bearer {client.token}"},
+                      buffered=False)
+    assert resp.status_code == 200
+    resp.close()
+    assert client.hub.subscribed[0][1] == ("alert",)
+
+
+def test_missing_token_is_rejected(client):
+    assert client.get("/stream/status").status_code == 401
+    assert client.hub.subscribed == []
+
+
+def test_hub_routes_events_by_scope_and_replays_from_buffer():
+    b1, b2 = ObjectId(), ObjectId()
+    h = Hub()
+    h.epoch, h._buffer = "ep", deque(maxlen=3)
+    mine, alerts_only = Subscriber([b1], KINDS, 10), Subscriber(None, ("alert",), 10)
+    h._subs = [mine, alerts_only]
+    for kind, branch in (("status", b1), ("status", b2), ("alert", b2), ("reading", b1)):
+        h._publish(kind, branch, None, {})
+
+    assert [(e.seq, e.kind) for e in list(mine.queue.queue)] == [(1, "status"), (4, "reading")]
+    assert [e.seq for e in list(alerts_only.queue.queue)] == [3]
+
+    assert [e.seq for e in h._replay(mine, "ep-2")] == [4]
+    assert h._replay(mine, "ep-4") == []
+    assert h._replay(mine, "ep-0") is None  # seq 1 đã trôi khỏi buffer (maxlen 3)
+    assert h._replay(mine, "other-3") is None  # process khác / đã khởi động lại
+
+
+def test_hub_drops_lagging_subscriber():
+    h = Hub()
+    h.epoch, h._buffer = "ep", deque(maxlen=10)
+    slow = Subscriber(None, KINDS, 1)
+    h._subs = [slow]
+    h._publish("alert", None, None, {})
+    h._publish("alert", None, None, {})
+    assert slow.lagged and h._subs == []
+
+
+def test_poller_picks_up_meter_moved_to_another_branch():
+    db = mongomock.MongoClient(tz_aware=True).db
+    b1, b2, mid = ObjectId(), ObjectId(), ObjectId()
+    db.branches.insert_many([{"_id": b1, "company_id": "c1"}, {"_id": b2, "company_id": "c2"}])
+    db.meters.insert_one({"_id": mid, "meter_name": "m", "branch_id": b1})
+    t0 = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def reading(k):
+        db.meter_state.update_one({"_id": mid}, {"$set": {
+            "last_reading": {"time": t0 + timedelta(minutes=k), "instant_flow": k},
+            "updated_at": t0 + timedelta(seconds=10 * k)}}, upsert=True)
+
+    p = _Poller(db, refs_ttl=0)
+    reading(0)
+    assert p.poll() == []  # lần đầu chỉ lấy mốc
+    reading(1)
+    assert [(k, b, c) for k, b, c, _ in p.poll()] == [("reading", b1, "c1")]
+
+    db.meters.update_one({"_id": mid}, {"$set": {"branch_id": b2}})
+    reading(2)
+    assert [(k, b, c) for k, b, c, _ in p.poll()] == [("reading", b2, "c2")]